@@ -1,5 +1,179 @@
 #include "sendAndReceive.h"
 
+// 关闭Nagle算法：请求帧一次写出，不等待延迟确认
+static void enableLowDelay(QTcpSocket &socket)
+{
+    socket.setSocketOption(QAbstractSocket::LowDelayOption, 1);
+}
+
+// 按协议写出一个请求帧：文件名长度、文件名、JSON长度、JSON内容（长度均为4字节网络字节序）
+static bool writeJsonFrame(QTcpSocket &socket, const QByteArray &jsonData, const QString &fileName)
+{
+    QByteArray fileNameData = fileName.toUtf8();
+
+    QByteArray frame;
+    QDataStream stream(&frame, QIODevice::WriteOnly);
+    stream.setByteOrder(QDataStream::BigEndian);
+    stream << static_cast<quint32>(fileNameData.size());
+    frame.append(fileNameData);
+
+    QByteArray sizeBytes;
+    QDataStream sizeStream(&sizeBytes, QIODevice::WriteOnly);
+    sizeStream.setByteOrder(QDataStream::BigEndian);
+    sizeStream << static_cast<quint32>(jsonData.size());
+    frame.append(sizeBytes);
+    frame.append(jsonData);
+
+    if (socket.write(frame) != frame.size())
+    {
+        return false;
+    }
+    return socket.waitForBytesWritten(3000);
+}
+
+// 读取恰好 size 个字节，超时或连接断开返回 false
+static bool readExactly(QTcpSocket &socket, QByteArray &buffer, qint64 size, int timeoutMs)
+{
+    buffer.clear();
+    while (buffer.size() < size)
+    {
+        if (socket.bytesAvailable() == 0 && !socket.waitForReadyRead(timeoutMs))
+        {
+            return false;
+        }
+        buffer.append(socket.read(size - buffer.size()));
+    }
+    return true;
+}
+
+// 读取一个响应帧：4字节长度 + JSON内容
+static bool readJsonResponse(QTcpSocket &socket, int timeoutMs, QJsonObject &response)
+{
+    QByteArray lengthBytes;
+    if (!readExactly(socket, lengthBytes, 4, timeoutMs))
+    {
+        return false;
+    }
+
+    QDataStream lengthStream(lengthBytes);
+    lengthStream.setByteOrder(QDataStream::BigEndian);
+    quint32 responseLength = 0;
+    lengthStream >> responseLength;
+
+    QByteArray body;
+    if (!readExactly(socket, body, responseLength, timeoutMs))
+    {
+        return false;
+    }
+
+    response = QJsonDocument::fromJson(body).object();
+    return true;
+}
+
+QJsonObject sendJsonDataAndReceive(const QString &serverAddress, quint16 port, const QByteArray &jsonData, const QString &fileName)
+{
+    QTcpSocket socket;
+    socket.connectToHost(serverAddress, port);
+    if (!socket.waitForConnected(5000))
+    {
+        qDebug() << "连接失败:" << socket.errorString();
+        return QJsonObject();
+    }
+    enableLowDelay(socket);
+
+    QJsonObject response;
+    if (!writeJsonFrame(socket, jsonData, fileName) || !readJsonResponse(socket, 5000, response))
+    {
+        qDebug() << "请求失败:" << socket.errorString();
+    }
+
+    socket.disconnectFromHost();
+    return response;
+}
+
+PersistentJsonClient::PersistentJsonClient(const QString &serverAddress, quint16 port, int timeoutMs)
+    : m_serverAddress(serverAddress), m_port(port), m_timeoutMs(timeoutMs)
+{
+}
+
+PersistentJsonClient::~PersistentJsonClient()
+{
+    close();
+}
+
+bool PersistentJsonClient::ensureConnected()
+{
+    if (m_socket.state() == QAbstractSocket::ConnectedState)
+    {
+        return true;
+    }
+
+    m_socket.abort();
+    m_socket.connectToHost(m_serverAddress, m_port);
+    if (!m_socket.waitForConnected(m_timeoutMs))
+    {
+        qDebug() << "连接失败:" << m_socket.errorString();
+        return false;
+    }
+    enableLowDelay(m_socket);
+    return true;
+}
+
+QJsonObject PersistentJsonClient::sendAndReceive(const QByteArray &jsonData, const QString &fileName)
+{
+    for (int attempt = 0; attempt < 2; ++attempt)
+    {
+        // 空闲连接上不应有数据可读：可读或已断开说明服务器已经关闭了连接（空闲超时或达到请求上限），不在上面发送请求
+        if (m_socket.state() == QAbstractSocket::ConnectedState
+            && (m_socket.waitForReadyRead(0) || m_socket.state() != QAbstractSocket::ConnectedState))
+        {
+            m_socket.abort();
+        }
+        bool reused = m_socket.state() == QAbstractSocket::ConnectedState;
+        if (!ensureConnected())
+        {
+            return QJsonObject();
+        }
+
+        // 请求没有完整发出时服务器不会处理，复用的连接可能已被服务器关闭，在新连接上重发一次
+        if (!writeJsonFrame(m_socket, jsonData, fileName))
+        {
+            m_socket.abort();
+            if (reused)
+            {
+                continue;
+            }
+            break;
+        }
+
+        QJsonObject response;
+        if (readJsonResponse(m_socket, m_timeoutMs, response))
+        {
+            return response;
+        }
+
+        // 请求发出之后连接中断、读取超时或响应不完整时不重发：无法确定服务器是否已经执行了请求
+        qDebug() << "请求失败:" << m_socket.errorString();
+        m_socket.abort();
+        return QJsonObject();
+    }
+
+    qDebug() << "请求失败:" << m_socket.errorString();
+    return QJsonObject();
+}
+
+void PersistentJsonClient::close()
+{
+    if (m_socket.state() != QAbstractSocket::UnconnectedState)
+    {
+        m_socket.disconnectFromHost();
+        if (m_socket.state() != QAbstractSocket::UnconnectedState)
+        {
+            m_socket.waitForDisconnected(3000);
+        }
+    }
+}
+
 
 bool sendJsonData(const QString &serverAddress, quint16 port, const QByteArray &jsonData, const QString &fileName)
 {
@@ -17,46 +191,15 @@ bool sendJsonData(const QString &serverAddress, quint16 port, const QByteArray &
     }
 
     qDebug() << "已连接到服务器";
-
-    // 获取文件名
-    QByteArray fileNameData = fileName.toUtf8();
+    enableLowDelay(socket);
 
     qDebug() << "文件名:" << fileName;
     qDebug() << "数据大小:" << jsonData.size() << "字节";
 
-    // 按照test_client.py的协议发送数据
-    // 1. 发送文件名长度（4字节，网络字节序）
-    quint32 fileNameLength = static_cast<quint32>(fileNameData.size());
-    QByteArray fileNameLengthBytes;
-    QDataStream fileNameLengthStream(&fileNameLengthBytes, QIODevice::WriteOnly);
-    fileNameLengthStream.setByteOrder(QDataStream::BigEndian);
-    fileNameLengthStream << fileNameLength;
-    
-    qint64 sent1 = socket.write(fileNameLengthBytes);
-    qDebug() << "发送文件名长度:" << fileNameLength << "字节数:" << sent1;
-
-    // 2. 发送文件名
-    qint64 sent2 = socket.write(fileNameData);
-    qDebug() << "发送文件名:" << fileName << "字节数:" << sent2;
-
-    // 3. 发送JSON数据长度（4字节，网络字节序）  
-    quint32 jsonDataLength = static_cast<quint32>(jsonData.size());
-    QByteArray jsonDataLengthBytes;
-    QDataStream jsonDataLengthStream(&jsonDataLengthBytes, QIODevice::WriteOnly);
-    jsonDataLengthStream.setByteOrder(QDataStream::BigEndian);
-    jsonDataLengthStream << jsonDataLength;
-    
-    qint64 sent3 = socket.write(jsonDataLengthBytes);
-    qDebug() << "发送JSON数据长度:" << jsonDataLength << "字节数:" << sent3;
-
-    // 4. 发送JSON数据内容
-    qint64 sent4 = socket.write(jsonData);
-    qDebug() << "发送JSON数据内容，字节数:" << sent4;
-
-    // 检查是否所有数据都发送成功
-    if (sent1 <= 0 || sent2 <= 0 || sent3 <= 0 || sent4 <= 0)
+    // 按照test_client.py的协议把文件名长度、文件名、JSON长度和JSON内容拼成一帧，一次写出
+    if (!writeJsonFrame(socket, jsonData, fileName))
     {
-        qDebug() << "数据发送失败！";
+        qDebug() << "数据发送失败！" << socket.errorString();
         return false;
     }
 
@@ -64,8 +207,6 @@ bool sendJsonData(const QString &serverAddress, quint16 port, const QByteArray &
     qDebug() << "发送的 JSON 内容:";
     qDebug().noquote() << QString::fromUtf8(jsonData);
 
-    // 等待数据发送完成
-    socket.waitForBytesWritten(3000);
     socket.disconnectFromHost();
 
     if (socket.state() != QAbstractSocket::UnconnectedState)
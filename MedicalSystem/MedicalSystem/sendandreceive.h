@@ -20,4 +20,24 @@ QJsonObject sendJsonDataAndReceive(const QString &serverAddress, quint16 port, c
 // 兼容性函数：只发送不接收（保持向后兼容）
 bool sendJsonData(const QString &serverAddress, quint16 port, const QByteArray &jsonData, const QString &fileName);
 
+// 持久连接客户端：在同一个连接上连续发送多个请求（需要服务器以 --keep-alive 启动）
+// 连接被服务器关闭（空闲超时或达到请求上限）后自动重连；只在请求没有发出时重发，请求发出后连接中断或读取超时时不重发
+class PersistentJsonClient
+{
+public:
+    PersistentJsonClient(const QString &serverAddress, quint16 port, int timeoutMs = 5000);
+    ~PersistentJsonClient();
+
+    QJsonObject sendAndReceive(const QByteArray &jsonData, const QString &fileName = "data.json");
+    void close();
+
+private:
+    bool ensureConnected();
+
+    QString m_serverAddress;
+    quint16 m_port;
+    int m_timeoutMs;
+    QTcpSocket m_socket;
+};
+
 #endif // SEND_AND_RECEIVE_H
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+网络引擎对比基准测试
+依次用每个网络引擎（threaded/selectors/asyncio/uvloop）在本机启动服务器，用相同的负载测试吞吐量和延迟：
+- oneshot: 每个请求新建一个连接（原有客户端行为）
+- keepalive: 每个并发连接上顺序发送请求
+- pipeline: 每个并发连接上流水线发送请求，每批最多depth个
+服务器使用临时目录中的数据库和日志，测试结束后删除
+
+用法: python benchmark_engines.py --connections 32 --requests 200 --mode keepalive
+"""
+
+import sys
+import os
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from network.communication import JSONProtocolClient
+from network.engines import available_engines
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 默认负载：查询医生资料（读连接池 + 资料缓存）
+DEFAULT_PAYLOAD = {"query_doctor_info": True, "doctor_name": "王医生"}
+
+
+class EngineBenchmark:
+    def __init__(self, engine, port, mode='keepalive', connections=32, requests=200, depth=8,
+                 payload=None, server_args=None):
+        self.engine = engine
+        self.port = port
+        self.mode = mode
+        self.connections = connections
+        self.requests = requests
+        self.depth = depth
+        self.payload = payload or DEFAULT_PAYLOAD
+        self.server_args = server_args or []
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.process = None
+        self.workdir = None
+
+    def start_server(self):
+        """在临时目录中启动前台服务器，等待端口开始监听"""
+        self.workdir = tempfile.mkdtemp(prefix=f'bench-{self.engine}-')
+        command = [sys.executable, 'server.py', 'start', '--foreground', '--host', '127.0.0.1',
+                   '--port', str(self.port), '--engine', self.engine, '--keep-alive',
+                   '--max-requests-per-conn', str(max(self.requests + 10, 100)),
+                   '--db-path', os.path.join(self.workdir, 'bench.db'),
+                   '--log-file', os.path.join(self.workdir, 'server.log'),
+                   '--pid-file', os.path.join(self.workdir, 'server.pid'),
+                   '--log-payload-chars', '0'] + self.server_args
+        self.process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.time() + 15
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.engine} 引擎服务器启动失败（退出码 {self.process.returncode}）")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"{self.engine} 引擎服务器未在15秒内开始监听")
+
+    def stop_server(self):
+        """停止服务器并删除临时目录"""
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=40)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def server_memory_mb(self):
+        """服务器进程的峰值常驻内存（MB），不支持/proc的平台返回None"""
+        try:
+            with open(f'/proc/{self.process.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def record(self, latency, success):
+        with self.lock:
+            if success:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def connection_worker(self):
+        """单个并发连接上的负载"""
+        client = JSONProtocolClient('127.0.0.1', self.port, keep_alive=(self.mode == 'keepalive'))
+        try:
+            if self.mode == 'pipeline':
+                sent = 0
+                while sent < self.requests:
+                    batch = min(self.depth, self.requests - sent)
+                    start = time.perf_counter()
+                    futures = [client.submit(self.payload) for _ in range(batch)]
+                    for future in futures:
+                        try:
+                            response = future.result(timeout=30)
+                            self.record(time.perf_counter() - start, response.get('status') == 'success')
+                        except Exception:
+                            self.record(0, False)
+                    sent += batch
+            else:
+                for _ in range(self.requests):
+                    start = time.perf_counter()
+                    response = client.send_json_data(self.payload)
+                    self.record(time.perf_counter() - start, bool(response) and response.get('status') == 'success')
+        finally:
+            client.close()
+
+    def run(self):
+        """启动服务器、预热、施加负载并返回统计结果"""
+        self.start_server()
+        try:
+            warmup = JSONProtocolClient('127.0.0.1', self.port, keep_alive=True)
+            for _ in range(20):
+                warmup.send_json_data(self.payload)
+            warmup.close()
+
+            threads = [threading.Thread(target=self.connection_worker) for _ in range(self.connections)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            return self.summary(elapsed)
+        finally:
+            self.stop_server()
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            'engine': self.engine,
+            'mode': self.mode,
+            'connections': self.connections,
+            'requests': len(latencies) + self.errors,
+            'errors': self.errors,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+            'server_memory_mb': self.server_memory_mb(),
+        }
+
+
+def print_results(results):
+    print("\n" + "=" * 96)
+    print(f"{'引擎':<12}{'请求数':>8}{'失败':>6}{'吞吐(请求/秒)':>16}{'平均(ms)':>10}{'P50(ms)':>10}"
+          f"{'P95(ms)':>10}{'P99(ms)':>10}{'最大(ms)':>10}{'内存(MB)':>10}")
+    print("-" * 96)
+    for r in results:
+        memory = f"{r['server_memory_mb']:.1f}" if r.get('server_memory_mb') else '-'
+        print(f"{r['engine']:<12}{r['requests']:>8}{r['errors']:>6}{r['throughput']:>16.1f}{r['mean_ms']:>10.2f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}{memory:>10}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='网络引擎对比基准测试')
+    parser.add_argument('--engines', default=','.join(available_engines()),
+                        help=f'要测试的引擎，逗号分隔 (默认: 当前环境可用的全部引擎 {",".join(available_engines())})')
+    parser.add_argument('--mode', choices=['oneshot', 'keepalive', 'pipeline'], default='keepalive',
+                        help='连接方式 (默认: keepalive)')
+    parser.add_argument('--connections', type=int, default=32, help='并发连接数 (默认: 32)')
+    parser.add_argument('--requests', type=int, default=200, help='每个连接发送的请求数 (默认: 200)')
+    parser.add_argument('--depth', type=int, default=8, help='pipeline模式每批发送的请求数 (默认: 8)')
+    parser.add_argument('--payload', help='请求JSON (默认: 查询医生资料)')
+    parser.add_argument('--port', type=int, default=56500, help='测试服务器使用的起始端口 (默认: 56500)')
+    parser.add_argument('--server-arg', action='append', default=[], metavar='ARG',
+                        help='传给server.py的额外参数，可重复，如 --server-arg=--worker-threads=32')
+    parser.add_argument('--output', help='把结果保存为JSON文件')
+    args = parser.parse_args()
+
+    engines = [name.strip() for name in args.engines.split(',') if name.strip()]
+    unavailable = [name for name in engines if name not in available_engines()]
+    if unavailable:
+        parser.error(f"当前环境不可用的引擎: {', '.join(unavailable)}")
+    payload = json.loads(args.payload) if args.payload else None
+
+    print(f"网络引擎基准测试: {', '.join(engines)}")
+    print(f"模式 {args.mode}，并发连接 {args.connections}，每连接请求 {args.requests}"
+          + (f"，流水线深度 {args.depth}" if args.mode == 'pipeline' else ''))
+
+    results = []
+    for index, engine in enumerate(engines):
+        print(f"\n正在测试 {engine} 引擎...")
+        benchmark = EngineBenchmark(engine, args.port + index, args.mode, args.connections, args.requests,
+                                    args.depth, payload, args.server_arg)
+        try:
+            result = benchmark.run()
+        except Exception as e:
+            print(f"❌ {engine} 引擎测试失败: {e}")
+            continue
+        results.append(result)
+        print(f"✅ {engine}: {result['throughput']:.1f} 请求/秒，P99 {result['p99_ms']:.2f} ms，失败 {result['errors']}")
+
+    if results:
+        print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'args': vars(args), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
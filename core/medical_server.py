@@ -8,62 +8,220 @@
 import sys
 import os
 import logging
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, List, Optional
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models.database import DatabaseManager
+from models.connection_pool import get_pool, close_all_pools, profile_pragmas, DEFAULT_PROFILE
+from models.write_queue import get_write_queue, stop_all_write_queues
+from core.router import OperationRouter, is_error_result, load_plugins
 from services.auth_service import AuthService
 from services.appointment_service import AppointmentService
-from network.communication import NetworkHandler
-from utils.server_manager import ServerManager, daemonize
+from services.profile_cache import ProfileCache
+from network.engines import DEFAULT_ENGINE, create_network_handler
+from network.http_gateway import HTTPGateway, DEFAULT_HTTP_WORKERS
+from network.push_hub import PushHub, DEFAULT_MAX_CONNECTIONS
+from network.streaming import StreamingResult
+from utils.server_manager import ServerManager, daemonize, is_handover, spawn_successor, SHUTDOWN_SIGNALS
+from utils.prefork import PreforkSupervisor
+from utils.logging_config import PayloadLogPolicy, DEFAULT_MAX_BYTES, DEFAULT_BACKUP_COUNT
+
+
+# 医生/患者资料缓存的数据来源表，直接写这些表时需要清空缓存
+PROFILE_TABLES = ('users', 'patients', 'doctors')
+
+# 单个batch请求最多包含的子请求数
+MAX_BATCH_ITEMS = 500
+
+# 停止或平滑重启时等待已接受的请求处理完毕的默认秒数
+DEFAULT_DRAIN_TIMEOUT = 30.0
+
+# 不修改数据的内置操作（HTTP网关允许用GET调用，响应带ETag）
+READONLY_OPERATIONS = ('query_doctor_info', 'query_patient_info', 'query_appointments', 'server_stats')
+
+# 流式sql_query每帧的默认行数和上限
+DEFAULT_STREAM_CHUNK_ROWS = 500
+MAX_STREAM_CHUNK_ROWS = 10000
+
+
+class BatchAborted(Exception):
+    """原子批量操作中的子请求失败，回滚整个事务"""
+    
+    def __init__(self, index: int):
+        super().__init__(f"第 {index} 个子请求失败")
+        self.index = index
 
 
 class MedicalServer:
     def __init__(self, host='0.0.0.0', port=55000, db_path='/medical/MedicalSystem.db', 
-                 log_file='/medical/server.log', pid_file='/medical/server.pid'):
+                 log_file='/medical/server.log', pid_file='/medical/server.pid',
+                 network_options: Optional[Dict[str, Any]] = None,
+                 db_options: Optional[Dict[str, Any]] = None,
+                 plugins: Optional[List[str]] = None,
+                 log_options: Optional[Dict[str, Any]] = None):
         self.host = host
         self.port = port
         self.db_path = db_path
         self.log_file = log_file
         self.pid_file = pid_file
         
-        # 初始化服务器管理器
-        self.server_manager = ServerManager(pid_file, log_file)
+        # 初始化服务器管理器（异步日志、按大小轮转；多进程模式的工作进程把日志发送到主进程）
+        log_options = dict(log_options or {})
+        self.server_manager = ServerManager(pid_file, log_file,
+                                            log_options.get('max_bytes', DEFAULT_MAX_BYTES),
+                                            log_options.get('backup_count', DEFAULT_BACKUP_COUNT),
+                                            log_options.get('queue'))
         self.logger = logging.getLogger(__name__)
         
+        # 数据库持久性配置档（WAL、synchronous、cache_size、mmap_size、busy_timeout）
+        db_options = dict(db_options or {})
+        self.db_profile = db_options.get('profile', DEFAULT_PROFILE)
+        db_pragmas = profile_pragmas(self.db_profile, db_options.get('pragmas'))
+        
+        # 初始化数据库连接池（并行读）和单写线程（串行、批量写），数据库管理器和各服务共用
+        self.db_pool = get_pool(db_path, max_size=db_options.get('pool_size', 8), pragmas=db_pragmas)
+        self.db_writer = get_write_queue(db_path, pragmas=db_pragmas, pool=self.db_pool,
+                                         max_batch=db_options.get('write_batch', 64))
+        
         # 初始化数据库
-        self.db_manager = DatabaseManager(db_path)
+        self.db_manager = DatabaseManager(db_path, self.db_pool, self.db_writer, db_pragmas)
+        
+        # 初始化服务（医生/患者资料查询带进程内缓存，多进程模式下共享失效计数器）
+        self.profile_cache = ProfileCache(db_options.get('profile_cache_size', 1024),
+                                          db_options.get('profile_cache_ttl', 30.0),
+                                          db_options.get('profile_cache_generation'))
+        self.auth_service = AuthService(db_path, self.db_pool, self.db_writer, self.profile_cache)
+        self.appointment_service = AppointmentService(db_path, self.db_pool, self.db_writer)
         
-        # 初始化服务
-        self.auth_service = AuthService(db_path)
-        self.appointment_service = AppointmentService(db_path)
+        # 初始化操作路由（内置操作 + 插件注册的操作）
+        self.router = OperationRouter(default_op='insert_data')
+        self.register_operations()
+        load_plugins(self.router, self, plugins or [])
         
-        # 初始化网络处理器
-        self.network_handler = NetworkHandler(host, port)
+        # 初始化网络处理器（engine选择网络引擎：threaded、selectors、asyncio或uvloop，见network/engines.py）
+        network_options = dict(network_options or {})
+        self.engine = network_options.pop('engine', DEFAULT_ENGINE)
+        self.drain_timeout = network_options.pop('drain_timeout', DEFAULT_DRAIN_TIMEOUT)
+        http_port = network_options.pop('http_port', None)
+        http_workers = network_options.pop('http_workers', DEFAULT_HTTP_WORKERS)
+        http_cors_origin = network_options.pop('http_cors_origin', None)
+        push_max_connections = network_options.pop('push_max_connections', DEFAULT_MAX_CONNECTIONS)
+        push_channels = network_options.pop('push_channels', None)
+        worker_index = network_options.pop('worker_index', None)
+        self.network_handler = create_network_handler(self.engine, host, port, **network_options)
         self.network_handler.set_request_handler(self.process_json_data)
+        self.network_handler.set_ready_callback(self.server_manager.handover_ready)
+        self.network_handler.set_payload_log_policy(PayloadLogPolicy(
+            max_chars=log_options.get('payload_chars', 200),
+            sample_rate=log_options.get('payload_sample', 1.0),
+            per_op=log_options.get('payload_ops'),
+            op_resolver=self.router.operation_for))
+        
+        # HTTP/JSON网关（可选）：第二个端口上的HTTP/1.1接口，与TCP协议共用请求处理器；
+        # 同时在 /ws/queue 提供排队变更的WebSocket推送，预约变更提交后推送给订阅该医生的客户端
+        self.http_gateway = None
+        self.push_hub = None
+        if http_port:
+            self.push_hub = PushHub(self.queue_snapshot, 'doctor_name', push_max_connections,
+                                    push_channels, worker_index)
+            self.appointment_service.add_listener(self.publish_queue_change)
+            # 多进程模式的工作进程（pid_file为None）用SO_REUSEPORT各自绑定HTTP端口
+            self.http_gateway = HTTPGateway(self.network_handler, self.router, host, http_port,
+                                            http_workers, http_cors_origin, self.push_hub,
+                                            reuse_port=pid_file is None)
         
         self.running = False
+        self.handing_over = False
+        self.database_closed = False
+        # SIGUSR2：平滑重启
+        self.server_manager.set_reload_handler(self.handover)
+        # SIGTERM/SIGINT：优雅关闭；多进程模式的工作进程收到主进程转发的SIGHUP（滚动重载）时同样优雅退出
+        shutdown_signals = SHUTDOWN_SIGNALS + (('SIGHUP',) if pid_file is None else ())
+        self.server_manager.set_shutdown_handler(self.begin_shutdown, shutdown_signals)
+    
+    @classmethod
+    def serve_prefork(cls, workers: int, daemon: bool = False, host='0.0.0.0', port=55000,
+                      db_path='/medical/MedicalSystem.db', log_file='/medical/server.log',
+                      pid_file='/medical/server.pid', network_options: Optional[Dict[str, Any]] = None,
+                      db_options: Optional[Dict[str, Any]] = None, plugins: Optional[List[str]] = None,
+                      log_options: Optional[Dict[str, Any]] = None) -> bool:
+        """多进程模式：主进程监控workers个工作进程，每个工作进程运行一个完整的服务器实例"""
+        network_options = dict(network_options or {})
+        db_options = dict(db_options or {})
+        log_options = dict(log_options or {})
+        reuse_port = network_options.get('reuse_port', False)
+        
+        def worker_main(listen_socket, unix_listen_socket, log_queue, shared_state) -> bool:
+            server = cls(host, port, db_path, log_file, None,
+                         dict(network_options, listen_socket=listen_socket, unix_listen_socket=unix_listen_socket,
+                              push_channels=shared_state.get('push_channels'),
+                              worker_index=shared_state.get('worker_index')),
+                         dict(db_options, profile_cache_generation=shared_state.get('profile_cache_generation')),
+                         plugins, dict(log_options, queue=log_queue))
+            return server.start_server()
+        
+        supervisor = PreforkSupervisor(workers, worker_main, host, port,
+                                       backlog=network_options.get('backlog', 128), reuse_port=reuse_port,
+                                       unix_socket=network_options.get('unix_socket'),
+                                       listen_tcp=network_options.get('listen_tcp', True),
+                                       pid_file=pid_file, log_file=log_file,
+                                       log_max_bytes=log_options.get('max_bytes', DEFAULT_MAX_BYTES),
+                                       log_backup_count=log_options.get('backup_count', DEFAULT_BACKUP_COUNT),
+                                       prepare=lambda: cls.prepare_database(db_path, db_options),
+                                       drain_timeout=network_options.get('drain_timeout', DEFAULT_DRAIN_TIMEOUT))
+        return supervisor.run(daemon)
+    
+    @staticmethod
+    def prepare_database(db_path: str, db_options: Optional[Dict[str, Any]] = None):
+        """在fork工作进程之前初始化一次数据库（建表、迁移、示例数据），避免多个进程同时初始化
+
+        初始化完成后关闭所有连接和写线程，SQLite连接不能跨fork使用
+        """
+        db_options = dict(db_options or {})
+        db_pragmas = profile_pragmas(db_options.get('profile', DEFAULT_PROFILE), db_options.get('pragmas'))
+        pool = get_pool(db_path, max_size=1, pragmas=db_pragmas)
+        writer = get_write_queue(db_path, pragmas=db_pragmas, pool=pool)
+        try:
+            DatabaseManager(db_path, pool, writer, db_pragmas)
+        finally:
+            stop_all_write_queues()
+            close_all_pools()
     
     def start_server(self, daemon=False):
-        """启动服务器"""
-        if daemon:
+        """启动服务器（阻塞直到服务器停止）
+
+        平滑重启启动的新进程不再守护进程化，开始监听后才把PID文件切换为自己（handover_ready）；
+        网络主循环退出后（包括优雅关闭、平滑重启）关闭数据库再返回
+        """
+        if daemon and not is_handover():
+            daemonize()
+            # 后台写日志线程不会随fork进入守护进程，需要重新启动
+            self.server_manager.restart_logging()
+            # 守护进程化之后再写PID文件，记录的才是实际运行的进程
             if not self.server_manager.create_pid_file():
                 return False
-            daemonize()
         
         try:
             self.running = True
             self.logger.info(f"医疗系统服务器启动")
-            self.logger.info(f"监听地址: {self.host}:{self.port}")
+            self.logger.info(f"监听地址: {self.network_handler.listen_address()}")
+            self.logger.info(f"网络引擎: {self.engine}")
+            if self.http_gateway:
+                self.logger.info(f"HTTP网关: http://{self.host}:{self.http_gateway.port}/api/<操作名>")
             self.logger.info(f"数据库文件: {self.db_path}")
+            self.logger.info(f"数据库持久性配置档: {self.db_profile}")
             self.logger.info(f"日志文件: {self.log_file}")
             if daemon:
                 self.logger.info(f"PID文件: {self.pid_file}")
                 self.logger.info(f"服务器PID: {os.getpid()}")
             
-            # 启动网络服务
+            # 启动网络服务（HTTP网关在后台线程中运行）
+            if self.http_gateway:
+                self.push_hub.start()
+                self.http_gateway.start()
             success = self.network_handler.start_server()
             return success
             
@@ -75,83 +233,288 @@ class MedicalServer:
             self.logger.error(f"服务器运行时出错: {e}")
             return False
         finally:
+            if self.http_gateway:
+                self.http_gateway.wait_stopped()
+                self.push_hub.stop()
+                self.push_hub.wait_stopped()
+            self.close_database()
             if daemon:
                 self.server_manager.remove_pid_file()
         
         return True
     
+    def begin_shutdown(self, signum: int):
+        """优雅关闭（在信号处理函数中调用）：停止接受新连接，已接受的请求最多再处理drain_timeout秒，
+        网络主循环退出后由start_server关闭数据库"""
+        self.running = False
+        if self.http_gateway:
+            self.http_gateway.stop(drain_timeout=self.drain_timeout)
+            self.push_hub.stop()
+        self.network_handler.stop_server(drain_timeout=self.drain_timeout)
+    
+    def handover(self):
+        """平滑重启（SIGUSR2）：启动新一代进程并把监听套接字交给它，
+        新进程开始监听后停止接受新连接，处理完已接受的请求后退出
+
+        多进程模式的工作进程由主进程启动新一代，这里只需要平滑退出
+        """
+        if self.handing_over:
+            return
+        self.handing_over = True
+        if self.pid_file is not None:
+            self.logger.info("收到平滑重启信号，正在启动新服务器进程")
+            listen_sockets = self.network_handler.listen_sockets()
+            if self.http_gateway:
+                listen_sockets += self.http_gateway.listen_sockets()
+            new_pid = spawn_successor(listen_sockets)
+            if new_pid is None:
+                self.logger.error("平滑重启失败，本进程继续提供服务")
+                self.handing_over = False
+                return
+            # Unix域套接字文件已由新进程接管，退出时不再删除
+            self.network_handler.handed_over = True
+            self.logger.info(f"新服务器进程 (PID: {new_pid}) 已接管监听套接字，"
+                             f"等待正在处理的请求完成后退出")
+        # HTTP监听套接字已交给新进程；推送订阅者收到关闭帧后重连到新进程
+        if self.http_gateway:
+            self.http_gateway.stop(drain_timeout=self.drain_timeout)
+            self.push_hub.stop()
+        self.network_handler.stop_server(drain_timeout=self.drain_timeout)
+    
     def stop_server(self):
         """停止服务器"""
         self.running = False
+        if self.http_gateway:
+            self.http_gateway.stop()
+            self.push_hub.stop()
         if self.network_handler:
             self.network_handler.stop_server()
+        self.close_database()
         self.logger.info("医疗系统服务器已停止")
     
+    def close_database(self):
+        """停止写线程（已排队的写操作先提交），检查点WAL（把WAL合并回数据库文件），然后关闭连接池
+
+        平滑退出超过截止时间时仍有请求在处理：之后到达的请求直接返回"服务器正在关闭"，
+        已经在执行的写操作在停止写线程之后提交会抛出WriteQueueStopped，不会在关闭的数据库上执行
+        """
+        if self.database_closed:
+            return
+        self.database_closed = True
+        self.db_writer.stop()
+        try:
+            wal_file = f"{self.db_path}-wal"
+            wal_size = os.path.getsize(wal_file) if os.path.exists(wal_file) else 0
+            result = self.db_writer.checkpoint()
+            if result is not None and result[0]:
+                self.logger.warning(f"WAL检查点未完成（其他连接仍在使用数据库）：已合并 {result[2]}/{result[1]} 页")
+            elif result is not None:
+                self.logger.info(f"WAL检查点完成：{wal_size} 字节的WAL已合并回数据库文件")
+        except Exception as e:
+            self.logger.error(f"WAL检查点失败: {e}")
+        self.db_pool.close()
+        self.logger.info("数据库已关闭")
+    
+    def register_operations(self):
+        """注册内置操作，注册顺序即旧格式请求识别键的匹配顺序"""
+        auth = self.auth_service
+        appointments = self.appointment_service
+        builtin = [
+            ('reset_password', auth.update_user_password),
+            ('register_patient', auth.register_patient),
+            ('register_doctor', auth.register_doctor),
+            ('login', auth.login_match),
+            ('reset_patient_information', auth.update_patient_info),
+            ('reset_doctor_information', auth.update_doctor_info),
+            ('query_doctor_info', auth.query_doctor_info),
+            ('query_patient_info', auth.query_patient_info),
+            ('sql_query', self.execute_sql),
+            ('create_appointment', appointments.create_appointment),
+            ('query_appointments', appointments.query_appointments),
+            ('cancel_appointment', appointments.cancel_appointment),
+            ('update_appointment_status', appointments.update_appointment_status),
+        ]
+        for op, handler in builtin:
+            self.router.register(op, handler, legacy_key=op, readonly=op in READONLY_OPERATIONS)
+        
+        # 默认操作：没有匹配到任何识别键时作为插入数据处理
+        self.router.register('insert_data', self.insert_data)
+        self.router.register('server_stats', self.server_stats, readonly=True)
+        self.router.register('batch', self.run_batch)
+    
+    def queue_snapshot(self, doctor_name: str) -> Dict[str, Any]:
+        """WebSocket订阅者的初始消息：该医生当前的待就诊队列"""
+        return {
+            "event": "snapshot",
+            "doctor_name": doctor_name,
+            "timestamp": datetime.now().isoformat(),
+            "queue": self.appointment_service.queue_snapshot(doctor_name),
+        }
+    
+    def publish_queue_change(self, change: str, doctor_name: str, appointment: Dict[str, Any]):
+        """预约变更提交后推送给订阅该医生的客户端（在写线程中调用，只把消息交给推送中心）"""
+        self.push_hub.publish(doctor_name, {
+            "event": "queue_update",
+            "doctor_name": doctor_name,
+            "change": change,
+            "timestamp": datetime.now().isoformat(),
+            "appointment": appointment,
+        })
+    
     def process_json_data(self, data: Dict[str, Any]) -> Any:
         """处理JSON数据并执行相应操作"""
+        if self.database_closed:
+            # 平滑退出超过截止时间后仍在处理的连接：数据库已关闭，直接返回错误
+            return "错误: 服务器正在关闭"
         try:
-            # 检查JSON中的操作类型并执行相应操作
-            if 'reset_password' in data:
-                return self.auth_service.update_user_password(data)
-            
-            elif 'register_patient' in data:
-                return self.auth_service.register_patient(data)
-            
-            elif 'register_doctor' in data:  # 修正拼写错误
-                return self.auth_service.register_doctor(data)
-            
-            elif 'login' in data:
-                return self.auth_service.login_match(data)
-            
-            elif 'reset_patient_information' in data:
-                return self.auth_service.update_patient_info(data)
-            
-            elif 'reset_doctor_information' in data:
-                return self.auth_service.update_doctor_info(data)
-            
-            elif 'query_doctor_info' in data:
-                return self.auth_service.query_doctor_info(data)
-            
-            elif 'query_patient_info' in data:
-                return self.auth_service.query_patient_info(data)
-            
-            elif 'sql_query' in data:
-                return self.execute_sql(data)
-            
-            elif 'create_appointment' in data:
-                return self.appointment_service.create_appointment(data)
-            
-            elif 'query_appointments' in data:
-                return self.appointment_service.query_appointments(data)
-            
-            elif 'cancel_appointment' in data:
-                return self.appointment_service.cancel_appointment(data)
-            
-            elif 'update_appointment_status' in data:
-                return self.appointment_service.update_appointment_status(data)
-            
-            else:
-                # 默认作为插入数据处理
-                table_name = data.get('table_name', 'default_table')
-                if 'table_name' in data:
-                    data_copy = data.copy()
-                    del data_copy['table_name']
-                else:
-                    data_copy = data
-                return self.db_manager.insert_data(data_copy, table_name)
-                
+            return self.router.dispatch(data)
         except Exception as e:
             self.logger.error(f"处理JSON数据时出错: {e}")
             return f"处理JSON数据时出错: {str(e)}"
     
+    def insert_data(self, data: Dict[str, Any]) -> Any:
+        """插入数据，table_name指定目标表"""
+        table_name = data.get('table_name', 'default_table')
+        if 'table_name' in data:
+            data_copy = data.copy()
+            del data_copy['table_name']
+        else:
+            data_copy = data
+        result = self.db_manager.insert_data(data_copy, table_name)
+        if str(table_name).lower() in PROFILE_TABLES:
+            self.db_writer.after_commit(self.profile_cache.clear)
+        return result
+    
+    def run_batch(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """批量操作：{"op": "batch", "atomic": false, "requests": [子请求, ...]}
+
+        子请求按顺序执行，结果中按顺序给出每个子请求的状态：
+        - 非原子模式：子请求互不影响，整个批次复用同一个池连接
+        - atomic为true：整个批次在写线程的一个事务中执行，任一子请求失败则全部回滚，
+          之前成功的子请求状态为rolled_back，之后的子请求不再执行（skipped）
+        """
+        requests = data.get('requests')
+        if not isinstance(requests, list) or not requests:
+            return {"status": "error", "message": "batch操作需要非空的requests数组"}
+        if len(requests) > MAX_BATCH_ITEMS:
+            return {"status": "error", "message": f"单个batch最多包含 {MAX_BATCH_ITEMS} 个子请求"}
+        
+        if data.get('atomic'):
+            return self.run_atomic_batch(requests)
+        
+        # 子请求中的读操作在同一线程中执行，复用这里取出的池连接
+        with self.db_pool.connection():
+            results = [self.run_batch_item(index, item) for index, item in enumerate(requests)]
+        return self.batch_response(results, atomic=False)
+    
+    def run_atomic_batch(self, requests: List[Any]) -> Dict[str, Any]:
+        """在一个写事务中执行所有子请求"""
+        results = []
+        
+        def run(conn):
+            # 子请求的写操作在写线程中直接执行（嵌套SAVEPOINT），读操作使用写线程的连接，
+            # 能看到本批次之前的子请求尚未提交的修改
+            for index, item in enumerate(requests):
+                outcome = self.run_batch_item(index, item)
+                results.append(outcome)
+                if outcome["status"] == "error":
+                    raise BatchAborted(index)
+        
+        try:
+            self.db_writer.execute(run)
+            return self.batch_response(results, atomic=True, committed=True)
+        except BatchAborted as e:
+            message = f"第 {e.index} 个子请求失败，整个批次已回滚"
+        except Exception as e:
+            self.logger.error(f"原子批量操作提交失败: {e}")
+            message = f"事务提交失败，整个批次已回滚: {str(e)}"
+        
+        for outcome in results:
+            if outcome["status"] == "success":
+                outcome["status"] = "rolled_back"
+        for index in range(len(results), len(requests)):
+            results.append({"index": index, "status": "skipped"})
+        return self.batch_response(results, atomic=True, committed=False, message=message)
+    
+    def run_batch_item(self, index: int, item: Any) -> Dict[str, Any]:
+        """执行批次中的一个子请求，返回该子请求的状态和结果（子请求不支持流式返回）"""
+        if not isinstance(item, dict):
+            return {"index": index, "op": None, "status": "error", "error": "子请求必须是JSON对象"}
+        if item.get('stream'):
+            item = dict(item, stream=False)
+        
+        op = self.router.operation_for(item)
+        if op == 'batch':
+            return {"index": index, "op": op, "status": "error", "error": "batch操作不能嵌套"}
+        
+        try:
+            result = self.router.dispatch(item)
+        except Exception as e:
+            self.logger.error(f"批量操作第 {index} 个子请求出错: {e}")
+            return {"index": index, "op": op, "status": "error", "error": str(e)}
+        
+        status = "error" if is_error_result(result) else "success"
+        return {"index": index, "op": op, "status": status, "result": result}
+    
+    def batch_response(self, results: List[Dict[str, Any]], atomic: bool,
+                       committed: Optional[bool] = None, message: Optional[str] = None) -> Dict[str, Any]:
+        """汇总批量操作的结果"""
+        failed = sum(1 for outcome in results if outcome["status"] == "error")
+        succeeded = sum(1 for outcome in results if outcome["status"] == "success")
+        response = {
+            "status": "error" if failed or committed is False else "success",
+            "message": message or f"批量操作完成: 成功 {succeeded} 个，失败 {failed} 个",
+            "atomic": atomic,
+            "succeeded": succeeded,
+            "failed": failed,
+            "results": results,
+        }
+        if atomic:
+            response["committed"] = committed
+        return response
+    
+    def stream_sql(self, sql_query: str, chunk_rows: Any) -> StreamingResult:
+        """流式执行SELECT，结果由网络层逐帧编码发送，发送完毕后归还数据库连接"""
+        chunk_rows = max(1, min(int(chunk_rows), MAX_STREAM_CHUNK_ROWS))
+        rows = self.db_manager.stream_sql(sql_query, chunk_rows)
+        chunks = ({"columns": rows.columns, "data": block} if index == 0 else {"data": block}
+                  for index, block in enumerate(rows))
+        return StreamingResult(chunks, lambda: {"columns": rows.columns, "row_count": rows.row_count}, rows.close)
+    
+    def server_stats(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """服务器运行统计：各操作调用次数、网络工作线程、连接池、写线程和资料缓存状态
+
+        多进程模式下只包含处理该请求的工作进程（pid）自己的统计
+        """
+        return {
+            "pid": os.getpid(),
+            "operations": self.router.stats(),
+            "network": self.network_handler.network_stats(),
+            "http": self.http_gateway.stats() if self.http_gateway else None,
+            "push": self.push_hub.stats() if self.push_hub else None,
+            "db_pool": self.db_pool.stats(),
+            "db_writer": self.db_writer.stats(),
+            "profile_cache": self.profile_cache.stats(),
+        }
+    
     def execute_sql(self, data: Dict[str, Any]) -> Any:
-        """执行JSON中的SQL查询"""
+        """执行JSON中的SQL查询
+
+        SELECT带 "stream": true 时流式返回：每帧最多chunk_rows行（第一帧带列名），终帧给出列名和总行数
+        """
         try:
             sql_query = data.get('sql_query')
             if not sql_query:
                 return "错误: JSON中未找到'sql_query'键"
             
-            return self.db_manager.execute_sql(sql_query)
+            if data.get('stream'):
+                return self.stream_sql(sql_query, data.get('chunk_rows', DEFAULT_STREAM_CHUNK_ROWS))
+            
+            result = self.db_manager.execute_sql(sql_query)
+            if not sql_query.strip().upper().startswith('SELECT'):
+                # 任意写语句都可能修改医生/患者资料，无法精确失效，清空缓存
+                self.db_writer.after_commit(self.profile_cache.clear)
+            return result
             
         except Exception as e:
             return f"错误: {str(e)}"
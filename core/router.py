@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+操作路由
+每个操作注册一个处理函数，请求通过显式的op字段一次字典查找完成分发；
+没有op字段（或op不是已注册的操作名）的旧格式请求按注册顺序检查识别键（与原来的elif链顺序一致）
+"""
+
+import time
+import logging
+import threading
+import importlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+Handler = Callable[[Dict[str, Any]], Any]
+
+# 旧接口用来表示失败的返回字符串（登录失败、注册失败等）
+LEGACY_FAILURE_RESULTS = frozenset({
+    "verificationFalse", "verificationFalse_bucunzai", "verificationFalse_yichang",
+    "charuyichang", "shoujihaoyicunzai", "gonghaoyicunzai",
+})
+
+
+def is_error_result(result: Any) -> bool:
+    """处理函数的返回值是否表示失败（处理函数出错时通常返回错误信息而不是抛出异常）"""
+    if isinstance(result, dict):
+        return result.get('status') == 'error'
+    if isinstance(result, str):
+        return result.startswith(('错误', '处理JSON数据时出错')) or result in LEGACY_FAILURE_RESULTS
+    return False
+
+
+class OperationRouter:
+    """操作注册表
+
+    - register(op, handler, legacy_key)注册操作；legacy_key为旧格式请求中用来识别该操作的键
+    - dispatch(data)优先使用data['op']（必须是已注册的操作名），否则按注册顺序匹配legacy_key，
+      都不匹配时交给默认操作；op不是已注册的操作名时保留在数据中（旧格式默认插入的数据可能有名为op的列）
+    - 按操作统计调用次数、异常次数和耗时
+    - readonly=True标记不修改数据的操作（HTTP网关允许用GET调用并支持条件请求）
+    """
+
+    def __init__(self, default_op: Optional[str] = None):
+        self.default_op = default_op
+        self.logger = logging.getLogger(__name__)
+
+        self._handlers = {}  # op -> handler
+        self._legacy_keys = []  # [(legacy_key, op)]，按注册顺序匹配
+        self._readonly = set()
+
+        self.stats_lock = threading.Lock()
+        self._counters = {}  # op -> {"calls", "errors", "total_time", "max_time"}
+
+    def register(self, op: str, handler: Handler, legacy_key: Optional[str] = None, replace: bool = False,
+                 readonly: bool = False):
+        """注册操作
+
+        replace为False时重复注册同名操作会抛出ValueError，防止插件意外覆盖内置操作
+        """
+        if op in self._handlers and not replace:
+            raise ValueError(f"操作已注册: {op}")
+        self._handlers[op] = handler
+        if readonly:
+            self._readonly.add(op)
+        else:
+            self._readonly.discard(op)
+        self._counters.setdefault(op, {"calls": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0})
+        if legacy_key is not None:
+            self._legacy_keys = [(key, name) for key, name in self._legacy_keys if key != legacy_key]
+            self._legacy_keys.append((legacy_key, op))
+
+    def operation(self, op: str, legacy_key: Optional[str] = None, replace: bool = False, readonly: bool = False):
+        """装饰器形式的register"""
+        def decorator(handler: Handler) -> Handler:
+            self.register(op, handler, legacy_key, replace, readonly)
+            return handler
+        return decorator
+
+    def operations(self) -> List[str]:
+        """已注册的操作名"""
+        return list(self._handlers)
+
+    def has_operation(self, op: Any) -> bool:
+        """op是否是已注册的操作名"""
+        return isinstance(op, str) and op in self._handlers
+
+    def is_readonly(self, op: str) -> bool:
+        """操作是否注册为只读"""
+        return op in self._readonly
+
+    def operation_for(self, data: Dict[str, Any]) -> Optional[str]:
+        """请求对应的操作名，都不匹配且没有默认操作时返回None"""
+        op = data.get('op')
+        if self.has_operation(op):
+            return op
+
+        # 兼容旧格式：按注册顺序检查识别键
+        for key, name in self._legacy_keys:
+            if key in data:
+                return name
+        return self.default_op
+
+    def resolve(self, data: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """确定请求对应的操作，返回(op, 交给处理函数的数据)
+
+        指定已注册操作的op字段会从数据中去掉，其他op字段按普通数据交给处理函数
+        """
+        op = self.operation_for(data)
+        if self.has_operation(data.get('op')):
+            data = {key: value for key, value in data.items() if key != 'op'}
+        return op, data
+
+    def dispatch(self, data: Dict[str, Any]) -> Any:
+        """分发请求到对应的处理函数"""
+        op, payload = self.resolve(data)
+        if op is None:
+            return f"错误: 未知的操作 {data.get('op')}，可用操作: {', '.join(self._handlers)}"
+
+        handler = self._handlers[op]
+        start = time.perf_counter()
+        failed = False
+        try:
+            return handler(payload)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.stats_lock:
+                counter = self._counters[op]
+                counter["calls"] += 1
+                counter["errors"] += int(failed)
+                counter["total_time"] += elapsed
+                counter["max_time"] = max(counter["max_time"], elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        """各操作的调用统计（耗时单位为毫秒）"""
+        with self.stats_lock:
+            result = {}
+            for op, counter in self._counters.items():
+                calls = counter["calls"]
+                result[op] = {
+                    "calls": calls,
+                    "errors": counter["errors"],
+                    "avg_ms": round(counter["total_time"] * 1000 / calls, 3) if calls else 0.0,
+                    "max_ms": round(counter["max_time"] * 1000, 3),
+                }
+            return result
+
+
+def load_plugins(router: OperationRouter, server: Any, module_names: List[str]):
+    """导入插件模块并调用其register_operations(router, server)注册新操作"""
+    logger = logging.getLogger(__name__)
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        register = getattr(module, 'register_operations', None)
+        if not callable(register):
+            raise ImportError(f"插件 {module_name} 缺少 register_operations(router, server) 函数")
+        register(router, server)
+        logger.info(f"已加载插件: {module_name}")
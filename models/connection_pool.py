@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite连接池
+为DatabaseManager和各业务服务提供可复用的数据库连接，避免每个请求都重新打开/关闭数据库
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+
+# 持久性配置档：journal_mode由DatabaseManager.init_database设置一次（数据库级别），
+# 其余PRAGMA在每个新连接创建时执行一次（连接级别）
+DURABILITY_PROFILES = {
+    # 与旧版本一致：回滚日志，完全同步
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+    # WAL + 完全同步：每次提交都落盘，掉电不丢已提交事务
+    'safe': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 0,
+        'busy_timeout': 5000,
+    },
+    # WAL + NORMAL：读写并发，掉电最多丢失最近一次检查点之后的提交
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 134217728,
+        'busy_timeout': 5000,
+    },
+    # WAL + 不同步：吞吐最高，仅用于测试或可重建的数据
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'busy_timeout': 10000,
+    },
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# 数据库级别的PRAGMA，不在每个连接上重复设置
+DATABASE_PRAGMAS = ('journal_mode',)
+
+# 每个新连接创建时执行一次的PRAGMA
+DEFAULT_PRAGMAS = {
+    name: value for name, value in DURABILITY_PROFILES[DEFAULT_PROFILE].items()
+    if name not in DATABASE_PRAGMAS
+}
+
+
+def profile_pragmas(profile: str = DEFAULT_PROFILE, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """返回持久性配置档对应的全部PRAGMA（overrides中的值覆盖配置档）"""
+    if profile not in DURABILITY_PROFILES:
+        raise ValueError(f"未知的持久性配置档: {profile}，可选: {list(DURABILITY_PROFILES)}")
+    pragmas = dict(DURABILITY_PROFILES[profile])
+    pragmas.update(overrides or {})
+    return pragmas
+
+
+def connection_pragmas(pragmas: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉数据库级别的PRAGMA，只保留需要在每个连接上设置的部分"""
+    return {name: value for name, value in pragmas.items() if name not in DATABASE_PRAGMAS}
+
+
+class ConnectionPool:
+    """有界SQLite连接池
+
+    - 同一线程内嵌套获取连接时复用同一个连接（每线程一个连接）
+    - 连接总数不超过max_size，连接耗尽时等待其他线程归还
+    - 连接空闲超过health_check_interval秒后，取出前先做健康检查
+    - PRAGMA只在创建连接时执行一次
+    """
+
+    def __init__(self, db_path: str, max_size: int = 8, timeout: float = 10.0,
+                 health_check_interval: float = 30.0, pragmas: Optional[Dict[str, Any]] = None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = connection_pragmas(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.logger = logging.getLogger(__name__)
+
+        self._idle = []  # [(conn, 上次归还时间)]，后进先出，优先复用刚用过的连接
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    @contextmanager
+    def connection(self):
+        """取出一个连接，用法: with pool.connection() as conn: ...
+
+        退出时未提交的事务会被回滚；发生异常时先回滚再把异常抛出
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # 同一线程嵌套使用，直接复用外层连接，由外层负责归还
+            yield conn
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def acquire(self) -> sqlite3.Connection:
+        """取出一个不与当前线程绑定的连接（流式查询在多个线程中分块读取），用完后必须调用release归还"""
+        return self._checkout()
+
+    def release(self, conn: sqlite3.Connection):
+        """归还acquire取出的连接"""
+        self._checkin(conn)
+
+    def pin_thread_connection(self, conn: Optional[sqlite3.Connection]):
+        """把当前线程的连接固定为conn（传None取消固定）
+
+        用于写线程：写任务内部调用pool.connection()时拿到的是写线程自己的连接，
+        从而能看到本事务内尚未提交的修改，也不会与写线程争用写锁
+        """
+        self._local.conn = conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        """从池中取出连接，必要时创建新连接或等待"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("连接池已关闭")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"获取数据库连接超时（连接池上限 {self.max_size}）")
+                self._cond.wait(remaining)
+
+        try:
+            if conn is not None and time.monotonic() - last_used > self.health_check_interval:
+                if not self._is_healthy(conn):
+                    self.logger.warning("数据库连接健康检查失败，重新建立连接")
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self._create_connection()
+            return conn
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _checkin(self, conn: sqlite3.Connection):
+        """归还连接，回滚未提交的事务"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            self.logger.warning(f"归还连接时回滚失败，丢弃该连接: {e}")
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """创建新连接并执行一次PRAGMA设置"""
+        # 连接会在不同线程间流转（同一时刻只被一个线程使用），因此关闭线程检查
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池状态"""
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+            }
+
+    def close(self):
+        """关闭连接池，空闲连接立即关闭，使用中的连接在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: Dict[str, Any]):
+    """在连接上执行PRAGMA设置"""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, **kwargs) -> ConnectionPool:
+    """获取指定数据库文件的共享连接池（同一数据库文件只创建一个连接池）"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(db_path, **kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def close_all_pools():
+    """关闭所有共享连接池"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
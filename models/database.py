@@ -10,202 +10,281 @@ import logging
 import os
 from datetime import datetime
 
+from models.connection_pool import get_pool, profile_pragmas, DEFAULT_PROFILE
+from models.write_queue import get_write_queue
+
+
+# 业务查询所需的二级索引（索引名, 建索引语句）
+INDEX_DEFINITIONS = [
+    # 按手机号查患者：create_appointment、update_patient_info、query_appointments
+    ('idx_patients_phone', 'CREATE INDEX IF NOT EXISTS idx_patients_phone ON patients(phone)'),
+    # 按姓名查患者：query_patient_info
+    ('idx_patients_name', 'CREATE INDEX IF NOT EXISTS idx_patients_name ON patients(name)'),
+    # 按姓名查医生：create_appointment、query_doctor_info、query_appointments
+    ('idx_doctors_name', 'CREATE INDEX IF NOT EXISTS idx_doctors_name ON doctors(name)'),
+    # 医生当天排队数：create_appointment 中 doctor_id = ? AND DATE(appointment_time) = DATE(?)
+    ('idx_appointments_doctor_day',
+     'CREATE INDEX IF NOT EXISTS idx_appointments_doctor_day ON appointments(doctor_id, DATE(appointment_time))'),
+    # 按日期查预约：query_appointments 中 DATE(a.appointment_time) = ?
+    ('idx_appointments_day',
+     'CREATE INDEX IF NOT EXISTS idx_appointments_day ON appointments(DATE(appointment_time))'),
+    # 按患者查预约：query_appointments 的连接条件
+    ('idx_appointments_patient', 'CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id)'),
+]
+
+# 数据库结构迁移（版本号, 说明, 执行的语句），已执行到的版本记录在 PRAGMA user_version 中
+SCHEMA_MIGRATIONS = [
+    (1, '创建业务查询二级索引', [sql for _, sql in INDEX_DEFINITIONS] + ['ANALYZE']),
+]
+
+# sql_query中不允许执行的授权动作：事务控制语句（BEGIN/COMMIT/END/ROLLBACK）和SAVEPOINT/RELEASE，
+# 写操作由写线程统一管理事务，这类语句会提前提交或回滚整个组提交批次
+TRANSACTION_ACTIONS = (sqlite3.SQLITE_TRANSACTION, sqlite3.SQLITE_SAVEPOINT)
+
+
+class RowStream:
+    """流式SELECT的结果：每次用fetchmany读取chunk_rows行，内存中不保留整个结果集
+
+    迭代结束后连接仍被占用，需要调用close归还（可以在取出连接之外的线程中调用）
+    """
+
+    def __init__(self, pool, conn, cursor, chunk_rows):
+        self.pool = pool
+        self.conn = conn
+        self.cursor = cursor
+        self.chunk_rows = chunk_rows
+        self.columns = [description[0] for description in cursor.description]
+        self.row_count = 0
+
+    def __iter__(self):
+        while self.cursor is not None:
+            rows = self.cursor.fetchmany(self.chunk_rows)
+            if not rows:
+                return
+            self.row_count += len(rows)
+            yield rows
+
+    def close(self):
+        """结束查询并归还连接，可以重复调用"""
+        if self.cursor is None:
+            return
+        cursor, self.cursor = self.cursor, None
+        try:
+            cursor.close()
+        finally:
+            self.pool.release(self.conn)
+
 
 class DatabaseManager:
-    def __init__(self, db_path='/medical/MedicalSystem.db'):
+    def __init__(self, db_path='/medical/MedicalSystem.db', pool=None, writer=None, pragmas=None):
         self.db_path = db_path
+        # 持久性配置（journal_mode、synchronous、cache_size、mmap_size、busy_timeout）
+        self.pragmas = pragmas or profile_pragmas(DEFAULT_PROFILE)
+        self.pool = pool or get_pool(db_path, pragmas=self.pragmas)
+        self.writer = writer or get_write_queue(db_path, pragmas=self.pragmas, pool=self.pool)
         self.logger = logging.getLogger(__name__)
         self.init_database()
     
     def init_database(self):
         """初始化数据库和创建必要的表（基于database.md中的医疗系统设计）"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 启用外键约束
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            # 1. 创建用户表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,  -- 手机号或工号
-                    password_hash TEXT NOT NULL,    -- 密码哈希
-                    role TEXT NOT NULL CHECK(role IN ('patient', 'doctor')),  -- 角色
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # 2. 创建患者信息表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS patients (
-                    patient_id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    birth_date DATE,
-                    id_card TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (patient_id) REFERENCES users(user_id)
-                )
-            ''')
-            
-            # 3. 创建医生信息表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS doctors (
-                    doctor_id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    employee_id TEXT UNIQUE NOT NULL,
-                    department TEXT,
-                    photo_path TEXT,
-                    max_patients INTEGER DEFAULT 30,
-                    fee REAL,
-                    work_schedule TEXT,  -- JSON格式
-                    is_available BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (doctor_id) REFERENCES users(user_id)
-                )
-            ''')
-            
-            # 4. 创建预约挂号表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS appointments (
-                    appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_id INTEGER NOT NULL,
-                    doctor_id INTEGER NOT NULL,
-                    appointment_time TIMESTAMP NOT NULL,
-                    status TEXT NOT NULL CHECK(status IN ('pending', 'completed', 'cancelled')),
-                    fee_paid BOOLEAN DEFAULT 0,
-                    queue_number INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 5. 创建病历表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS medical_records (
-                    record_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_id INTEGER NOT NULL,
-                    doctor_id INTEGER NOT NULL,
-                    diagnosis TEXT,
-                    symptoms TEXT,
-                    visit_time TIMESTAMP NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 6. 创建医嘱表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS medical_orders (
-                    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    record_id INTEGER NOT NULL,
-                    doctor_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (record_id) REFERENCES medical_records(record_id),
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 7. 创建处方表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS prescriptions (
-                    prescription_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    record_id INTEGER NOT NULL,
-                    doctor_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,  -- 药品、用法
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (record_id) REFERENCES medical_records(record_id),
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 8. 创建打卡记录表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS attendance (
-                    attendance_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    doctor_id INTEGER NOT NULL,
-                    check_in_time TIMESTAMP NOT NULL,
-                    check_out_time TIMESTAMP,
-                    status TEXT NOT NULL CHECK(status IN ('present', 'absent')),
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 9. 创建聊天记录表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chat_messages (
-                    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sender_id INTEGER NOT NULL,
-                    receiver_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_read BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (sender_id) REFERENCES users(user_id),
-                    FOREIGN KEY (receiver_id) REFERENCES users(user_id)
-                )
-            ''')
-            
-            # 10. 创建请假表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS leave_requests (
-                    leave_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    doctor_id INTEGER NOT NULL,
-                    start_date DATE NOT NULL,
-                    end_date DATE NOT NULL,
-                    reason TEXT,
-                    status TEXT NOT NULL CHECK(status IN ('pending', 'approved', 'rejected')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 11. 创建住院信息表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS hospitalizations (
-                    hospitalization_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_id INTEGER NOT NULL,
-                    doctor_id INTEGER NOT NULL,
-                    ward_number TEXT,
-                    bed_number TEXT,
-                    admission_date DATE NOT NULL,
-                    discharge_date DATE,
-                    status TEXT NOT NULL CHECK(status IN ('admitted', 'discharged')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
-                    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
-                )
-            ''')
-            
-            # 创建测试用表（保持兼容性）
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS students (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    age INTEGER,
-                    student_id INTEGER UNIQUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS default_table (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    data TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # 插入示例数据（如果表是空的）
-            self.insert_sample_data(cursor)
-            
-            conn.commit()
-            conn.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # 设置日志模式（数据库级别，持久保存在数据库文件中）
+                journal_mode = self.pragmas.get('journal_mode')
+                if journal_mode:
+                    cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+                    self.logger.info(f"数据库日志模式: {cursor.fetchone()[0]}")
+                
+                # 启用外键约束
+                cursor.execute("PRAGMA foreign_keys = ON")
+                
+                # 1. 创建用户表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT UNIQUE NOT NULL,  -- 手机号或工号
+                        password_hash TEXT NOT NULL,    -- 密码哈希
+                        role TEXT NOT NULL CHECK(role IN ('patient', 'doctor')),  -- 角色
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # 2. 创建患者信息表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS patients (
+                        patient_id INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        birth_date DATE,
+                        id_card TEXT,
+                        phone TEXT,
+                        email TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (patient_id) REFERENCES users(user_id)
+                    )
+                ''')
+                
+                # 3. 创建医生信息表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS doctors (
+                        doctor_id INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        employee_id TEXT UNIQUE NOT NULL,
+                        department TEXT,
+                        photo_path TEXT,
+                        max_patients INTEGER DEFAULT 30,
+                        fee REAL,
+                        work_schedule TEXT,  -- JSON格式
+                        is_available BOOLEAN DEFAULT 1,
+                        FOREIGN KEY (doctor_id) REFERENCES users(user_id)
+                    )
+                ''')
+                
+                # 4. 创建预约挂号表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS appointments (
+                        appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        patient_id INTEGER NOT NULL,
+                        doctor_id INTEGER NOT NULL,
+                        appointment_time TIMESTAMP NOT NULL,
+                        status TEXT NOT NULL CHECK(status IN ('pending', 'completed', 'cancelled')),
+                        fee_paid BOOLEAN DEFAULT 0,
+                        queue_number INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 5. 创建病历表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS medical_records (
+                        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        patient_id INTEGER NOT NULL,
+                        doctor_id INTEGER NOT NULL,
+                        diagnosis TEXT,
+                        symptoms TEXT,
+                        visit_time TIMESTAMP NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 6. 创建医嘱表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS medical_orders (
+                        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        record_id INTEGER NOT NULL,
+                        doctor_id INTEGER NOT NULL,
+                        content TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (record_id) REFERENCES medical_records(record_id),
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 7. 创建处方表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS prescriptions (
+                        prescription_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        record_id INTEGER NOT NULL,
+                        doctor_id INTEGER NOT NULL,
+                        content TEXT NOT NULL,  -- 药品、用法
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (record_id) REFERENCES medical_records(record_id),
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 8. 创建打卡记录表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS attendance (
+                        attendance_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        doctor_id INTEGER NOT NULL,
+                        check_in_time TIMESTAMP NOT NULL,
+                        check_out_time TIMESTAMP,
+                        status TEXT NOT NULL CHECK(status IN ('present', 'absent')),
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 9. 创建聊天记录表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_messages (
+                        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        sender_id INTEGER NOT NULL,
+                        receiver_id INTEGER NOT NULL,
+                        content TEXT NOT NULL,
+                        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_read BOOLEAN DEFAULT 0,
+                        FOREIGN KEY (sender_id) REFERENCES users(user_id),
+                        FOREIGN KEY (receiver_id) REFERENCES users(user_id)
+                    )
+                ''')
+                
+                # 10. 创建请假表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS leave_requests (
+                        leave_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        doctor_id INTEGER NOT NULL,
+                        start_date DATE NOT NULL,
+                        end_date DATE NOT NULL,
+                        reason TEXT,
+                        status TEXT NOT NULL CHECK(status IN ('pending', 'approved', 'rejected')),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 11. 创建住院信息表
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS hospitalizations (
+                        hospitalization_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        patient_id INTEGER NOT NULL,
+                        doctor_id INTEGER NOT NULL,
+                        ward_number TEXT,
+                        bed_number TEXT,
+                        admission_date DATE NOT NULL,
+                        discharge_date DATE,
+                        status TEXT NOT NULL CHECK(status IN ('admitted', 'discharged')),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
+                        FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+                    )
+                ''')
+                
+                # 创建测试用表（保持兼容性）
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS students (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT NOT NULL,
+                        age INTEGER,
+                        student_id INTEGER UNIQUE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS default_table (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        data TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # 执行结构迁移（对已有的数据库文件补建索引等）
+                self.migrate_schema(cursor)
+                
+                # 插入示例数据（如果表是空的）
+                self.insert_sample_data(cursor)
+                
+                conn.commit()
+                
+                # 连接会归还到连接池，恢复默认设置，保证所有池化连接行为一致
+                cursor.execute("PRAGMA foreign_keys = OFF")
             
             self.logger.info(f"数据库初始化完成: {self.db_path}")
             self.logger.info("已创建医疗系统完整表结构")
@@ -216,6 +295,32 @@ class DatabaseManager:
         except Exception as e:
             self.logger.error(f"数据库初始化失败: {e}")
     
+    def migrate_schema(self, cursor):
+        """把数据库结构从 user_version 记录的版本迁移到最新版本"""
+        cursor.execute("PRAGMA user_version")
+        current_version = cursor.fetchone()[0]
+        
+        for version, description, statements in SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            self.logger.info(f"执行数据库迁移 v{version}: {description}")
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            current_version = version
+        
+        # 索引可能被手工删除，每次启动都确认一遍（IF NOT EXISTS，已存在时开销可忽略）
+        self.ensure_indexes(cursor)
+    
+    def ensure_indexes(self, cursor):
+        """创建缺失的二级索引"""
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        existing = {row[0] for row in cursor.fetchall()}
+        for name, sql in INDEX_DEFINITIONS:
+            if name not in existing:
+                cursor.execute(sql)
+                self.logger.info(f"已创建索引: {name}")
+    
     def insert_sample_data(self, cursor):
         """插入示例数据"""
         try:
@@ -341,64 +446,92 @@ class DatabaseManager:
     def show_database_status(self):
         """显示数据库状态"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 医疗系统主要表
-            medical_tables = [
-                'users', 'patients', 'doctors', 'appointments', 
-                'medical_records', 'medical_orders', 'prescriptions', 
-                'attendance', 'chat_messages', 'leave_requests', 'hospitalizations'
-            ]
-            
-            # 测试表
-            test_tables = ['students', 'default_table']
-            
-            self.logger.info("=== 医疗系统数据库状态 ===")
-            for table in medical_tables:
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = cursor.fetchone()[0]
-                    self.logger.info(f"{table} 表: {count} 条记录")
-                except Exception as e:
-                    self.logger.warning(f"无法查询表 {table}: {e}")
-            
-            self.logger.info("=== 测试表状态 ===")
-            for table in test_tables:
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = cursor.fetchone()[0]
-                    self.logger.info(f"{table} 表: {count} 条记录")
-                except Exception as e:
-                    self.logger.warning(f"无法查询表 {table}: {e}")
-            
-            conn.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # 医疗系统主要表
+                medical_tables = [
+                    'users', 'patients', 'doctors', 'appointments', 
+                    'medical_records', 'medical_orders', 'prescriptions', 
+                    'attendance', 'chat_messages', 'leave_requests', 'hospitalizations'
+                ]
+                
+                # 测试表
+                test_tables = ['students', 'default_table']
+                
+                self.logger.info("=== 医疗系统数据库状态 ===")
+                for table in medical_tables:
+                    try:
+                        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                        count = cursor.fetchone()[0]
+                        self.logger.info(f"{table} 表: {count} 条记录")
+                    except Exception as e:
+                        self.logger.warning(f"无法查询表 {table}: {e}")
+                
+                self.logger.info("=== 测试表状态 ===")
+                for table in test_tables:
+                    try:
+                        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                        count = cursor.fetchone()[0]
+                        self.logger.info(f"{table} 表: {count} 条记录")
+                    except Exception as e:
+                        self.logger.warning(f"无法查询表 {table}: {e}")
+                
             
         except Exception as e:
             self.logger.error(f"查看数据库状态失败: {e}")
     
     def execute_sql(self, sql_query):
-        """执行SQL查询"""
+        """执行SQL查询（SELECT走连接池并行读，其余语句交给写线程执行）"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(sql_query)
-
             if sql_query.strip().upper().startswith('SELECT'):
-                result = cursor.fetchall()
-                columns = [description[0] for description in cursor.description]
-                conn.close()
-                return {"columns": columns, "data": result}
-            else:
-                conn.commit()
-                conn.close()
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(sql_query)
+                    result = cursor.fetchall()
+                    columns = [description[0] for description in cursor.description]
+                    return {"columns": columns, "data": result}
+
+            denied = []
+
+            def authorize(action, *args):
+                if action in TRANSACTION_ACTIONS:
+                    denied.append(action)
+                    return sqlite3.SQLITE_DENY
+                return sqlite3.SQLITE_OK
+
+            def execute(conn):
+                # 授权回调在编译语句时检查，语句前面加注释等写法也绕不过去
+                conn.set_authorizer(authorize)
+                try:
+                    conn.cursor().execute(sql_query)
+                except sqlite3.DatabaseError as e:
+                    if denied:
+                        raise ValueError("sql_query不支持事务控制语句") from e
+                    raise
+                finally:
+                    conn.set_authorizer(None)
                 return "执行成功"
 
+            return self.writer.execute(execute)
+
         except Exception as e:
-            if 'conn' in locals() and conn:
-                conn.close()
             raise e
     
+    def stream_sql(self, sql_query, chunk_rows=500):
+        """流式执行SELECT：取出一个连接执行查询，返回分块读取结果的RowStream，读完后调用close归还连接"""
+        if not sql_query.strip().upper().startswith('SELECT'):
+            raise ValueError("流式查询只支持SELECT语句")
+
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_query)
+        except BaseException:
+            self.pool.release(conn)
+            raise
+        return RowStream(self.pool, conn, cursor, chunk_rows)
+    
     def insert_data(self, data, table_name):
         """将数据插入到数据库表中"""
         try:
@@ -409,16 +542,11 @@ class DatabaseManager:
             placeholders = ', '.join(['?'] * len(data))
             sql_insert = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(sql_insert, list(data.values()))
-            conn.commit()
-            conn.close()
+            def insert(conn):
+                conn.cursor().execute(sql_insert, list(data.values()))
+                return f"成功插入数据到表 {table_name}"
 
-            return f"成功插入数据到表 {table_name}"
+            return self.writer.execute(insert)
 
         except Exception as e:
-            if 'conn' in locals() and conn:
-                conn.rollback()
-                conn.close()
             raise e
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite单写线程队列
+所有INSERT/UPDATE类操作都提交到同一个写线程串行执行，并把排队中的多个写任务合并到
+一个事务中提交；读操作仍然通过连接池并行执行（WAL模式下读写互不阻塞）
+"""
+
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from models.connection_pool import ConnectionPool, DEFAULT_PRAGMAS, apply_pragmas, connection_pragmas
+
+
+class WriteQueueStopped(RuntimeError):
+    """写线程已停止，不再接受写任务"""
+
+
+class WriteQueue:
+    """单写线程
+
+    execute(fn)把fn(conn)放到写线程中执行并等待结果：
+    - 每个写任务运行在独立的SAVEPOINT中，任务抛出异常只回滚该任务自己的修改
+    - 写线程一次最多取出max_batch个排队任务，放在同一个事务里提交（组提交）
+    - execute返回时事务已经提交；提交失败时同一批次的所有任务都会收到异常
+    - stop之后提交的写任务直接抛出WriteQueueStopped，不会再启动写线程
+    - 写任务不能自行commit/rollback
+    - 写任务中调用execute时直接在当前事务中执行（嵌套SAVEPOINT），此时需要在提交后才做的事情
+      （如缓存失效）用after_commit登记
+    """
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Any]] = None,
+                 pool: Optional[ConnectionPool] = None, max_batch: int = 64):
+        self.db_path = db_path
+        self.pragmas = connection_pragmas(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.pool = pool
+        self.max_batch = max_batch
+        self.logger = logging.getLogger(__name__)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._savepoint_seq = 0
+        self._conn = None
+        self._after_commit = []  # 当前事务提交后要执行的回调，只在写线程中访问
+
+        self.stats_lock = threading.Lock()
+        self.committed_batches = 0
+        self.committed_jobs = 0
+        self.failed_jobs = 0
+
+    def start(self):
+        """启动写线程（首次提交任务时自动调用）"""
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        if self._stopped:
+            raise WriteQueueStopped("数据库写线程已停止")
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    @property
+    def stopped(self) -> bool:
+        """是否已经调用过stop"""
+        return self._stopped
+
+    def execute(self, fn: Callable[[sqlite3.Connection], Any], timeout: Optional[float] = None) -> Any:
+        """在写线程中执行fn(conn)，返回fn的返回值（事务提交之后才返回）"""
+        if threading.current_thread() is self._thread:
+            # 写任务内部再次提交写操作时直接在当前事务中执行（嵌套SAVEPOINT）
+            return self._run_job(fn)
+
+        future = Future()
+        # 与stop持有同一把锁：任务要么排在停止标记之前被执行，要么直接失败
+        with self._lock:
+            self._start_locked()
+            self._queue.put((fn, future))
+        return future.result(timeout)
+
+    def in_writer_thread(self) -> bool:
+        """当前是否在写线程中（即处于尚未提交的写事务内）"""
+        return threading.current_thread() is self._thread
+
+    def after_commit(self, callback: Callable[..., Any], *args):
+        """在当前写事务提交之后调用callback(*args)
+
+        写线程之外调用时事务已经提交（execute已返回），立即执行；
+        写任务内部调用时推迟到事务提交之后，所在的写任务失败回滚或事务提交失败时不执行
+        """
+        if not self.in_writer_thread():
+            callback(*args)
+            return
+        self._after_commit.append((callback, args))
+
+    def pending(self) -> int:
+        """排队中的写任务数"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """写线程状态"""
+        with self.stats_lock:
+            return {
+                "pending": self.pending(),
+                "committed_batches": self.committed_batches,
+                "committed_jobs": self.committed_jobs,
+                "failed_jobs": self.failed_jobs,
+            }
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """处理完已排队的任务后停止写线程，之后提交的写任务直接失败"""
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+            if thread and thread.is_alive():
+                self._queue.put(None)
+        if thread:
+            thread.join(timeout)
+
+    def checkpoint(self, mode: str = 'TRUNCATE') -> Optional[Tuple[int, int, int]]:
+        """把WAL中的内容合并回数据库文件（停止写线程之后调用）
+
+        返回(是否被阻塞, WAL页数, 已合并页数)，数据库不是WAL模式时返回None
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        try:
+            apply_pragmas(conn, self.pragmas)
+            if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != 'wal':
+                return None
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+        finally:
+            conn.close()
+
+    def _run(self):
+        """写线程主循环"""
+        # isolation_level=None：由写线程显式控制事务边界
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        apply_pragmas(conn, self.pragmas)
+        self._conn = conn
+        if self.pool:
+            self.pool.pin_thread_connection(conn)
+        self.logger.info(f"数据库写线程已启动: {self.db_path}")
+
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+
+                batch = [job]
+                stop_after_batch = False
+                while len(batch) < self.max_batch:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stop_after_batch = True
+                        break
+                    batch.append(job)
+
+                self._run_batch(conn, batch)
+                if stop_after_batch:
+                    break
+        finally:
+            if self.pool:
+                self.pool.pin_thread_connection(None)
+            conn.close()
+            self._conn = None
+            self._fail_pending()
+            self.logger.info("数据库写线程已停止")
+
+    def _fail_pending(self):
+        """写线程退出时让还在排队的任务失败，避免调用方无限等待"""
+        failed = 0
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job[1].set_running_or_notify_cancel():
+                job[1].set_exception(WriteQueueStopped("数据库写线程已停止"))
+                failed += 1
+        if failed:
+            with self.stats_lock:
+                self.failed_jobs += failed
+
+    def _run_batch(self, conn: sqlite3.Connection, batch):
+        """在一个事务中执行一批写任务"""
+        outcomes = []
+        self._after_commit = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for _, future in batch:
+                future.set_exception(e)
+            with self.stats_lock:
+                self.failed_jobs += len(batch)
+            return
+
+        for fn, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                outcomes.append((future, self._run_job(fn), None))
+            except BaseException as e:
+                outcomes.append((future, None, e))
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.logger.error(f"写事务提交失败，回滚 {len(batch)} 个写任务: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            for future, _, _ in outcomes:
+                future.set_exception(e)
+            with self.stats_lock:
+                self.failed_jobs += len(outcomes)
+            self._after_commit = []
+            return
+
+        # 先执行提交后回调（如缓存失效），再唤醒等待结果的调用方
+        callbacks, self._after_commit = self._after_commit, []
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error(f"写事务提交后回调执行失败: {e}")
+
+        failed = 0
+        for future, result, error in outcomes:
+            if error is not None:
+                failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        with self.stats_lock:
+            self.committed_batches += 1
+            self.committed_jobs += len(outcomes) - failed
+            self.failed_jobs += failed
+
+    def _run_job(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在SAVEPOINT中执行单个写任务"""
+        conn = self._conn
+        self._savepoint_seq += 1
+        name = f"write_job_{self._savepoint_seq}"
+        registered = len(self._after_commit)
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            # 回滚的修改不需要提交后回调
+            del self._after_commit[registered:]
+            raise
+        conn.execute(f"RELEASE {name}")
+        return result
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_write_queue(db_path: str, **kwargs) -> WriteQueue:
+    """获取指定数据库文件的共享写线程（同一数据库文件只有一个写线程）"""
+    key = os.path.abspath(db_path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer.stopped:
+            writer = WriteQueue(db_path, **kwargs)
+            _writers[key] = writer
+        return writer
+
+
+def stop_all_write_queues():
+    """停止所有共享写线程"""
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.stop()
+        _writers.clear()
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+连接池客户端
+AsyncJSONClient（asyncio）维护一组到服务器的持久连接，供压力测试、远程测试等工具复用，
+不再像JSONProtocolClient.send_json_data那样每个请求新建连接并在关闭前等待0.1秒：
+- 连接池：优先使用空闲连接，池未满时新建连接，池满时等待或在已有连接上流水线发送
+- 流水线：请求文件名带 ";id=N"，响应按request_id匹配；连接上收到第二个响应（证明服务器开启了持久连接）
+  且服务器回传了request_id之后，才在该连接上同时发送多个请求（最多max_pipeline个）
+- 服务器未开启持久连接时（复用的连接在第一个响应之后很快被关闭）自动改为每个请求一个连接，收到响应后立即关闭
+- 每个连接最多发送max_requests_per_connection个请求（与服务器默认的单连接请求上限一致），
+  不在服务器即将关闭的连接上发送请求
+- 超时：connect_timeout（建立连接）和request_timeout（单次尝试等待可用连接和响应）
+- 重试：服务器繁忙（server_busy）按retry_after重试；请求没有发出（连接失败、发送失败）时任何操作都可以重发；
+  请求发出之后的连接中断和超时只对只读操作重试（无法确定服务器是否已经执行了写操作）；
+  重试间隔为带随机抖动的指数退避；服务器是否开启持久连接确认（某个连接收到两个响应）之前，写操作只用新连接
+- 对冲读：只读操作在hedge_after秒内没有响应时，在另一个连接上再发送一次，取先返回的结果
+PooledJSONClient是同步外观：在后台线程中运行事件循环，可以被多个线程同时使用，
+send_json_data的用法和返回值与JSONProtocolClient相同
+"""
+
+import random
+import struct
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Set
+
+from network.codec import get_codec, frame_name
+from network.compression import CompressedCodec, get_compressor
+from network.listener import parse_unix_target
+
+
+HEADER = struct.Struct("!I")
+
+# 不修改数据、超时或连接中断后可以安全重试和对冲的操作
+IDEMPOTENT_OPERATIONS = frozenset({'query_doctor_info', 'query_patient_info', 'query_appointments',
+                                   'server_stats', 'login'})
+
+# 旧格式请求（不带op）的识别键，顺序与服务器注册内置操作的顺序相同
+LEGACY_OPERATION_KEYS = ('reset_password', 'register_patient', 'register_doctor', 'login',
+                         'reset_patient_information', 'reset_doctor_information', 'query_doctor_info',
+                         'query_patient_info', 'sql_query', 'create_appointment', 'query_appointments',
+                         'cancel_appointment', 'update_appointment_status')
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_MAX_PIPELINE = 16
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_REQUEST_TIMEOUT = 30.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.05
+DEFAULT_BACKOFF_MAX = 2.0
+# 与服务器默认的单连接请求上限（--max-requests-per-conn）一致
+DEFAULT_MAX_REQUESTS_PER_CONNECTION = 100
+
+# 服务器未开启持久连接时，一次性连接在响应之后CLOSE_DELAY（1秒）关闭；
+# 复用的连接在第一个响应之后这么多秒内被关闭才认为服务器不支持持久连接（更晚的关闭是空闲超时）
+ONE_SHOT_CLOSE_WINDOW = 5.0
+
+
+def operation_name(data: Dict[str, Any]) -> Optional[str]:
+    """请求对应的操作名（显式op字段或旧格式识别键）"""
+    op = data.get('op')
+    if isinstance(op, str):
+        return op
+    return next((key for key in LEGACY_OPERATION_KEYS if key in data), None)
+
+
+def is_idempotent(data: Dict[str, Any]) -> bool:
+    """请求是否为只读操作（SELECT语句的sql_query也视为只读）"""
+    op = operation_name(data)
+    if op == 'sql_query':
+        sql = data.get('sql_query')
+        return isinstance(sql, str) and sql.lstrip().upper().startswith('SELECT')
+    return op in IDEMPOTENT_OPERATIONS
+
+
+class ConnectionLost(ConnectionError):
+    """连接在收到响应之前中断；resend_safe表示请求没有发出（发送失败），服务器不会处理，任何操作都可以重发"""
+
+    def __init__(self, message: str, resend_safe: bool = False):
+        super().__init__(message)
+        self.resend_safe = resend_safe
+
+
+class PooledConnection:
+    """连接池中的一个连接：发送请求帧，后台任务读取响应并按request_id完成对应的Future"""
+
+    def __init__(self, client: 'AsyncJSONClient', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.client = client
+        self.reader = reader
+        self.writer = writer
+        # request_id -> Future
+        self.pending = {}
+        self.sent = 0
+        self.served = 0
+        # 收到第一个响应的时间（判断服务器是否在响应之后立即关闭连接）
+        self.first_response_at = None
+        # 服务器在响应中回传了request_id
+        self.echoes_id = False
+        self.closed = False
+        self.read_task = asyncio.ensure_future(self.read_loop())
+
+    def capacity(self) -> int:
+        """还能同时发送的请求数"""
+        if self.closed:
+            return 0
+        client = self.client
+        if not client.keep_alive:
+            return 0 if (self.pending or self.served) else 1
+        if self.sent >= client.max_requests_per_connection:
+            # 服务器处理完这些请求后会关闭连接
+            return 0
+        if client.pipeline and self.served >= 2 and self.echoes_id:
+            return client.max_pipeline - len(self.pending)
+        return 0 if self.pending else 1
+
+    async def send(self, request_id: str, name: bytes, body: bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.sent += 1
+        self.writer.writelines((HEADER.pack(len(name)), name, HEADER.pack(len(body)), body))
+        try:
+            await self.writer.drain()
+        except OSError as e:
+            # 请求没有发出，服务器不会处理；连接上已经发出的其他请求仍然按连接中断处理
+            self.pending.pop(request_id, None)
+            future.set_exception(ConnectionLost(f"发送请求时连接中断: {e}", resend_safe=True))
+            self.close(ConnectionLost(f"发送请求时连接中断: {e}"))
+        return future
+
+    def abandon(self, request_id: str):
+        """不再等待请求的响应（超时或对冲请求被取消）：释放占用的名额；
+        服务器不回传request_id时响应按顺序对应，之后的响应无法对齐，关闭连接"""
+        if self.pending.pop(request_id, None) is None:
+            return
+        if self.echoes_id:
+            self.client.notify_available()
+        else:
+            self.close(ConnectionLost("请求已放弃"))
+
+    async def read_loop(self):
+        error = ConnectionLost("连接已被服务器关闭")
+        try:
+            while True:
+                header = await self.reader.readexactly(HEADER.size)
+                body = await self.reader.readexactly(HEADER.unpack(header)[0])
+                response = self.client.codec.decode(body)
+                self.served += 1
+                if self.served == 1:
+                    self.first_response_at = asyncio.get_running_loop().time()
+                if self.served >= 2:
+                    self.client.keep_alive_confirmed = True
+                request_id = response.get('request_id') if isinstance(response, dict) else None
+                if request_id is not None:
+                    self.echoes_id = True
+                    entry = self.pending.pop(str(request_id), None)
+                elif self.pending:
+                    # 服务器没有回传request_id（不支持流水线），响应按发送顺序对应
+                    entry = self.pending.pop(next(iter(self.pending)))
+                else:
+                    entry = None
+                if entry is not None and not entry.done():
+                    entry.set_result(response)
+                if not self.client.keep_alive:
+                    break
+                self.client.notify_available()
+        except asyncio.IncompleteReadError:
+            pass
+        except asyncio.CancelledError:
+            error = ConnectionLost("客户端已关闭")
+        except Exception as e:
+            error = ConnectionLost(f"连接中断: {e}")
+        finally:
+            self.close(error)
+
+    def close(self, error: Optional[Exception] = None):
+        """关闭连接，未收到响应的请求以ConnectionLost结束（请求已经发出，服务器可能已经执行，不标记为可以重发）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.writer.close()
+        pending, self.pending = self.pending, {}
+        if pending and self.served == 1 and self.one_shot_close():
+            # 复用的连接在第一个响应之后很快被关闭：服务器没有开启持久连接
+            self.client.disable_keep_alive()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionLost(str(error or "连接已关闭")))
+        self.client.discard(self)
+
+    def one_shot_close(self) -> bool:
+        """连接的关闭是否像一次性连接（服务器在第一个响应之后立即关闭），而不是持久连接的空闲超时"""
+        client = self.client
+        if client.closed or client.keep_alive_confirmed or self.first_response_at is None:
+            return False
+        return asyncio.get_running_loop().time() - self.first_response_at < ONE_SHOT_CLOSE_WINDOW
+
+
+class AsyncJSONClient:
+    """asyncio连接池客户端（需要在同一个事件循环中使用）
+
+    host为 "unix:///路径" 时连接服务器的Unix域套接字（忽略port）；codec/compress的含义与JSONProtocolClient相同；
+    keep_alive为False时每个请求使用一个新连接（服务器未开启持久连接时也会自动切换）；
+    hedge_after为对冲读的等待秒数，None表示不对冲
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 55000, pool_size: int = DEFAULT_POOL_SIZE,
+                 keep_alive: bool = True, pipeline: bool = True, max_pipeline: int = DEFAULT_MAX_PIPELINE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX, hedge_after: Optional[float] = None,
+                 codec: str = 'json', compress: Optional[str] = None,
+                 max_requests_per_connection: int = DEFAULT_MAX_REQUESTS_PER_CONNECTION):
+        self.host = host
+        self.port = port
+        self.unix_path = parse_unix_target(host)
+        self.pool_size = max(1, pool_size)
+        self.keep_alive = keep_alive
+        self.pipeline = pipeline
+        self.max_pipeline = max(1, max_pipeline)
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.max_requests_per_connection = max(1, max_requests_per_connection)
+        self.codec = get_codec(codec)
+        self.compress = None
+        if compress:
+            names = [name.strip().lower() for name in compress.split(',') if name.strip()]
+            self.compress = ','.join(get_compressor(name).name for name in names)
+            self.codec = CompressedCodec(self.codec)
+
+        self.connections: Set[PooledConnection] = set()
+        # 已有连接收到过两个响应（服务器开启了持久连接）
+        self.keep_alive_confirmed = False
+        self.opening = 0
+        self.waiters: List[asyncio.Future] = []
+        self.next_request_id = 0
+        self.closed = False
+        self.counters = {'requests': 0, 'retries': 0, 'busy_retries': 0, 'hedged': 0, 'hedge_wins': 0,
+                         'connections_opened': 0, 'failures': 0}
+        self.logger = logging.getLogger(__name__)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """关闭所有连接，尚未收到响应的请求以ConnectionLost结束"""
+        self.closed = True
+        for conn in list(self.connections):
+            conn.read_task.cancel()
+            conn.close(ConnectionLost("客户端已关闭"))
+        self.notify_available()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, connections=len(self.connections), keep_alive=self.keep_alive,
+                    pipelining=sum(1 for conn in self.connections if conn.served >= 2 and conn.echoes_id))
+
+    async def request(self, data: Dict[str, Any], filename: str = "request.json",
+                      timeout: Optional[float] = None, retries: Optional[int] = None,
+                      idempotent: Optional[bool] = None, hedge_after: Optional[float] = None) -> Dict[str, Any]:
+        """发送一个请求，返回服务器响应（字典）
+
+        重试用尽后抛出最后一次的异常（ConnectionError、TimeoutError等）；服务器繁忙重试用尽时返回繁忙响应；
+        idempotent为None时按操作判断，hedge_after为None时使用客户端的设置
+        """
+        if data.get('stream'):
+            raise ValueError("连接池客户端不支持流式请求，请使用JSONProtocolClient.stream()")
+        self.counters['requests'] += 1
+        idempotent = is_idempotent(data) if idempotent is None else idempotent
+        retries = self.retries if retries is None else retries
+        hedge_after = self.hedge_after if hedge_after is None else hedge_after
+        name, body = self.encode_request(data, filename)
+
+        attempt = 0
+        while True:
+            try:
+                if idempotent and hedge_after is not None:
+                    response = await self.hedged_attempt(name, body, timeout, hedge_after)
+                else:
+                    response = await self.attempt(name, body, timeout, idempotent)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                resend_safe = getattr(e, 'resend_safe', False)
+                if attempt >= retries or not (idempotent or resend_safe) or self.closed:
+                    self.counters['failures'] += 1
+                    raise
+                attempt += 1
+                self.counters['retries'] += 1
+                # 请求没有发出（发送时连接已被服务器关闭）时立即重发，其他情况退避后重试
+                if not (isinstance(e, ConnectionLost) and resend_safe):
+                    await asyncio.sleep(self.backoff_delay(attempt))
+                continue
+
+            if isinstance(response, dict) and response.get('error_code') == 'server_busy' and attempt < retries:
+                # 请求没有被执行，任何操作都可以重试
+                attempt += 1
+                self.counters['busy_retries'] += 1
+                retry_after = response.get('retry_after') or 0
+                await asyncio.sleep(max(float(retry_after) * random.uniform(0.5, 1.0), self.backoff_delay(attempt)))
+                continue
+            return response
+
+    def backoff_delay(self, attempt: int) -> float:
+        """带随机抖动的指数退避（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def encode_request(self, data: Dict[str, Any], filename: str):
+        return frame_name(self.codec.name, filename, self.compress), self.codec.encode(data)
+
+    async def attempt(self, name: str, body: bytes, timeout: Optional[float], idempotent: bool = True,
+                      used: Optional[List[PooledConnection]] = None) -> Dict[str, Any]:
+        """在一个连接上发送一次请求并等待响应；超时或被取消时放弃该请求，释放连接上的名额"""
+        try:
+            conn = await self.acquire(idempotent, used or ())
+        except OSError as e:
+            # 请求没有发出（连接失败或等待可用连接超时），任何操作都可以重试
+            e.resend_safe = True
+            raise
+        if used is not None:
+            used.append(conn)
+        self.next_request_id += 1
+        request_id = str(self.next_request_id)
+        future = await conn.send(request_id, f"{name};id={request_id}".encode('utf-8'), body)
+        try:
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"等待响应超时（{timeout or self.request_timeout} 秒）") from None
+        finally:
+            conn.abandon(request_id)
+
+    async def hedged_attempt(self, name: str, body: bytes, timeout: Optional[float],
+                             hedge_after: float) -> Dict[str, Any]:
+        """hedge_after秒内没有响应时在另一个连接上再发送一次，返回先成功的响应"""
+        used = []
+        first = asyncio.ensure_future(self.attempt(name, body, timeout, True, used))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+        self.counters['hedged'] += 1
+        second = asyncio.ensure_future(self.attempt(name, body, timeout, True, used))
+        tasks = {first, second}
+        error = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.counters['hedge_wins'] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+                # 取消时请求可能刚好失败（如客户端关闭），取走结果避免"exception was never retrieved"警告
+                task.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+    async def acquire(self, idempotent: bool = True, avoid=()) -> PooledConnection:
+        """取一个可以发送请求的连接：空闲连接 > 新建连接（池未满）> 负载最低的流水线连接 > 等待"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout
+        while True:
+            if self.closed:
+                raise ConnectionError("客户端已关闭")
+            candidates = [conn for conn in self.connections if conn.capacity() > 0]
+            if not idempotent and not self.keep_alive_confirmed:
+                # 服务器是否开启持久连接尚未确认：写操作只用新连接（一次性连接上的第二个请求会因连接关闭而失败，
+                # 且无法判断请求是否已执行，不能重发），池满时关闭一个空闲的复用连接腾出名额
+                candidates = [conn for conn in candidates if not conn.served]
+                if not candidates and not self.can_open():
+                    reused = next((conn for conn in self.connections if conn.served and not conn.pending), None)
+                    if reused is not None:
+                        reused.close()
+            preferred = [conn for conn in candidates if conn not in avoid] or candidates
+            idle = [conn for conn in preferred if not conn.pending]
+            if idle and not (avoid and idle[0] in avoid and self.can_open()):
+                return idle[0]
+            if self.can_open():
+                return await self.open_connection()
+            if preferred:
+                return min(preferred, key=lambda conn: len(conn.pending))
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"等待可用连接超时（{self.request_timeout} 秒）")
+            waiter = loop.create_future()
+            self.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+
+    def can_open(self) -> bool:
+        return len(self.connections) + self.opening < self.pool_size
+
+    async def open_connection(self) -> PooledConnection:
+        self.opening += 1
+        try:
+            if self.unix_path is not None:
+                connect = asyncio.open_unix_connection(self.unix_path)
+            else:
+                connect = asyncio.open_connection(self.host, self.port)
+            try:
+                reader, writer = await asyncio.wait_for(connect, self.connect_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"连接服务器超时（{self.connect_timeout} 秒）") from None
+        finally:
+            self.opening -= 1
+            self.notify_available()
+        conn = PooledConnection(self, reader, writer)
+        self.connections.add(conn)
+        self.counters['connections_opened'] += 1
+        return conn
+
+    def discard(self, conn: PooledConnection):
+        self.connections.discard(conn)
+        self.notify_available()
+
+    def notify_available(self):
+        """唤醒等待连接的请求"""
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def disable_keep_alive(self):
+        if self.keep_alive:
+            self.keep_alive = False
+            self.logger.info("服务器未开启持久连接，改为每个请求使用一个新连接")
+
+
+class PooledJSONClient:
+    """AsyncJSONClient的同步外观：事件循环在后台线程中运行，可以被多个线程同时使用
+
+    参数与AsyncJSONClient相同；send_json_data出错时记录日志并返回None（与JSONProtocolClient相同），
+    request出错时抛出异常
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 55000, **options):
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncJSONClient(host, port, **options)
+        self.thread = threading.Thread(target=self.loop.run_forever, name='json-client-loop', daemon=True)
+        self.thread.start()
+        self.logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, data: Dict[str, Any], **kwargs) -> Future:
+        """发送请求，返回concurrent.futures.Future（不等待响应）"""
+        return asyncio.run_coroutine_threadsafe(self.client.request(data, **kwargs), self.loop)
+
+    def request(self, data: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        """发送请求并等待响应，重试用尽后抛出异常"""
+        return self.submit(data, **kwargs).result()
+
+    def send_json_data(self, data: Dict[str, Any], filename: str = "request.json") -> Optional[Dict[str, Any]]:
+        """发送JSON数据到服务器（与JSONProtocolClient.send_json_data相同，出错时返回None）"""
+        try:
+            return self.request(data, filename=filename)
+        except Exception as e:
+            self.logger.error(f"发送JSON数据时出错: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return asyncio.run_coroutine_threadsafe(self.stats_async(), self.loop).result()
+
+    async def stats_async(self) -> Dict[str, Any]:
+        return self.client.stats()
+
+    def close(self):
+        """关闭连接并停止事件循环"""
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
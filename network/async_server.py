@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio网络引擎
+使用单个事件循环处理所有连接，数据库操作交给有界线程池执行，
+协议（文件名长度/文件名/内容长度/内容）与线程模式的NetworkHandler完全一致
+安装了uvloop时可以使用uvloop引擎：连接处理代码不变，只把事件循环换成uvloop
+"""
+
+import sys
+import time
+import asyncio
+import socket
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from network.codec import JSON_CODEC, parse_frame_name
+from network.compression import DEFAULT_COMPRESS_THRESHOLD, CompressedCodec
+from network.framing import FrameRejected, FrameTimeoutError, check_frame_size, response_frame
+from network.streaming import StreamingResult
+from network.communication import (DEFAULT_MAX_BODY_SIZE, DEFAULT_MAX_FILENAME_SIZE, DEFAULT_REQUEST_TIMEOUT,
+                                   DRAIN_REPORT_INTERVAL, NetworkHandler, request_extra)
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+class AsyncNetworkHandler(NetworkHandler):
+    """基于asyncio.start_server的网络处理器，可替代每连接一个线程的模式"""
+    
+    # 启动日志中显示的引擎名称
+    engine_label = 'asyncio'
+    
+    def __init__(self, host: str = '0.0.0.0', port: int = 55000, keep_alive: bool = False,
+                 idle_timeout: float = 30.0, max_requests_per_connection: int = 100,
+                 executor_workers: int = 16, backlog: int = 1024, queue_size: int = 256,
+                 retry_after: float = 1.0, max_pipeline_depth: int = 32,
+                 listen_socket: Optional[socket.socket] = None, reuse_port: bool = False,
+                 unix_socket: Optional[str] = None, listen_tcp: bool = True,
+                 unix_listen_socket: Optional[socket.socket] = None,
+                 compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD,
+                 max_filename_size: int = DEFAULT_MAX_FILENAME_SIZE, max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        # 执行请求处理器（SQLite操作）的线程数上限，与连接数无关；
+        # 正在执行和排队的请求超过executor_workers + queue_size时回复服务器繁忙
+        super().__init__(host, port, keep_alive, idle_timeout, max_requests_per_connection,
+                         executor_workers, queue_size, retry_after, backlog, max_pipeline_depth,
+                         listen_socket, reuse_port, unix_socket, listen_tcp, unix_listen_socket,
+                         compress_threshold, max_filename_size, max_body_size, request_timeout)
+        self.executor_workers = executor_workers
+        self.loop = None
+        self.executor = None
+        self.stop_event = None
+        self.connection_tasks = set()
+        # 持久连接上正在等待下一个请求的连接任务，平滑退出时直接取消
+        self.idle_tasks = set()
+    
+    def start_server(self) -> bool:
+        """启动服务器（阻塞直到stop_server被调用）"""
+        try:
+            self.run_event_loop(self.serve())
+            self.logger.info("网络服务器主循环已退出")
+            return True
+        except Exception as e:
+            self.logger.error(f"启动网络服务器失败: {e}")
+            return False
+    
+    def run_event_loop(self, main):
+        """在新的事件循环中运行主协程"""
+        asyncio.run(main)
+    
+    async def serve(self):
+        """事件循环主协程"""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_workers,
+                                           thread_name_prefix='request-worker')
+        
+        # asyncio会为TCP连接自动设置TCP_NODELAY，响应帧由build_response拼成一个缓冲区一次写出
+        servers = []
+        try:
+            self.open_listen_sockets()
+            if self.server_socket is not None:
+                servers.append(await asyncio.start_server(self.handle_connection, sock=self.server_socket,
+                                                          backlog=self.backlog))
+            if self.unix_server_socket is not None:
+                # 套接字文件由close_listen_sockets删除（平滑重启交给新进程时保留）
+                # （uvloop不支持cleanup_socket参数，也不会删除套接字文件）
+                native = sys.version_info >= (3, 13) and isinstance(self.loop, asyncio.BaseEventLoop)
+                options = {'cleanup_socket': False} if native else {}
+                servers.append(await asyncio.start_unix_server(self.handle_connection,
+                                                               sock=self.unix_server_socket,
+                                                               backlog=self.backlog, **options))
+        except BaseException:
+            for server in servers:
+                server.close()
+            self.close_listen_sockets()
+            self.executor.shutdown(wait=False)
+            raise
+        self.running = True
+        self.logger.info(f"网络服务器已启动（{self.engine_label}引擎，工作线程 {self.executor_workers}），"
+                         f"监听地址: {self.listen_address()}")
+        if self.ready_callback:
+            self.ready_callback()
+        
+        try:
+            await self.stop_event.wait()
+        finally:
+            # 停止接受新连接（只关闭本进程的描述符，平滑重启时新进程继续监听）
+            for server in servers:
+                server.close()
+            self.close_listen_sockets()
+            self.running = False
+            if self.drain_deadline is not None:
+                await self.drain_connections_async()
+            # 结束仍在等待的连接，避免事件循环关闭时遗留任务
+            for task in list(self.connection_tasks):
+                task.cancel()
+            if self.connection_tasks:
+                await asyncio.gather(*self.connection_tasks, return_exceptions=True)
+            self.executor.shutdown(wait=False)
+    
+    def stop_server(self, drain_timeout: Optional[float] = None):
+        """停止服务器（可从其他线程或信号处理器中调用），drain_timeout的含义与线程模式相同"""
+        if drain_timeout is not None:
+            self.drain_deadline = time.monotonic() + drain_timeout
+        self.running = False
+        if self.loop and self.stop_event:
+            try:
+                self.loop.call_soon_threadsafe(self.stop_event.set)
+            except RuntimeError:
+                # 事件循环已经关闭
+                pass
+        self.logger.info("网络服务器已停止")
+    
+    async def drain_connections_async(self):
+        """等待正在处理请求的连接完成，空闲的持久连接直接关闭；超时的处理方式与线程模式相同"""
+        self.logger.info(f"停止接受新连接，等待已接受的连接处理完毕"
+                         f"（最多 {max(0.0, self.drain_deadline - time.monotonic()):.0f} 秒）")
+        next_report = time.monotonic() + DRAIN_REPORT_INTERVAL
+        while self.connection_tasks:
+            for task in list(self.idle_tasks):
+                task.cancel()
+            now = time.monotonic()
+            if now >= self.drain_deadline:
+                with self.stats_lock:
+                    self.cut_off_requests = self.inflight
+                self.logger.warning(f"等待请求处理完毕超时，中断 {self.cut_off_requests} 个请求"
+                                    f"（仍有 {len(self.connection_tasks)} 个连接未处理完）")
+                return
+            if now >= next_report:
+                self.logger.info(f"正在等待 {len(self.connection_tasks)} 个连接处理完毕"
+                                 f"（处理中的请求 {self.inflight} 个，剩余 {self.drain_deadline - now:.0f} 秒）")
+                next_report = now + DRAIN_REPORT_INTERVAL
+            await asyncio.wait(list(self.connection_tasks), timeout=min(self.drain_deadline - now, 0.1))
+        self.logger.info("已接受的连接全部处理完毕")
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理单个客户端连接，规则与NetworkHandler.handle_client相同"""
+        # Unix域套接字的客户端没有地址，日志中显示套接字路径
+        client_addr = writer.get_extra_info('peername') or f"unix:{self.unix_socket}"
+        self.logger.info(f"客户端连接: {client_addr}")
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        served = 0
+        # 流水线：带请求ID的请求作为独立任务并发处理，每个连接最多同时处理max_pipeline_depth个
+        slots = asyncio.Semaphore(self.max_pipeline_depth)
+        pending = set()
+        try:
+            while True:
+                # 服务器停止后不再等待持久连接上的下一个请求
+                if served > 0 and not self.running:
+                    break
+                codec = JSON_CODEC
+                extra = None
+                if served > 0:
+                    self.idle_tasks.add(task)
+                try:
+                    # 持久连接上等待下一个请求最多idle_timeout秒；第一个请求从连接建立开始计算request_timeout
+                    idle_timeout = self.idle_timeout if served > 0 else None
+                    json_data, codec, params = await self.receive_json_async(reader, idle_timeout)
+                    extra = request_extra(params)
+                except FrameRejected as e:
+                    # 超过准入限制：回复结构化错误帧后关闭连接（字节流已无法对齐）
+                    self.idle_tasks.discard(task)
+                    writer.write(self.frame_rejection_response(client_addr, e))
+                    await writer.drain()
+                    break
+                except EOFError:
+                    # 客户端在帧边界处关闭连接
+                    if served > 0:
+                        break
+                    json_data = None
+                except asyncio.TimeoutError:
+                    if served > 0:
+                        self.logger.info(f"持久连接空闲超过 {self.idle_timeout} 秒，关闭连接")
+                        break
+                    json_data = None
+                finally:
+                    self.idle_tasks.discard(task)
+                
+                if json_data is None:
+                    writer.write(self.build_error_response("接收JSON数据失败", codec, extra))
+                    await writer.drain()
+                    break
+                
+                if extra and self.keep_alive:
+                    # 并发名额用完时在这里等待，不再读取新的请求
+                    await slots.acquire()
+                    request_task = asyncio.create_task(
+                        self.process_request_async(writer, client_addr, json_data, codec, extra))
+                    pending.add(request_task)
+                    request_task.add_done_callback(pending.discard)
+                    request_task.add_done_callback(lambda _: slots.release())
+                    served += 1
+                elif await self.process_request_async(writer, client_addr, json_data, codec, extra):
+                    served += 1
+                else:
+                    # 服务器繁忙时不再接收该连接上的新请求
+                    break
+                
+                if not self.keep_alive:
+                    # 与线程模式保持一致，关闭前稍作等待（只占用一个定时器，不占用线程）
+                    await asyncio.sleep(1)
+                    break
+                if served >= self.max_requests_per_connection:
+                    self.logger.info(f"客户端 {client_addr} 已达到单连接请求上限 {self.max_requests_per_connection}")
+                    break
+            
+            # 先把仍在处理的流水线请求的响应发完再关闭连接
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        except asyncio.CancelledError:
+            # 服务器停止时取消连接任务
+            self.logger.info(f"服务器停止，关闭客户端 {client_addr} 的连接")
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            self.logger.info(f"客户端 {client_addr} 连接中断: {e}")
+        except Exception as e:
+            self.logger.error(f"处理客户端 {client_addr} 时出错: {e}")
+            try:
+                writer.write(self.build_error_response(f"服务器内部错误: {str(e)}"))
+                await writer.drain()
+            except Exception:
+                pass
+        finally:
+            for request_task in list(pending):
+                request_task.cancel()
+            self.connection_tasks.discard(task)
+            self.idle_tasks.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (Exception, asyncio.CancelledError):
+                pass
+            self.logger.info(f"客户端 {client_addr} 连接已关闭，共处理 {served} 个请求")
+    
+    async def process_request_async(self, writer: asyncio.StreamWriter, client_addr: Any,
+                                    json_data: Dict[str, Any], codec=JSON_CODEC,
+                                    extra: Optional[Dict[str, Any]] = None) -> bool:
+        """在线程池中执行请求处理器并写回响应；线程池和等待队列已满时回复服务器繁忙并返回False"""
+        if self.inflight >= self.executor_workers + self.queue_size:
+            # 线程池和等待队列都已满，立即回复服务器繁忙，不再接收新的工作
+            with self.stats_lock:
+                self.rejected_connections += 1
+            writer.write(self.build_busy_response(codec, extra))
+            await writer.drain()
+            self.logger.warning(f"服务器繁忙，拒绝客户端 {client_addr} 的请求")
+            return False
+        
+        logged_op = self.log_request(client_addr, json_data)
+        
+        with self.stats_lock:
+            self.accepted_connections += 1
+            self.inflight += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth())
+        try:
+            if self.request_handler:
+                result = await self.loop.run_in_executor(self.executor, self.request_handler, json_data)
+            else:
+                result = "错误: 未设置请求处理器"
+        finally:
+            with self.stats_lock:
+                self.inflight -= 1
+        
+        if isinstance(result, StreamingResult):
+            await self.send_stream_async(writer, result, codec, extra)
+            self.log_response(logged_op, result)
+            return True
+        
+        if isinstance(codec, CompressedCodec):
+            # 可能需要压缩的响应在线程池中编码，不阻塞事件循环（zlib/zstd压缩时释放GIL）
+            frame = await self.loop.run_in_executor(self.executor, self.build_response, result, codec, extra)
+        else:
+            frame = self.build_response(result, codec, extra)
+        # 一个响应帧只调用一次write，多个流水线任务的响应不会交错
+        writer.write(frame)
+        await writer.drain()
+        self.log_response(logged_op, result)
+        return True
+    
+    async def send_stream_async(self, writer: asyncio.StreamWriter, stream: StreamingResult, codec=JSON_CODEC,
+                                extra: Optional[Dict[str, Any]] = None):
+        """逐帧发送流式响应：每块的读取和编码在线程池中执行，写完一帧等待缓冲区排空后再读下一块"""
+        bodies = self.stream_bodies(stream, codec, extra)
+        try:
+            while True:
+                body = await self.loop.run_in_executor(self.executor, next, bodies, None)
+                if body is None:
+                    break
+                writer.write(response_frame(body))
+                await writer.drain()
+        finally:
+            # 连接中断或任务被取消时，线程池中可能仍在读取当前块，close会等它读完再释放连接
+            try:
+                self.executor.submit(stream.close)
+            except RuntimeError:
+                stream.close()
+    
+    def queue_depth(self) -> int:
+        """等待线程池执行的请求数"""
+        return max(0, self.inflight - self.executor_workers)
+    
+    def network_stats(self) -> Dict[str, Any]:
+        """线程池和过载保护统计（accepted/rejected按请求计数）"""
+        with self.stats_lock:
+            self.active_workers = min(self.inflight, self.executor_workers)
+        return super().network_stats()
+    
+    async def receive_json_async(self, reader: asyncio.StreamReader, idle_timeout: Optional[float] = None
+                                 ) -> Tuple[Optional[Dict[str, Any]], Any, Dict[str, str]]:
+        """异步接收一个请求帧并解析，返回(请求数据, 消息编码, 文件名参数)
+
+        idle_timeout不为None时，等待帧的第一个字节最多idle_timeout秒（超时抛出asyncio.TimeoutError），
+        之后的部分必须在request_timeout秒内读完；idle_timeout为None时整个帧都要在request_timeout秒内读完。
+        读取超时或长度超过上限时抛出FrameRejected（超过上限时不会分配缓冲区），连接恰好在帧边界关闭时抛出EOFError
+        """
+        codec = JSON_CODEC
+        params = {}
+        deadline = self.loop.time() + self.request_timeout
+        try:
+            if idle_timeout is not None:
+                raw_len = await asyncio.wait_for(reader.readexactly(4), idle_timeout)
+                deadline = self.loop.time() + self.request_timeout
+            else:
+                raw_len = await asyncio.wait_for(reader.readexactly(4), self.request_timeout)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                raise EOFError()
+            return None, codec, params
+        except asyncio.TimeoutError:
+            if idle_timeout is not None:
+                raise
+            raise FrameTimeoutError(self.request_timeout) from None
+        
+        try:
+            filename, json_content = await asyncio.wait_for(self.read_frame_rest(reader, raw_len),
+                                                            deadline - self.loop.time())
+            params = parse_frame_name(filename)[1]
+            codec = self.negotiate_codec(filename, params)
+        except asyncio.TimeoutError:
+            raise FrameTimeoutError(self.request_timeout) from None
+        except (asyncio.IncompleteReadError, ValueError) as e:
+            self.logger.error(f"接收JSON数据时出错: {e}")
+            return None, codec, params
+        
+        return self.parse_json(json_content, codec), codec, params
+    
+    async def read_frame_rest(self, reader: asyncio.StreamReader, raw_len: bytes) -> Tuple[str, bytes]:
+        """读取请求帧在第一个长度字段之后的部分，长度字段超过上限时在读取之前抛出FrameTooLargeError"""
+        name_len = struct.unpack("!I", raw_len)[0]
+        check_frame_size('filename', name_len, self.max_filename_size)
+        # 接收文件名（不保存文件，文件名用于协商消息编码和携带请求ID等参数）
+        filename = (await reader.readexactly(name_len)).decode("utf-8")
+        
+        filesize = struct.unpack("!I", await reader.readexactly(4))[0]
+        check_frame_size('body', filesize, self.max_body_size)
+        return filename, await reader.readexactly(filesize)
+
+
+class UvloopNetworkHandler(AsyncNetworkHandler):
+    """使用uvloop事件循环的asyncio引擎（需要安装uvloop），连接处理代码与AsyncNetworkHandler完全相同"""
+    
+    engine_label = 'asyncio+uvloop'
+    
+    @classmethod
+    def available(cls) -> bool:
+        return uvloop is not None
+    
+    def run_event_loop(self, main):
+        """在新的uvloop事件循环中运行主协程"""
+        if uvloop is None:
+            raise RuntimeError("uvloop引擎需要安装uvloop")
+        loop = uvloop.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(main)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息编码
+请求帧的文件名字段用于协商消息体编码，响应使用与请求相同的编码：
+- 默认紧凑JSON（安装了orjson时使用orjson）
+- 文件名扩展名为.msgpack/.cbor，或带有;codec=msgpack / ;codec=cbor参数时使用二进制编码
+  例如 "request.msgpack"、"request.json;codec=cbor"
+- 带有;compress=zstd,zlib参数时，较大的响应消息体被压缩（见network.compression）
+旧客户端发送的"request.json"等文件名不受影响
+"""
+
+import os
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+class CodecError(ValueError):
+    """消息编码/解码失败，或请求的编码不可用"""
+
+
+class JSONCodec:
+    """紧凑JSON编码，优先使用orjson"""
+    name = 'json'
+
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                # orjson不支持的值（如非字符串键、超过64位的整数）交给标准库处理
+                pass
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data: Union[bytes, bytearray]) -> Any:
+        try:
+            # orjson和json.loads都可以直接解析bytes/bytearray，不需要先解码成字符串
+            if orjson is not None:
+                return orjson.loads(data)
+            return json.loads(data)
+        except ValueError as e:
+            raise CodecError(f"JSON解析错误: {e}") from e
+
+
+class MsgpackCodec:
+    """MessagePack编码（需要安装msgpack）"""
+    name = 'msgpack'
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True, default=str)
+
+    def decode(self, data: bytes) -> Any:
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise CodecError(f"MessagePack解析错误: {e}") from e
+
+
+class CBORCodec:
+    """CBOR编码（需要安装cbor2）"""
+    name = 'cbor'
+
+    def encode(self, obj: Any) -> bytes:
+        return cbor2.dumps(obj)
+
+    def decode(self, data: bytes) -> Any:
+        try:
+            return cbor2.loads(data)
+        except Exception as e:
+            raise CodecError(f"CBOR解析错误: {e}") from e
+
+
+JSON_CODEC = JSONCodec()
+
+CODECS = {'json': JSON_CODEC}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS['cbor'] = CBORCodec()
+
+# 文件名扩展名到编码的映射，未列出的扩展名按JSON处理
+EXTENSION_CODECS = {
+    '.msgpack': 'msgpack',
+    '.mpk': 'msgpack',
+    '.cbor': 'cbor',
+}
+
+
+def parse_frame_name(filename: str) -> Tuple[str, Dict[str, str]]:
+    """拆分文件名字段："request.json;codec=cbor" -> ("request.json", {"codec": "cbor"})"""
+    name, *items = filename.split(';')
+    params = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if sep and key.strip():
+            params[key.strip()] = value.strip()
+    return name.strip(), params
+
+
+def get_codec(name: str):
+    """按名称获取编码，未知或未安装时抛出CodecError"""
+    codec = CODECS.get(name)
+    if codec is None:
+        raise CodecError(f"不支持的消息编码: {name}，可用编码: {', '.join(CODECS)}")
+    return codec
+
+
+def codec_for_frame(filename: str):
+    """根据请求帧的文件名字段选择编码"""
+    name, params = parse_frame_name(filename)
+    codec_name = params.get('codec')
+    if codec_name is None:
+        codec_name = EXTENSION_CODECS.get(os.path.splitext(name)[1].lower(), 'json')
+    return get_codec(codec_name.lower())
+
+
+def frame_name(codec_name: str, filename: str = "request.json", compress: Optional[str] = None) -> str:
+    """构造带编码和压缩参数的文件名字段（JSON编码且不压缩时保持原文件名，兼容旧服务器）"""
+    if codec_name != 'json':
+        filename = f"{filename};codec={codec_name}"
+    if compress:
+        filename = f"{filename};compress={compress}"
+    return filename
@@ -5,62 +5,243 @@
 处理Socket连接和JSON数据传输
 """
 
-import json
+import os
+import queue
+import select
 import socket
-import struct
+import selectors
 import logging
 import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Dict, Any, Callable, Optional
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple, Union
+
+from network.codec import JSON_CODEC, CodecError, codec_for_frame, frame_name, get_codec, parse_frame_name
+from network.compression import (DEFAULT_COMPRESS_THRESHOLD, CompressedCodec, get_compressor,
+                                 negotiate_compression)
+from network.streaming import StreamingResult
+from network.listener import (create_listen_socket, create_unix_listen_socket, inherited_listen_socket,
+                              parse_unix_target)
+from network.framing import (FrameRejected, read_request_frame, read_response_frame, response_frame,
+                             send_request_frame, send_response_frame, set_nodelay)
+from utils.logging_config import PayloadLogPolicy
+
+
+# 一次性连接在响应发送后延迟关闭的秒数（原有行为，确保客户端读完响应）
+CLOSE_DELAY = 1.0
+
+# 等待回复服务器繁忙的连接数上限，超出时直接关闭连接
+REJECT_QUEUE_SIZE = 1024
+
+# 平滑退出时输出进度日志的间隔秒数
+DRAIN_REPORT_INTERVAL = 1.0
+
+# 请求帧准入限制：文件名和内容长度上限（字节），读完一个请求帧的时间上限（秒）
+DEFAULT_MAX_FILENAME_SIZE = 1024
+DEFAULT_MAX_BODY_SIZE = 16 * 1024 * 1024
+DEFAULT_REQUEST_TIMEOUT = 30.0
+# 在工作队列中等待过久（读取期限已过）的连接，仍至少再给这么多秒读完已经发出的第一个请求帧
+MIN_FIRST_READ_TIMEOUT = 1.0
+
+
+def request_extra(params: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """请求帧文件名中带有id参数时，响应中需要回传的字段"""
+    request_id = params.get('id')
+    return {"request_id": request_id} if request_id is not None else None
+
+
+class ConnectionState:
+    """单个连接上的流水线状态
+
+    带请求ID的请求并发处理，响应共用一个发送锁保证帧不交错；
+    同时处理的请求数不超过max_pipeline，超出时停止读取新请求（背压）
+    """
+    
+    def __init__(self, max_pipeline: int):
+        self.send_lock = threading.Lock()
+        self.slots = threading.Semaphore(max_pipeline)
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+    
+    def track(self, future: Future):
+        """登记一个正在处理的流水线请求，完成后释放并发名额"""
+        with self.pending_lock:
+            self.pending.add(future)
+        future.add_done_callback(self._finished)
+    
+    def _finished(self, future: Future):
+        with self.pending_lock:
+            self.pending.discard(future)
+        self.slots.release()
+    
+    def wait_pending(self):
+        """等待所有流水线请求的响应发送完毕"""
+        with self.pending_lock:
+            pending = list(self.pending)
+        if pending:
+            wait(pending)
 
 
 class NetworkHandler:
-    def __init__(self, host: str = '0.0.0.0', port: int = 55000):
+    """线程模式网络处理器
+
+    接受的连接放入有界队列，由固定数量的工作线程处理；队列已满时立即返回
+    "服务器繁忙"错误帧（带retry_after重试建议），不再为每个连接创建新线程
+    """
+    
+    def __init__(self, host: str = '0.0.0.0', port: int = 55000, keep_alive: bool = False,
+                 idle_timeout: float = 30.0, max_requests_per_connection: int = 100,
+                 worker_threads: int = 64, queue_size: int = 256, retry_after: float = 1.0,
+                 backlog: int = 128, max_pipeline_depth: int = 32,
+                 listen_socket: Optional[socket.socket] = None, reuse_port: bool = False,
+                 unix_socket: Optional[str] = None, listen_tcp: bool = True,
+                 unix_listen_socket: Optional[socket.socket] = None,
+                 compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD,
+                 max_filename_size: int = DEFAULT_MAX_FILENAME_SIZE, max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT):
         self.host = host
         self.port = port
+        # 多进程模式：使用主进程传入的已监听套接字，或用SO_REUSEPORT与其他工作进程绑定同一端口
+        self.listen_socket = listen_socket
+        self.reuse_port = reuse_port
+        # Unix域套接字路径（None表示不监听），listen_tcp为False时只监听Unix域套接字
+        self.unix_socket = unix_socket
+        self.listen_tcp = listen_tcp
+        self.unix_listen_socket = unix_listen_socket
+        # 本进程创建或接管了套接字文件时退出前删除；平滑重启交给新进程后（handed_over）保留
+        self.unix_socket_owner = False
+        self.handed_over = False
+        # 持久连接配置：默认关闭，保持一次连接一个请求的原有行为
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        # 工作线程池和等待队列（过载保护）
+        self.worker_threads = worker_threads
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.backlog = backlog
+        # 流水线：持久连接上带请求ID的请求并发处理，每个连接最多同时处理max_pipeline_depth个
+        self.max_pipeline_depth = max_pipeline_depth
+        # 响应压缩：客户端声明支持时，消息体不小于该字节数的响应被压缩，0表示不压缩
+        self.compress_threshold = compress_threshold
+        # 准入限制：长度字段超过上限的请求帧在分配缓冲区之前拒绝；
+        # 每个请求帧（从等待第一个字节开始，持久连接上从下一个请求的第一个字节开始）必须在request_timeout秒内读完
+        self.max_filename_size = max_filename_size
+        self.max_body_size = max_body_size
+        self.request_timeout = request_timeout
+        self.pipeline_executor = None
+        self.work_queue = None
+        self.reject_queue = None
+        self.close_queue = None
+        self.stats_lock = threading.Lock()
+        self.accepted_connections = 0
+        self.rejected_connections = 0
+        self.dropped_connections = 0
+        self.active_workers = 0
+        self.peak_queue_depth = 0
+        # 正在执行请求处理器或发送响应的请求数
+        self.inflight = 0
+        # 平滑退出超过截止时间时被中断的请求数（正在处理的请求 + 还在排队的连接）
+        self.cut_off_requests = 0
+        # 按原因统计被拒绝的请求帧
+        self.frame_rejections = {'filename_too_large': 0, 'body_too_large': 0, 'read_timeout': 0}
         self.server_socket = None
+        self.unix_server_socket = None
         self.running = False
+        # 平滑退出：停止接受新连接后等待已接受的连接处理完毕的截止时间，None表示立即停止
+        self.drain_deadline = None
+        # 持久连接上正在等待下一个请求的连接，平滑退出时直接关闭
+        self.idle_connections = set()
         self.logger = logging.getLogger(__name__)
         self.request_handler = None
+        # 开始监听后调用（平滑重启时通知上一代进程）
+        self.ready_callback = None
+        # 请求/响应内容的日志策略（截断、抽样）
+        self.payload_log = PayloadLogPolicy()
+    
+    @classmethod
+    def available(cls) -> bool:
+        """当前环境能否使用该网络引擎（依赖可选库的引擎在未安装时返回False）"""
+        return True
     
     def set_request_handler(self, handler: Callable[[Dict[str, Any]], Any]):
         """设置请求处理器"""
         self.request_handler = handler
     
+    def set_payload_log_policy(self, policy: PayloadLogPolicy):
+        """设置请求/响应内容的日志策略"""
+        self.payload_log = policy
+    
+    def set_ready_callback(self, callback: Callable[[], None]):
+        """设置开始监听后的回调"""
+        self.ready_callback = callback
+    
+    def log_request(self, client_addr: Any, json_data: Dict[str, Any]) -> Optional[str]:
+        """按日志策略记录请求内容，返回操作名；本次请求未被抽中时返回None"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return None
+        op = self.payload_log.operation(json_data)
+        if not self.payload_log.should_log(op):
+            return None
+        self.logger.info(f"从 {client_addr} 接收到请求 [{op}]: {self.payload_log.format(json_data, op)}")
+        return op
+    
+    def log_response(self, op: Optional[str], result: Any):
+        """记录响应内容（与请求使用同一次抽样结果）"""
+        if op is not None:
+            self.logger.info(f"响应已发送 [{op}]: {self.payload_log.format(result, op)}")
+    
     def start_server(self) -> bool:
         """启动服务器"""
+        selector = None
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            listeners = self.open_listen_sockets()
             
             self.running = True
-            self.logger.info(f"网络服务器已启动，监听端口: {self.host}:{self.port}")
+            self.start_workers()
+            self.logger.info(f"网络服务器已启动（工作线程 {self.worker_threads}，等待队列 {self.queue_size}），"
+                             f"监听地址: {self.listen_address()}")
+            if self.ready_callback:
+                self.ready_callback()
+            
+            if len(listeners) > 1:
+                # 同时监听TCP和Unix域套接字：用selectors等待任一套接字有新连接
+                selector = selectors.DefaultSelector()
+                for listener in listeners:
+                    listener.setblocking(False)
+                    selector.register(listener, selectors.EVENT_READ)
+            else:
+                # 设置socket超时，以便能够响应停止信号
+                listeners[0].settimeout(1.0)
             
             while self.running:
                 try:
-                    # 设置socket超时，以便能够响应停止信号
-                    self.server_socket.settimeout(1.0)
-                    client_socket, client_addr = self.server_socket.accept()
-                    
-                    if not self.running:
-                        client_socket.close()
-                        break
-                    
-                    self.logger.info(f"客户端连接: {client_addr}")
+                    if selector is None:
+                        ready = listeners
+                    else:
+                        ready = [key.fileobj for key, _ in selector.select(timeout=1.0)]
                     
-                    # 使用线程处理每个客户端连接
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, client_addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
+                    for listener in ready:
+                        client_socket, client_addr = listener.accept()
+                        client_socket.setblocking(True)
+                        
+                        if not self.running and self.drain_deadline is None:
+                            client_socket.close()
+                            break
+                        
+                        # Unix域套接字的客户端没有地址，日志中显示套接字路径
+                        client_addr = client_addr or f"unix:{self.unix_socket}"
+                        self.logger.info(f"客户端连接: {client_addr}")
+                        set_nodelay(client_socket)
+                        
+                        # 交给工作线程处理，队列已满时拒绝
+                        self.dispatch_connection(client_socket, client_addr)
                     
-                except socket.timeout:
-                    # 超时是正常的，继续循环检查running状态
+                except (socket.timeout, BlockingIOError):
+                    # 超时是正常的，继续循环检查running状态；
+                    # 多进程模式下其他工作进程可能先accept了同一个连接
                     continue
                 except OSError as e:
                     if self.running:
@@ -77,121 +258,532 @@ class NetworkHandler:
             self.logger.error(f"启动网络服务器失败: {e}")
             return False
         finally:
-            if self.server_socket:
-                self.server_socket.close()
+            if selector is not None:
+                selector.close()
+            self.close_listen_sockets()
+            if self.drain_deadline is not None:
+                self.drain_connections()
+            self.stop_workers()
+    
+    def open_listen_sockets(self) -> List[socket.socket]:
+        """创建（或接管）配置的TCP和Unix域监听套接字"""
+        if not self.listen_tcp and not self.unix_socket:
+            raise ValueError("未配置监听地址（关闭了TCP且没有指定Unix域套接字）")
+        if self.listen_tcp:
+            self.server_socket = self.create_server_socket()
+        if self.unix_socket:
+            self.unix_server_socket = self.create_unix_server_socket()
+        return self.listen_sockets()
+    
+    def listen_sockets(self) -> List[socket.socket]:
+        """正在使用的监听套接字（平滑重启时全部交给新进程）"""
+        return [sock for sock in (self.server_socket, self.unix_server_socket) if sock is not None]
     
-    def stop_server(self):
-        """停止服务器"""
+    def listen_address(self) -> str:
+        """监听地址描述（日志用）"""
+        addresses = []
+        if self.listen_tcp:
+            addresses.append(f"{self.host}:{self.port}")
+        if self.unix_socket:
+            addresses.append(f"unix://{self.unix_socket}")
+        return ', '.join(addresses)
+    
+    def close_listen_sockets(self):
+        """关闭本进程的监听套接字描述符，本进程拥有的Unix域套接字文件一并删除"""
+        for sock in self.listen_sockets():
+            sock.close()
+        if self.unix_socket_owner and not self.handed_over:
+            self.unix_socket_owner = False
+            try:
+                os.unlink(self.unix_socket)
+            except OSError:
+                pass
+    
+    def create_server_socket(self) -> socket.socket:
+        """创建监听套接字；多进程模式下直接使用主进程传入的套接字，平滑重启时接管上一代进程的套接字"""
+        if self.listen_socket is not None:
+            return self.listen_socket
+        inherited = inherited_listen_socket(port=self.port)
+        if inherited is not None:
+            self.logger.info(f"已接管上一代进程的监听套接字 (fd: {inherited.fileno()})")
+            return inherited
+        return create_listen_socket(self.host, self.port, self.backlog, self.reuse_port)
+    
+    def create_unix_server_socket(self) -> socket.socket:
+        """创建Unix域监听套接字；多进程模式下使用主进程传入的套接字，平滑重启时接管上一代进程的套接字"""
+        if self.unix_listen_socket is not None:
+            return self.unix_listen_socket
+        inherited = inherited_listen_socket(socket.AF_UNIX)
+        if inherited is not None:
+            self.logger.info(f"已接管上一代进程的Unix域监听套接字 (fd: {inherited.fileno()})")
+        sock = inherited or create_unix_listen_socket(self.unix_socket, self.backlog)
+        self.unix_socket_owner = True
+        return sock
+    
+    def stop_server(self, drain_timeout: Optional[float] = None):
+        """停止服务器
+
+        drain_timeout不为None时平滑退出：停止接受新连接（监听套接字只关闭本进程的描述符，
+        平滑重启时新进程继续监听），已接受的连接处理完当前请求后关闭，最多等待drain_timeout秒
+        """
+        if drain_timeout is not None:
+            self.drain_deadline = time.monotonic() + drain_timeout
         self.running = False
-        if self.server_socket:
-            self.server_socket.close()
+        for sock in self.listen_sockets():
+            sock.close()
         self.logger.info("网络服务器已停止")
     
-    def handle_client(self, client_socket: socket.socket, client_addr: tuple):
-        """处理单个客户端连接"""
-        try:
-            # 步骤1: 接收JSON数据
-            json_data = self.receive_json(client_socket)
-            if json_data is None:
-                self.send_error_response(client_socket, "接收JSON数据失败")
+    def drain_connections(self):
+        """等待已接受的连接（包括还在排队的）处理完毕，空闲的持久连接直接关闭
+
+        超过截止时间时记录被中断的请求数（cut_off_requests），剩余的连接由stop_workers关闭
+        """
+        self.logger.info(f"停止接受新连接，等待已接受的连接处理完毕"
+                         f"（最多 {max(0.0, self.drain_deadline - time.monotonic()):.0f} 秒）")
+        next_report = time.monotonic() + DRAIN_REPORT_INTERVAL
+        while self.work_queue is not None and self.work_queue.unfinished_tasks:
+            with self.stats_lock:
+                # 持有锁期间连接不会离开空闲集合，也就不会被工作线程关闭
+                for client_socket in self.idle_connections:
+                    try:
+                        client_socket.shutdown(socket.SHUT_RD)
+                    except OSError:
+                        pass
+            now = time.monotonic()
+            if now >= self.drain_deadline:
+                with self.stats_lock:
+                    self.cut_off_requests = self.inflight + self.queue_depth()
+                self.logger.warning(f"等待请求处理完毕超时，中断 {self.cut_off_requests} 个请求"
+                                    f"（仍有 {self.work_queue.unfinished_tasks} 个连接未处理完）")
                 return
+            if now >= next_report:
+                self.logger.info(f"正在等待 {self.work_queue.unfinished_tasks} 个连接处理完毕"
+                                 f"（处理中的请求 {self.inflight} 个，剩余 {self.drain_deadline - now:.0f} 秒）")
+                next_report = now + DRAIN_REPORT_INTERVAL
+            time.sleep(0.05)
+        self.logger.info("已接受的连接全部处理完毕")
+    
+    def start_workers(self):
+        """启动工作线程、拒绝线程和延迟关闭线程"""
+        self.work_queue = queue.Queue(maxsize=self.queue_size)
+        self.reject_queue = queue.Queue(maxsize=REJECT_QUEUE_SIZE)
+        self.close_queue = queue.Queue()
+        if self.keep_alive:
+            self.pipeline_executor = ThreadPoolExecutor(max_workers=self.worker_threads,
+                                                        thread_name_prefix='pipeline-worker')
+        
+        for index in range(self.worker_threads):
+            threading.Thread(target=self.worker_loop, name=f'conn-worker-{index}', daemon=True).start()
+        threading.Thread(target=self.reject_loop, name='conn-rejecter', daemon=True).start()
+        threading.Thread(target=self.close_loop, name='conn-closer', daemon=True).start()
+    
+    def stop_workers(self):
+        """关闭还在排队的连接并通知工作线程退出"""
+        if self.work_queue is None:
+            return
+        for pending in (self.work_queue, self.reject_queue):
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].close()
+        for _ in range(self.worker_threads):
+            self.work_queue.put(None)
+        self.reject_queue.put(None)
+        self.close_queue.put(None)
+        if self.pipeline_executor is not None:
+            self.pipeline_executor.shutdown(wait=False)
+    
+    def dispatch_connection(self, client_socket: socket.socket, client_addr: tuple):
+        """把新连接放入工作队列；队列已满时交给拒绝线程回复服务器繁忙错误帧"""
+        try:
+            # 记录accept的时间，读取第一个请求帧的期限从这里开始计算
+            item = (client_socket, client_addr, time.monotonic())
+            self.work_queue.put_nowait(item)
+        except queue.Full:
+            try:
+                self.reject_queue.put_nowait(item)
+            except queue.Full:
+                # 拒绝线程也忙不过来，直接关闭连接
+                client_socket.close()
+                with self.stats_lock:
+                    self.dropped_connections += 1
+            return
+        
+        with self.stats_lock:
+            self.accepted_connections += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.work_queue.qsize())
+    
+    def worker_loop(self):
+        """工作线程：依次处理队列中的连接"""
+        while True:
+            item = self.work_queue.get()
+            if item is None:
+                self.work_queue.task_done()
+                break
+            with self.stats_lock:
+                self.active_workers += 1
+            try:
+                self.handle_client(*item)
+            finally:
+                with self.stats_lock:
+                    self.active_workers -= 1
+                self.work_queue.task_done()
+    
+    def reject_loop(self):
+        """拒绝线程：读完请求帧后回复服务器繁忙错误帧并关闭连接"""
+        while True:
+            item = self.reject_queue.get()
+            if item is None:
+                break
+            client_socket, client_addr, _ = item
+            try:
+                # 先读完请求再回复，避免关闭时还有未读数据导致连接被重置、客户端收不到错误帧
+                client_socket.settimeout(self.retry_after)
+                _, codec, params = self.receive_json(client_socket, timeout=self.retry_after)
+                client_socket.sendall(self.build_busy_response(codec, request_extra(params)))
+                self.logger.warning(f"服务器繁忙，拒绝客户端 {client_addr}")
+            except (OSError, FrameRejected):
+                pass
+            finally:
+                client_socket.close()
+                with self.stats_lock:
+                    self.rejected_connections += 1
+    
+    def close_loop(self):
+        """延迟关闭线程：一次性连接在响应发送CLOSE_DELAY秒后关闭，不占用工作线程"""
+        while True:
+            item = self.close_queue.get()
+            if item is None:
+                break
+            close_at, client_socket = item
+            delay = close_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            client_socket.close()
+    
+    def close_later(self, client_socket: socket.socket):
+        """延迟关闭连接（延迟时间相同，队列顺序即关闭顺序）"""
+        if self.close_queue is None:
+            time.sleep(CLOSE_DELAY)
+            client_socket.close()
+            return
+        self.close_queue.put((time.monotonic() + CLOSE_DELAY, client_socket))
+    
+    def queue_depth(self) -> int:
+        """等待工作线程处理的连接数"""
+        return self.work_queue.qsize() if self.work_queue is not None else 0
+    
+    def network_stats(self) -> Dict[str, Any]:
+        """工作线程池和过载保护统计"""
+        with self.stats_lock:
+            return {
+                "worker_threads": self.worker_threads,
+                "active_workers": self.active_workers,
+                "queue_size": self.queue_size,
+                "queue_depth": self.queue_depth(),
+                "peak_queue_depth": self.peak_queue_depth,
+                "accepted": self.accepted_connections,
+                "rejected": self.rejected_connections,
+                "dropped": self.dropped_connections,
+                "cut_off": self.cut_off_requests,
+                "frame_rejections": dict(self.frame_rejections),
+            }
+    
+    def handle_client(self, client_socket: socket.socket, client_addr: tuple, accepted_at: Optional[float] = None):
+        """处理单个客户端连接
+
+        默认一次连接只处理一个请求；开启keep_alive后同一连接可以连续处理多个请求，
+        直到客户端关闭连接、空闲超时或达到单连接请求上限。
+        第一个请求帧的读取期限从accept（accepted_at）开始计算，在工作队列中等待的时间也计算在内
+        """
+        served = 0
+        state = ConnectionState(self.max_pipeline_depth)
+        try:
+            if self.keep_alive:
+                client_socket.settimeout(self.idle_timeout)
             
-            self.logger.info(f"从 {client_addr} 接收到JSON数据: {json_data}")
+            while True:
+                # 服务器停止后不再等待持久连接上的下一个请求
+                if served > 0 and (not self.running or not self.wait_for_next_request(client_socket)):
+                    break
+                
+                timeout = self.first_read_timeout(accepted_at) if served == 0 else None
+                if not self.serve_request(client_socket, client_addr, state, timeout):
+                    # 帧读取失败后字节流已无法对齐，只能关闭连接
+                    break
+                served += 1
+                
+                if not self.keep_alive:
+                    break
+                if served >= self.max_requests_per_connection:
+                    self.logger.info(f"客户端 {client_addr} 已达到单连接请求上限 {self.max_requests_per_connection}")
+                    break
             
+        except Exception as e:
+            self.logger.error(f"处理客户端 {client_addr} 时出错: {e}")
+            self.send_error_response(client_socket, f"服务器内部错误: {str(e)}", send_lock=state.send_lock)
+        finally:
+            # 先把仍在处理的流水线请求的响应发完再关闭连接
+            state.wait_pending()
+            if self.keep_alive:
+                client_socket.close()
+            else:
+                self.close_later(client_socket)
+            self.logger.info(f"客户端 {client_addr} 连接已关闭，共处理 {served} 个请求")
+    
+    def first_read_timeout(self, accepted_at: Optional[float]) -> Optional[float]:
+        """新连接上第一个请求帧剩余的读取期限（request_timeout减去在工作队列中等待的时间）"""
+        if accepted_at is None:
+            return None
+        return max(self.request_timeout - (time.monotonic() - accepted_at), MIN_FIRST_READ_TIMEOUT)
+    
+    def serve_request(self, client_socket: socket.socket, client_addr: tuple,
+                      state: Optional[ConnectionState] = None, timeout: Optional[float] = None) -> bool:
+        """在当前连接上处理一个完整的请求/响应，接收失败时返回False
+
+        timeout为读取请求帧的期限（None表示request_timeout）；持久连接上带请求ID（文件名参数;id=...）的请求交给流水线线程池并发处理，
+        响应带上相同的request_id，顺序可能与请求顺序不同
+        """
+        send_lock = state.send_lock if state else None
+        
+        # 步骤1: 接收JSON数据（响应使用与请求相同的编码），超过准入限制时回复错误帧后关闭连接
+        try:
+            json_data, codec, params = self.receive_json(client_socket, timeout)
+        except FrameRejected as e:
+            response = self.frame_rejection_response(client_addr, e)
+            try:
+                with send_lock or nullcontext():
+                    client_socket.sendall(response)
+            except OSError:
+                pass
+            return False
+        extra = request_extra(params)
+        if json_data is None:
+            self.send_error_response(client_socket, "接收JSON数据失败", codec, extra, send_lock)
+            return False
+        
+        if extra and state is not None and self.pipeline_executor is not None:
+            # 并发名额用完时在这里等待，不再读取新的请求
+            state.slots.acquire()
+            try:
+                future = self.pipeline_executor.submit(self.process_request, client_socket, client_addr,
+                                                       json_data, codec, extra, send_lock)
+            except RuntimeError:
+                # 服务器正在停止，线程池已关闭
+                state.slots.release()
+                return False
+            state.track(future)
+            return True
+        
+        self.process_request(client_socket, client_addr, json_data, codec, extra, send_lock)
+        return True
+    
+    def process_request(self, client_socket: socket.socket, client_addr: tuple, json_data: Dict[str, Any],
+                        codec=JSON_CODEC, extra: Optional[Dict[str, Any]] = None, send_lock=None):
+        """执行请求处理器并发送响应"""
+        logged_op = self.log_request(client_addr, json_data)
+        
+        with self.stats_lock:
+            self.inflight += 1
+        try:
             # 步骤2: 处理JSON数据
             if self.request_handler:
                 result = self.request_handler(json_data)
             else:
                 result = "错误: 未设置请求处理器"
             
-            # 步骤3: 将处理结果以JSON格式返回给客户端
-            self.send_response(client_socket, result)
-            
-        except Exception as e:
-            self.logger.error(f"处理客户端 {client_addr} 时出错: {e}")
-            self.send_error_response(client_socket, f"服务器内部错误: {str(e)}")
+            # 步骤3: 将处理结果以JSON格式返回给客户端（流式结果逐块发送）
+            if isinstance(result, StreamingResult):
+                self.send_stream(client_socket, result, codec, extra, send_lock)
+            else:
+                self.send_response(client_socket, result, codec, extra, send_lock)
         finally:
-            time.sleep(1)
-            client_socket.close()
-            self.logger.info(f"客户端 {client_addr} 连接已关闭")
+            with self.stats_lock:
+                self.inflight -= 1
+        self.log_response(logged_op, result)
     
-    def receive_json(self, client_socket: socket.socket) -> Optional[Dict[str, Any]]:
-        """接收JSON数据（不保存到文件，直接在内存中处理）"""
+    def wait_for_next_request(self, client_socket: socket.socket) -> bool:
+        """持久连接上等待下一个请求，客户端关闭连接、空闲超时或服务器平滑退出时返回False"""
+        with self.stats_lock:
+            self.idle_connections.add(client_socket)
         try:
-            # 接收文件名长度
-            raw_len = client_socket.recv(4)
-            if not raw_len:
-                return None
-            name_len = struct.unpack("!I", raw_len)[0]
-            
-            # 接收文件名（虽然不用保存，但需要接收完整协议）
-            filename = client_socket.recv(name_len).decode("utf-8")
-            
-            # 接收文件大小
-            raw_size = client_socket.recv(4)
-            if not raw_size:
-                return None
-            filesize = struct.unpack("!I", raw_size)[0]
-            
-            # 接收文件内容到内存
-            json_content = b""
-            received = 0
-            while received < filesize:
-                chunk = client_socket.recv(min(4096, filesize - received))
-                if not chunk:
-                    break
-                json_content += chunk
-                received += len(chunk)
+            # 只窥探数据而不消费，真正的读取交给receive_json
+            return bool(client_socket.recv(1, socket.MSG_PEEK))
+        except socket.timeout:
+            self.logger.info(f"持久连接空闲超过 {self.idle_timeout} 秒，关闭连接")
+            return False
+        except OSError:
+            return False
+        finally:
+            with self.stats_lock:
+                self.idle_connections.discard(client_socket)
+    
+    def receive_json(self, client_socket: socket.socket,
+                     timeout: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], Any, Dict[str, str]]:
+        """接收JSON数据（不保存到文件，直接在内存中处理）
+
+        返回(请求数据, 消息编码, 文件名参数)，接收或解析失败时请求数据为None；
+        超过长度上限或未能在timeout（默认request_timeout）秒内读完时抛出FrameRejected
+        """
+        codec = JSON_CODEC
+        params = {}
+        try:
+            # 按精确长度读取整个请求帧，内容直接读入预分配的缓冲区（先检查长度上限）
+            frame = read_request_frame(client_socket, self.max_filename_size, self.max_body_size,
+                                       self.request_timeout if timeout is None else timeout)
+            if frame is None:
+                return None, codec, params
             
-            # 解析JSON数据
-            json_str = json_content.decode('utf-8')
-            json_data = json.loads(json_str)
+            # 文件名不用于保存文件，只用于协商消息编码和携带请求ID等参数
+            filename, json_content = frame
+            params = parse_frame_name(filename)[1]
+            codec = self.negotiate_codec(filename, params)
             
-            return json_data
+            # 解析JSON数据（直接解析缓冲区，不再复制）
+            return self.parse_json(json_content, codec), codec, params
             
-        except json.JSONDecodeError as e:
-            self.logger.error(f"JSON解析错误: {e}")
-            return None
+        except FrameRejected:
+            raise
         except Exception as e:
             self.logger.error(f"接收JSON数据时出错: {e}")
+            return None, codec, params
+    
+    def frame_rejection_response(self, client_addr: Any, error: FrameRejected) -> bytes:
+        """记录被拒绝的请求帧并构造结构化错误帧（之后字节流已无法对齐，由调用方关闭连接）"""
+        return response_frame(self.encode_frame_rejection(client_addr, error))
+    
+    def encode_frame_rejection(self, client_addr: Any, error: FrameRejected) -> bytes:
+        """记录被拒绝的请求帧并编码结构化错误消息体"""
+        with self.stats_lock:
+            self.frame_rejections[error.code] = self.frame_rejections.get(error.code, 0) + 1
+        self.logger.warning(f"拒绝客户端 {client_addr} 的请求帧: {error}")
+        return self.encode_error_response(str(error), JSON_CODEC, dict(error.details, error_code=error.code))
+    
+    def negotiate_codec(self, filename: str, params: Dict[str, str]):
+        """按请求帧的文件名选择响应编码，客户端声明了可解压的算法（compress参数）时在外层加上压缩
+
+        压缩的请求体解压后超过max_body_size时，解码抛出FrameRejected（body_too_large）
+        """
+        codec = codec_for_frame(filename)
+        if self.compress_threshold <= 0:
+            return codec
+        compressor = negotiate_compression(params.get('compress'))
+        if compressor is None:
+            return codec
+        return CompressedCodec(codec, compressor, self.compress_threshold, self.max_body_size)
+    
+    def parse_json(self, json_content: Union[bytes, bytearray], codec=JSON_CODEC) -> Optional[Dict[str, Any]]:
+        """按协商的编码解析请求体（默认JSON）"""
+        try:
+            return codec.decode(json_content)
+        except CodecError as e:
+            self.logger.error(str(e))
             return None
     
-    def send_response(self, client_socket: socket.socket, result: Any):
-        """向客户端发送响应"""
+    def encode_response(self, result: Any, codec=JSON_CODEC, extra: Optional[Dict[str, Any]] = None) -> bytes:
+        """编码成功响应的消息体（默认紧凑JSON），extra中的字段（如request_id）一并返回"""
+        response = {
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "result": result
+        }
+        if extra:
+            response.update(extra)
+        return codec.encode(response)
+    
+    def encode_error_response(self, error_message: str, codec=JSON_CODEC,
+                              extra: Optional[Dict[str, Any]] = None) -> bytes:
+        """编码错误响应的消息体，extra中的字段一并返回"""
+        response = {
+            "status": "error",
+            "timestamp": datetime.now().isoformat(),
+            "error": error_message
+        }
+        if extra:
+            response.update(extra)
+        return codec.encode(response)
+    
+    def build_response(self, result: Any, codec=JSON_CODEC, extra: Optional[Dict[str, Any]] = None) -> bytes:
+        """构造成功响应帧（4字节长度 + 消息体）"""
+        return response_frame(self.encode_response(result, codec, extra))
+    
+    def build_error_response(self, error_message: str, codec=JSON_CODEC,
+                             extra: Optional[Dict[str, Any]] = None) -> bytes:
+        """构造错误响应帧（4字节长度 + 消息体）"""
+        return response_frame(self.encode_error_response(error_message, codec, extra))
+    
+    def build_busy_response(self, codec=JSON_CODEC, extra: Optional[Dict[str, Any]] = None) -> bytes:
+        """构造服务器繁忙错误帧，retry_after为建议的重试等待秒数"""
+        busy = {"error_code": "server_busy", "retry_after": self.retry_after}
+        busy.update(extra or {})
+        return self.build_error_response("服务器繁忙，请稍后重试", codec, busy)
+    
+    def send_response(self, client_socket: socket.socket, result: Any, codec=JSON_CODEC,
+                      extra: Optional[Dict[str, Any]] = None, send_lock=None):
+        """向客户端发送响应；流水线连接上多个线程共用send_lock，保证帧不交错"""
         try:
-            response = {
-                "status": "success",
-                "timestamp": datetime.now().isoformat(),
-                "result": result
-            }
-            response_json = json.dumps(response, ensure_ascii=False, indent=2)
-            response_bytes = response_json.encode('utf-8')
-            
-            # 发送响应长度
-            client_socket.sendall(struct.pack("!I", len(response_bytes)))
-            # 发送响应内容
-            client_socket.sendall(response_bytes)
-            
-            self.logger.info(f"响应已发送: {response}")
+            body = self.encode_response(result, codec, extra)
+            # 长度和内容通过一次sendmsg发出
+            with send_lock or nullcontext():
+                send_response_frame(client_socket, body)
             
         except Exception as e:
             self.logger.error(f"发送响应时出错: {e}")
     
-    def send_error_response(self, client_socket: socket.socket, error_message: str):
+    def encode_stream_chunk(self, chunk: Any, seq: int, codec=JSON_CODEC,
+                            extra: Optional[Dict[str, Any]] = None) -> bytes:
+        """编码流式响应的一个续帧"""
+        response = {
+            "status": "partial",
+            "timestamp": datetime.now().isoformat(),
+            "seq": seq,
+            "result": chunk
+        }
+        if extra:
+            response.update(extra)
+        return codec.encode(response)
+    
+    def stream_bodies(self, stream: StreamingResult, codec=JSON_CODEC,
+                      extra: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+        """依次产生流式响应各帧的消息体，每次只读取和编码一块；读取出错时以错误终帧结束"""
+        seq = 0
+        try:
+            for chunk in stream:
+                yield self.encode_stream_chunk(chunk, seq, codec, extra)
+                seq += 1
+            summary = stream.summary()
+        except Exception as e:
+            self.logger.error(f"流式响应读取数据时出错: {e}")
+            yield self.encode_error_response(f"流式读取出错: {str(e)}", codec,
+                                             dict(extra or {}, seq=seq, stream_end=True))
+            return
+        yield self.encode_response(summary, codec, dict(extra or {}, seq=seq, stream_end=True))
+    
+    def send_stream(self, client_socket: socket.socket, stream: StreamingResult, codec=JSON_CODEC,
+                    extra: Optional[Dict[str, Any]] = None, send_lock=None):
+        """逐帧发送流式响应（发送阻塞时不再读取下一块），结束或连接中断时释放流的资源
+
+        流水线连接上每帧单独加锁，其他请求的响应可以插在续帧之间（按request_id区分）
+        """
+        try:
+            for body in self.stream_bodies(stream, codec, extra):
+                with send_lock or nullcontext():
+                    send_response_frame(client_socket, body)
+        except Exception as e:
+            self.logger.error(f"发送流式响应时出错: {e}")
+        finally:
+            stream.close()
+    
+    def send_error_response(self, client_socket: socket.socket, error_message: str, codec=JSON_CODEC,
+                            extra: Optional[Dict[str, Any]] = None, send_lock=None):
         """发送错误响应"""
         try:
-            response = {
-                "status": "error",
-                "timestamp": datetime.now().isoformat(),
-                "error": error_message
-            }
-            response_json = json.dumps(response, ensure_ascii=False, indent=2)
-            response_bytes = response_json.encode('utf-8')
-            
-            # 发送响应长度
-            client_socket.sendall(struct.pack("!I", len(response_bytes)))
-            # 发送响应内容
-            client_socket.sendall(response_bytes)
+            body = self.encode_error_response(error_message, codec, extra)
+            with send_lock or nullcontext():
+                send_response_frame(client_socket, body)
             
             self.logger.error(f"错误响应已发送: {error_message}")
             
@@ -199,33 +791,215 @@ class NetworkHandler:
             self.logger.error(f"发送错误响应时出错: {e}")
 
 
+class StreamError(RuntimeError):
+    """流式请求收到了错误响应（包括中途出错的终帧），response为完整的响应内容"""
+    
+    def __init__(self, response: Dict[str, Any]):
+        super().__init__(response.get('error'))
+        self.response = response
+
+
+def connection_dropped(sock: socket.socket) -> bool:
+    """空闲的持久连接是否已被对方关闭（不阻塞）：空闲连接上不应有数据可读，可读说明收到了FIN/RST"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
 class JSONProtocolClient:
-    """JSON协议客户端（用于测试）"""
+    """JSON协议客户端（用于测试）
+
+    keep_alive=True时复用同一个连接发送多个请求（需要服务器开启持久连接），
+    连接被服务器关闭后会自动重连；默认仍为每次请求新建连接。每个持久连接最多发送
+    max_requests_per_connection个请求（与服务器默认的单连接请求上限一致），之后换新连接
+    codec选择消息编码：json（默认，紧凑格式）、msgpack或cbor（需要安装对应的库）
+    submit()在单独的持久连接上流水线发送请求（不等待前一个响应），返回Future，
+    响应按request_id匹配，完成顺序可能与发送顺序不同（需要服务器开启持久连接）
+    host为 "unix:///路径" 时连接服务器的Unix域套接字（忽略port）
+    stream()/stream_sql()在单独的连接上读取流式响应，逐块产生结果，整个结果集不必一次放进内存
+    compress声明可以解压的算法（如 "zlib" 或 "zstd,zlib"，按优先顺序），服务器对较大的响应压缩，
+    收到的响应自动解压
+    """
     
-    def __init__(self, host: str = 'localhost', port: int = 55000):
+    def __init__(self, host: str = 'localhost', port: int = 55000, keep_alive: bool = False,
+                 codec: str = 'json', compress: Optional[str] = None, max_requests_per_connection: int = 100):
         self.host = host
         self.port = port
+        self.unix_path = parse_unix_target(host)
+        self.keep_alive = keep_alive
+        self.codec = get_codec(codec)
+        self.compress = None
+        if compress:
+            # 只声明本机可以解压的算法，未安装的算法抛出CodecError
+            names = [name.strip().lower() for name in compress.split(',') if name.strip()]
+            self.compress = ','.join(get_compressor(name).name for name in names)
+            self.codec = CompressedCodec(self.codec)
+        self.client_socket = None
+        self.max_requests_per_connection = max_requests_per_connection
+        self.requests_on_socket = 0
         self.logger = logging.getLogger(__name__)
+        
+        # 流水线连接：request_id -> Future，由后台线程读取响应并完成对应的Future
+        self.pipeline_socket = None
+        self.pipeline_reader = None
+        self.pipeline_lock = threading.Lock()
+        self.pipeline_pending = {}
+        self.next_request_id = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def connect(self) -> socket.socket:
+        """连接到服务器"""
+        if self.unix_path is not None:
+            client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                client_socket.connect(self.unix_path)
+            except OSError:
+                client_socket.close()
+                raise
+            return client_socket
+        
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.connect((self.host, self.port))
+        set_nodelay(client_socket)
+        return client_socket
+    
+    def close(self):
+        """关闭持久连接和流水线连接"""
+        self._close_keep_alive_socket()
+        
+        with self.pipeline_lock:
+            pipeline_socket, self.pipeline_socket = self.pipeline_socket, None
+            reader, self.pipeline_reader = self.pipeline_reader, None
+        if pipeline_socket:
+            try:
+                pipeline_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            pipeline_socket.close()
+        if reader and reader is not threading.current_thread():
+            reader.join()
+    
+    def _close_keep_alive_socket(self):
+        """只关闭send_json_data使用的持久连接，流水线连接上未完成的请求不受影响"""
+        if self.client_socket:
+            try:
+                self.client_socket.close()
+            except OSError:
+                pass
+            self.client_socket = None
+        self.requests_on_socket = 0
+    
+    def submit(self, data: Dict[str, Any], filename: str = "request.json") -> Future:
+        """流水线发送一个请求，返回Future，结果为服务器响应（字典）
+
+        连接断开时尚未收到响应的Future以ConnectionError结束
+        """
+        future = Future()
+        request_id = None
+        with self.pipeline_lock:
+            try:
+                if self.pipeline_socket is None:
+                    self.pipeline_socket = self.connect()
+                    self.pipeline_reader = threading.Thread(target=self.pipeline_read_loop,
+                                                            args=(self.pipeline_socket,),
+                                                            name='pipeline-reader', daemon=True)
+                    self.pipeline_reader.start()
+                
+                self.next_request_id += 1
+                request_id = str(self.next_request_id)
+                self.pipeline_pending[request_id] = future
+                # 请求ID放在文件名参数中，服务器在响应中原样返回
+                self.send_request(self.pipeline_socket, data, f"{filename};id={request_id}")
+            except Exception as e:
+                self.logger.error(f"流水线发送请求时出错: {e}")
+                self.pipeline_pending.pop(request_id, None)
+                future.set_exception(e)
+        return future
+    
+    def stream(self, data: Dict[str, Any], filename: str = "request.json") -> Iterator[Any]:
+        """发送请求并逐帧读取流式响应（请求中需带 "stream": true），依次产生每个续帧的result
+
+        服务器返回普通响应（如旧服务器不支持流式）时产生其result后结束；
+        错误响应抛出StreamError；迭代结束或中途放弃时关闭本次使用的连接
+        """
+        client_socket = self.connect()
+        try:
+            self.send_request(client_socket, data, filename)
+            while True:
+                content = read_response_frame(client_socket)
+                if content is None:
+                    raise ConnectionError("流式响应结束之前连接已关闭")
+                response = self.codec.decode(content)
+                status = response.get('status')
+                if status == 'partial':
+                    yield response.get('result')
+                    continue
+                if status == 'error':
+                    raise StreamError(response)
+                if not response.get('stream_end'):
+                    yield response.get('result')
+                return
+        finally:
+            client_socket.close()
+    
+    def stream_sql(self, sql_query: str, chunk_rows: Optional[int] = None) -> Iterator[List[Any]]:
+        """流式执行SELECT，逐行产生结果；chunk_rows为服务器每帧发送的行数"""
+        data = {"sql_query": sql_query, "stream": True}
+        if chunk_rows is not None:
+            data["chunk_rows"] = chunk_rows
+        for chunk in self.stream(data):
+            if isinstance(chunk, dict):
+                yield from chunk.get('data', [])
+            elif isinstance(chunk, str):
+                # 处理函数以字符串返回的错误（如SQL语法错误）
+                raise StreamError({"status": "error", "error": chunk})
+    
+    def pipeline_read_loop(self, client_socket: socket.socket):
+        """后台读取流水线连接上的响应，按request_id完成对应的Future"""
+        error = ConnectionError("流水线连接已关闭")
+        try:
+            while True:
+                response_content = read_response_frame(client_socket)
+                if response_content is None:
+                    break
+                response = self.codec.decode(response_content)
+                with self.pipeline_lock:
+                    future = self.pipeline_pending.pop(str(response.get("request_id")), None)
+                if future is None:
+                    self.logger.warning(f"收到未知请求ID的响应: {response.get('request_id')}")
+                    continue
+                future.set_result(response)
+        except Exception as e:
+            error = ConnectionError(f"流水线连接中断: {e}")
+        finally:
+            with self.pipeline_lock:
+                pending = list(self.pipeline_pending.values())
+                self.pipeline_pending.clear()
+                if self.pipeline_socket is client_socket:
+                    # 连接被服务器关闭，下一次submit重新连接
+                    self.pipeline_socket = None
+                    self.pipeline_reader = None
+                    client_socket.close()
+            for future in pending:
+                future.set_exception(error)
     
     def send_json_data(self, data: Dict[str, Any], filename: str = "request.json") -> Optional[Dict[str, Any]]:
         """发送JSON数据到服务器"""
+        if self.keep_alive:
+            return self.send_json_data_keep_alive(data, filename)
+        
         try:
             # 连接到服务器
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((self.host, self.port))
-            
-            # 准备JSON数据
-            json_str = json.dumps(data, ensure_ascii=False, indent=2)
-            json_bytes = json_str.encode('utf-8')
+            client_socket = self.connect()
             
-            # 发送文件名长度和文件名
-            filename_bytes = filename.encode('utf-8')
-            client_socket.sendall(struct.pack("!I", len(filename_bytes)))
-            client_socket.sendall(filename_bytes)
-            
-            # 发送文件大小和内容
-            client_socket.sendall(struct.pack("!I", len(json_bytes)))
-            client_socket.sendall(json_bytes)
+            self.send_request(client_socket, data, filename)
             
             # 接收响应
             response = self.receive_response(client_socket)
@@ -240,30 +1014,69 @@ class JSONProtocolClient:
             self.logger.error(f"发送JSON数据时出错: {e}")
             return None
     
+    def send_json_data_keep_alive(self, data: Dict[str, Any], filename: str = "request.json") -> Optional[Dict[str, Any]]:
+        """在持久连接上发送JSON数据
+
+        复用的连接已被服务器关闭（空闲超时或达到请求上限）时换新连接：发送前发现连接已关闭、
+        或请求没能发出（发送失败）时服务器没有收到请求，在新连接上重发一次；请求发出之后连接中断、
+        读取超时或响应不完整时不重发（无法确定服务器是否已经执行了请求）
+        """
+        for attempt in range(2):
+            if self.client_socket is not None and (self.requests_on_socket >= self.max_requests_per_connection
+                                                   or connection_dropped(self.client_socket)):
+                # 服务器已经（或处理完上一个请求后即将）关闭连接，不在上面发送请求
+                self._close_keep_alive_socket()
+            reused = self.client_socket is not None
+            try:
+                if not reused:
+                    self.client_socket = self.connect()
+                try:
+                    self.send_request(self.client_socket, data, filename)
+                except OSError as e:
+                    # 请求没有完整发出，服务器不会处理
+                    self._close_keep_alive_socket()
+                    if reused:
+                        continue
+                    self.logger.error(f"发送JSON数据时出错: {e}")
+                    return None
+                self.requests_on_socket += 1
+                response_content = read_response_frame(self.client_socket)
+            except Exception as e:
+                self.logger.error(f"发送JSON数据时出错: {e}")
+                self._close_keep_alive_socket()
+                return None
+            
+            if response_content is None:
+                self.logger.error("服务器关闭了连接，没有返回响应")
+                self._close_keep_alive_socket()
+                return None
+            
+            try:
+                return self.codec.decode(response_content)
+            except Exception as e:
+                self.logger.error(f"接收响应时出错: {e}")
+                return None
+        
+        return None
+    
+    def send_request(self, client_socket: socket.socket, data: Dict[str, Any], filename: str):
+        """按协议发送一个请求帧"""
+        # 准备消息体，非JSON编码通过文件名参数告知服务器
+        json_bytes = self.codec.encode(data)
+        
+        # 文件名长度、文件名、文件大小和内容通过一次sendmsg发出
+        send_request_frame(client_socket, frame_name(self.codec.name, filename, self.compress), json_bytes)
+    
     def receive_response(self, client_socket: socket.socket) -> Optional[Dict[str, Any]]:
         """接收服务器响应"""
         try:
-            # 接收响应长度
-            raw_len = client_socket.recv(4)
-            if not raw_len:
+            # 按精确长度读取响应帧
+            response_content = read_response_frame(client_socket)
+            if response_content is None:
                 return None
-            response_len = struct.unpack("!I", raw_len)[0]
-            
-            # 接收响应内容
-            response_content = b""
-            received = 0
-            while received < response_len:
-                chunk = client_socket.recv(min(4096, response_len - received))
-                if not chunk:
-                    break
-                response_content += chunk
-                received += len(chunk)
-            
-            # 解析JSON响应
-            response_str = response_content.decode('utf-8')
-            response_data = json.loads(response_str)
             
-            return response_data
+            # 解析响应
+            return self.codec.decode(response_content)
             
         except Exception as e:
             self.logger.error(f"接收响应时出错: {e}")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应压缩
+客户端在请求帧文件名中用 ;compress=zstd,zlib 参数声明可以解压的算法（按优先顺序），
+服务器选择其中第一个本机可用的算法，响应消息体不小于阈值时压缩：
+- 压缩后的消息体为 0x00 + 算法名 + 0x00 + 压缩数据
+- 未压缩的消息体总是JSON/MessagePack/CBOR编码的字典，不会以0x00开头，客户端据此区分
+- 没有声明compress参数的旧客户端收到的响应不变
+服务器解码请求体时限制解压后的长度（max_body_size），超过时与过长的请求帧一样以body_too_large拒绝
+zlib使用标准库；zstd需要安装zstandard
+"""
+
+import zlib
+from typing import Optional, Union
+
+from network.codec import CodecError
+from network.framing import FrameRejected
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_MARKER = b'\x00'
+
+# 响应消息体小于该字节数时不压缩（小帧压缩收益不抵CPU开销）
+DEFAULT_COMPRESS_THRESHOLD = 8192
+
+
+class ZlibCompressor:
+    """zlib压缩（标准库）"""
+    name = 'zlib'
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data, max_size: Optional[int] = None) -> bytes:
+        try:
+            if max_size is None:
+                return zlib.decompress(data)
+            # 最多解压出max_size + 1字节，超出上限时不再继续解压
+            decompressor = zlib.decompressobj()
+            result = decompressor.decompress(data, max_size + 1)
+        except zlib.error as e:
+            raise CodecError(f"zlib解压错误: {e}") from e
+        check_decompressed_size(len(result), max_size)
+        if not decompressor.eof:
+            raise CodecError("zlib解压错误: 压缩数据不完整")
+        return result
+
+
+class ZstdCompressor:
+    """zstd压缩（需要安装zstandard），压缩速度和压缩率都优于zlib"""
+    name = 'zstd'
+
+    def __init__(self, level: int = 3):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # ZstdCompressor对象不能在多个线程中同时使用，每次压缩单独创建
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data, max_size: Optional[int] = None) -> bytes:
+        try:
+            if max_size is None:
+                return zstandard.ZstdDecompressor().decompress(data)
+            # 流式解压最多读出max_size + 1字节（帧头中没有内容长度时decompress()也无法限制输出）
+            with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+                result = reader.read(max_size + 1)
+        except zstandard.ZstdError as e:
+            raise CodecError(f"zstd解压错误: {e}") from e
+        check_decompressed_size(len(result), max_size)
+        return result
+
+
+def check_decompressed_size(size: int, max_size: Optional[int]):
+    """解压后的长度超过上限时抛出FrameRejected（错误码与过长的请求帧相同）"""
+    if max_size is not None and size > max_size:
+        raise FrameRejected("body_too_large", f"请求帧内容解压后超过上限 {max_size} 字节", limit=max_size)
+
+
+COMPRESSORS = {'zlib': ZlibCompressor()}
+if zstandard is not None:
+    COMPRESSORS['zstd'] = ZstdCompressor()
+
+
+def get_compressor(name: str):
+    """按名称获取压缩算法，未知或未安装时抛出CodecError"""
+    compressor = COMPRESSORS.get(name)
+    if compressor is None:
+        raise CodecError(f"不支持的压缩算法: {name}，可用算法: {', '.join(COMPRESSORS)}")
+    return compressor
+
+
+def negotiate_compression(offer: Optional[str]):
+    """从客户端声明的算法列表（"zstd,zlib"）中选择第一个可用的，都不可用时返回None"""
+    for name in (offer or '').split(','):
+        compressor = COMPRESSORS.get(name.strip().lower())
+        if compressor is not None:
+            return compressor
+    return None
+
+
+def compress_body(body: bytes, compressor, threshold: int) -> bytes:
+    """消息体不小于threshold时压缩；压缩后没有变小的（如已压缩的数据）原样返回"""
+    if compressor is None or len(body) < threshold:
+        return body
+    compressed = compressor.compress(body)
+    if len(compressed) >= len(body):
+        return body
+    return b''.join((COMPRESSION_MARKER, compressor.name.encode('ascii'), COMPRESSION_MARKER, compressed))
+
+
+def decompress_body(data: Union[bytes, bytearray], max_size: Optional[int] = None) -> Union[bytes, bytearray]:
+    """识别并解压压缩过的消息体，未压缩的原样返回；解压后超过max_size字节时抛出FrameRejected"""
+    if not data.startswith(COMPRESSION_MARKER):
+        return data
+    end = data.find(COMPRESSION_MARKER, 1)
+    if end < 0:
+        raise CodecError("压缩的消息体缺少算法名")
+    compressor = get_compressor(bytes(data[1:end]).decode('ascii', 'replace'))
+    return compressor.decompress(memoryview(data)[end + 1:], max_size)
+
+
+class CompressedCodec:
+    """在消息编码外层加上压缩：encode的结果不小于threshold时压缩，decode自动识别压缩过的消息体
+
+    compressor为None时只解压不压缩（客户端）；max_decompressed_size限制decode解压后的长度（服务器解码请求体）
+    """
+
+    def __init__(self, codec, compressor=None, threshold: int = DEFAULT_COMPRESS_THRESHOLD,
+                 max_decompressed_size: Optional[int] = None):
+        self.codec = codec
+        self.compressor = compressor
+        self.threshold = threshold
+        self.max_decompressed_size = max_decompressed_size
+        # 帧文件名中的编码参数与内层编码相同
+        self.name = codec.name
+
+    def encode(self, obj) -> bytes:
+        return compress_body(self.codec.encode(obj), self.compressor, self.threshold)
+
+    def decode(self, data):
+        return self.codec.decode(decompress_body(data, self.max_decompressed_size))
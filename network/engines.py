@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+网络引擎
+所有引擎实现NetworkHandler的接口（start_server/stop_server/set_request_handler/set_ready_callback/
+listen_sockets/network_stats等），共用帧读写、准入限制、编码协商、流水线、流式响应和响应编码代码，
+只是连接的调度方式不同：
+- threaded: 每个连接由工作线程池中的一个线程阻塞读写（默认）
+- selectors: 一个事件循环线程用selectors（Linux上为epoll）非阻塞读写所有连接，请求在线程池中执行
+- asyncio: asyncio事件循环，请求在线程池中执行
+- uvloop: 与asyncio相同，事件循环换成uvloop（需要安装uvloop）
+"""
+
+from typing import List
+
+from network.communication import NetworkHandler
+from network.selector_server import SelectorNetworkHandler
+from network.async_server import AsyncNetworkHandler, UvloopNetworkHandler
+
+
+ENGINES = {
+    'threaded': NetworkHandler,
+    'selectors': SelectorNetworkHandler,
+    'asyncio': AsyncNetworkHandler,
+    'uvloop': UvloopNetworkHandler,
+}
+
+DEFAULT_ENGINE = 'threaded'
+
+# 用executor_workers（而不是worker_threads）设置执行请求的线程数的引擎
+EXECUTOR_ENGINES = ('asyncio', 'uvloop')
+
+
+def available_engines() -> List[str]:
+    """当前环境可以使用的引擎"""
+    return [name for name, handler_class in ENGINES.items() if handler_class.available()]
+
+
+def create_network_handler(engine: str = DEFAULT_ENGINE, host: str = '0.0.0.0', port: int = 55000,
+                           **options) -> NetworkHandler:
+    """按名称创建网络处理器，options为对应引擎的构造参数；未知或当前环境不可用的引擎抛出ValueError"""
+    handler_class = ENGINES.get(engine)
+    if handler_class is None:
+        raise ValueError(f"未知的网络引擎: {engine}，可用引擎: {', '.join(available_engines())}")
+    if not handler_class.available():
+        raise ValueError(f"网络引擎 {engine} 在当前环境中不可用（需要安装{engine}），"
+                         f"可用引擎: {', '.join(available_engines())}")
+    return handler_class(host, port, **options)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+帧读写
+服务器和JSONProtocolClient共用的协议帧读写：
+- 请求帧：4字节文件名长度 + 文件名 + 4字节内容长度 + 内容
+- 响应帧：4字节长度 + 内容
+所有长度字段和内容都按精确长度读取（recv可能只返回部分数据），
+内容直接recv_into到预先分配好的bytearray中，不做分块拼接；
+写出时长度字段和内容通过sendmsg一次系统调用发送，不拼接、不分多次发送
+服务器读取请求帧时先检查长度字段是否超过上限再分配缓冲区，并限制读完整个帧的时间
+"""
+
+import time
+import socket
+import struct
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+HEADER = struct.Struct("!I")
+
+
+class IncompleteFrameError(EOFError):
+    """连接在帧中途关闭，partial为已经读到的字节数"""
+
+    def __init__(self, expected: int, partial: int):
+        super().__init__(f"连接在帧中途关闭: 需要 {expected} 字节，只收到 {partial} 字节")
+        self.expected = expected
+        self.partial = partial
+
+
+class FrameRejected(Exception):
+    """请求帧未被接受（长度超过上限或读取超时），code为错误码，details为错误帧中附带的字段"""
+
+    def __init__(self, code: str, message: str, **details: Any):
+        super().__init__(message)
+        self.code = code
+        self.details = details
+
+
+class FrameTooLargeError(FrameRejected):
+    """长度字段超过上限（field为filename或body），此时尚未分配缓冲区"""
+
+    def __init__(self, field: str, size: int, limit: int):
+        name = '文件名' if field == 'filename' else '内容'
+        super().__init__(f"{field}_too_large", f"请求帧{name}长度 {size} 字节超过上限 {limit} 字节", limit=limit)
+
+
+class FrameTimeoutError(FrameRejected):
+    """未能在限定时间内读完整个请求帧（如慢速发送的客户端）"""
+
+    def __init__(self, timeout: float):
+        super().__init__("read_timeout", f"未在 {timeout} 秒内收到完整的请求帧", timeout=timeout)
+
+
+def check_frame_size(field: str, size: int, limit: Optional[int]):
+    """长度字段超过上限时抛出FrameTooLargeError（在分配缓冲区之前调用）"""
+    if limit is not None and size > limit:
+        raise FrameTooLargeError(field, size, limit)
+
+
+def recv_into_exactly(sock: socket.socket, buffer, deadline: Optional[float] = None) -> int:
+    """把buffer（bytearray或memoryview）读满，返回读取的字节数
+
+    连接在读满之前关闭时抛出IncompleteFrameError；
+    deadline（time.monotonic()时间）不为None时，超过该时间仍未读满抛出socket.timeout
+    """
+    view = memoryview(buffer)
+    size = len(view)
+    received = 0
+    while received < size:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("读取超时")
+            sock.settimeout(remaining)
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise IncompleteFrameError(size, received)
+        received += count
+    return received
+
+
+def recv_exactly(sock: socket.socket, size: int, deadline: Optional[float] = None) -> bytearray:
+    """精确读取size字节，返回新分配的bytearray"""
+    buffer = bytearray(size)
+    recv_into_exactly(sock, buffer, deadline)
+    return buffer
+
+
+def recv_length(sock: socket.socket, at_boundary: bool = False, deadline: Optional[float] = None) -> Optional[int]:
+    """读取4字节长度字段
+
+    at_boundary为True时，连接在读到任何字节之前关闭返回None（对方正常关闭连接）
+    """
+    buffer = bytearray(HEADER.size)
+    try:
+        recv_into_exactly(sock, buffer, deadline)
+    except IncompleteFrameError as e:
+        if at_boundary and e.partial == 0:
+            return None
+        raise
+    return HEADER.unpack(buffer)[0]
+
+
+def read_request_frame(sock: socket.socket, max_name_size: Optional[int] = None,
+                       max_body_size: Optional[int] = None,
+                       timeout: Optional[float] = None) -> Optional[Tuple[str, bytearray]]:
+    """读取一个请求帧，返回(文件名, 内容)；连接在帧边界处关闭时返回None
+
+    文件名或内容长度超过上限时，在分配缓冲区之前抛出FrameTooLargeError；
+    timeout不为None时整个帧（从等待第一个字节开始）必须在timeout秒内读完，否则抛出FrameTimeoutError，
+    读完后恢复套接字原来的超时设置
+    """
+    if timeout is None:
+        return _read_request_frame(sock, max_name_size, max_body_size, None)
+
+    previous = sock.gettimeout()
+    try:
+        return _read_request_frame(sock, max_name_size, max_body_size, time.monotonic() + timeout)
+    except socket.timeout:
+        raise FrameTimeoutError(timeout) from None
+    finally:
+        sock.settimeout(previous)
+
+
+def _read_request_frame(sock: socket.socket, max_name_size: Optional[int], max_body_size: Optional[int],
+                        deadline: Optional[float]) -> Optional[Tuple[str, bytearray]]:
+    name_len = recv_length(sock, at_boundary=True, deadline=deadline)
+    if name_len is None:
+        return None
+    check_frame_size('filename', name_len, max_name_size)
+    filename = recv_exactly(sock, name_len, deadline).decode('utf-8')
+    body_len = recv_length(sock, deadline=deadline)
+    check_frame_size('body', body_len, max_body_size)
+    body = recv_exactly(sock, body_len, deadline)
+    return filename, body
+
+
+def read_response_frame(sock: socket.socket) -> Optional[bytearray]:
+    """读取一个响应帧的内容；连接在帧边界处关闭时返回None"""
+    size = recv_length(sock, at_boundary=True)
+    if size is None:
+        return None
+    return recv_exactly(sock, size)
+
+
+def set_nodelay(sock: socket.socket):
+    """关闭Nagle算法，小响应不再等待对方的延迟确认"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError):
+        # 非TCP套接字（如Unix域套接字）不支持该选项
+        pass
+
+
+def send_buffers(sock: socket.socket, buffers: Sequence[bytes]):
+    """用sendmsg一次发送多个缓冲区（scatter-gather），部分发送时继续发送剩余部分"""
+    if not hasattr(sock, 'sendmsg'):
+        # 不支持sendmsg的平台（Windows）合并成一个缓冲区发送
+        sock.sendall(b''.join(buffers))
+        return
+
+    views: List[memoryview] = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def send_response_frame(sock: socket.socket, body: bytes):
+    """发送一个响应帧：4字节长度 + 内容"""
+    send_buffers(sock, (HEADER.pack(len(body)), body))
+
+
+def send_request_frame(sock: socket.socket, filename: str, body: bytes):
+    """发送一个请求帧：文件名长度 + 文件名 + 内容长度 + 内容"""
+    filename_bytes = filename.encode('utf-8')
+    send_buffers(sock, (HEADER.pack(len(filename_bytes)), filename_bytes, HEADER.pack(len(body)), body))
+
+
+def response_frame(body: bytes) -> bytes:
+    """构造完整的响应帧字节串（用于asyncio等需要单个缓冲区的场景）"""
+    return HEADER.pack(len(body)) + body
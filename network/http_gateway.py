@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP/JSON网关
+在第二个端口上提供HTTP/1.1接口（持久连接），浏览器前端不再需要经过额外的转换代理：
+- POST /api/<op>: 请求体为JSON对象，等价于TCP协议中的 {"op": "<op>", ...}
+- GET /api/<op>?参数=值: 只读操作（注册时readonly=True）也可以用GET调用；响应带ETag，
+  请求头If-None-Match与之匹配时返回304，不再发送响应体
+- 响应内容与TCP协议相同: {"status": "success", "timestamp", "result"}；请求头带 Accept-Encoding: gzip
+  且响应体不小于压缩阈值（--compress-threshold）时gzip压缩
+- 流式结果（sql_query带 "stream": true）用分块传输编码发送，每帧一行JSON（NDJSON），格式与TCP协议的续帧/终帧相同
+- GET <push_path>（如 /ws/queue?doctor_name=王医生）升级为WebSocket，握手后连接交给推送中心（network/push_hub.py），
+  不再占用HTTP工作线程
+请求解析成字典后直接交给网络处理器的request_handler（即MedicalServer.process_json_data），
+与TCP请求共用路由、调用统计、内容日志策略和响应编码；结果只编码一次
+连接由有界线程池处理，正在处理和排队的连接超过上限时回复503和Retry-After
+"""
+
+import gzip
+import socket
+import hashlib
+import logging
+import threading
+import time
+import zlib
+import http.server
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import parse_qsl, unquote
+
+from network.codec import JSON_CODEC, CodecError
+from network.listener import create_listen_socket, inherited_listen_socket
+from network.streaming import StreamingResult
+from network.websocket import WEBSOCKET_VERSION, accept_key, is_upgrade_request, valid_client_key
+
+
+API_PREFIX = '/api/'
+
+# WebSocket推送的默认路径
+DEFAULT_PUSH_PATH = '/ws/queue'
+
+# 处理HTTP连接的默认线程数
+DEFAULT_HTTP_WORKERS = 16
+
+# gzip压缩级别（与zlib默认级别相同）
+GZIP_LEVEL = 6
+
+
+def etag_for(data: bytes) -> str:
+    """响应结果的ETag（弱校验：gzip压缩与否不影响匹配）"""
+    return f'W/"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match请求头是否与ETag匹配（弱比较）"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    opaque = etag[2:]
+    return any(tag.strip().removeprefix('W/') == opaque for tag in header.split(','))
+
+
+class GatewayRequestHandler(http.server.BaseHTTPRequestHandler):
+    """单个HTTP连接：持久连接上依次处理请求，交给HTTPGateway执行"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MedicalServer'
+    # 响应头和响应体分两次写出，关闭Nagle算法避免与客户端的延迟确认叠加产生40ms延迟
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        # 等待下一个请求和读取请求体的超时与TCP持久连接的空闲超时相同
+        self.timeout = self.server.gateway.network_handler.idle_timeout
+        self.requests_served = 0
+        super().setup()
+
+    def handle_one_request(self):
+        """等待下一个请求（空闲期间网关停止时直接关闭连接），然后交给BaseHTTPRequestHandler解析
+
+        新接受的连接总是读取并处理第一个请求：停止前已经接受的连接上客户端已经（或正要）发送请求
+        """
+        gateway = self.server.gateway
+        idle = self.requests_served > 0
+        if idle and not gateway.running:
+            self.close_connection = True
+            return
+        if idle:
+            with gateway.stats_lock:
+                gateway.idle_connections.add(self.connection)
+        try:
+            # 只窥探数据而不消费（已缓冲的数据直接返回），真正的读取交给BaseHTTPRequestHandler
+            if not self.rfile.peek(1):
+                self.close_connection = True
+                return
+        except (socket.timeout, OSError, ValueError):
+            self.close_connection = True
+            return
+        finally:
+            if idle:
+                with gateway.stats_lock:
+                    gateway.idle_connections.discard(self.connection)
+        self.requests_served += 1
+        super().handle_one_request()
+        if not gateway.running:
+            self.close_connection = True
+
+    def do_GET(self):
+        self.server.gateway.handle_request(self, 'GET')
+
+    def do_POST(self):
+        self.server.gateway.handle_request(self, 'POST')
+
+    def do_OPTIONS(self):
+        self.server.gateway.handle_preflight(self)
+
+    def log_message(self, format, *args):
+        # 访问日志由网络处理器的内容日志策略记录，这里只保留调试信息
+        self.server.gateway.logger.debug(f"HTTP {self.address_string()} {format % args}")
+
+
+class GatewayHTTPServer(http.server.HTTPServer):
+    """使用传入的监听套接字、由网关的有界线程池处理连接的HTTPServer"""
+
+    def __init__(self, gateway: 'HTTPGateway', listen_socket: socket.socket):
+        super().__init__(listen_socket.getsockname()[:2], GatewayRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.server_name, self.server_port = listen_socket.getsockname()[:2]
+        self.gateway = gateway
+
+    def process_request(self, request: socket.socket, client_address: Any):
+        self.gateway.dispatch_connection(self, request, client_address)
+
+    def shutdown_request(self, request: socket.socket):
+        # 升级为WebSocket的连接已交给推送中心，不能关闭
+        if self.gateway.release_detached(request):
+            return
+        super().shutdown_request(request)
+
+    def process_request_thread(self, request: socket.socket, client_address: Any):
+        """工作线程：处理一个连接上的所有请求"""
+        try:
+            self.finish_request(request, client_address)
+        except Exception as e:
+            self.gateway.logger.error(f"处理HTTP客户端 {client_address} 时出错: {e}")
+        finally:
+            self.shutdown_request(request)
+            self.gateway.connection_finished()
+
+
+class HTTPGateway:
+    """HTTP/JSON网关：共用网络处理器的请求处理器、日志策略、准入限制和响应编码
+
+    network_handler为TCP协议使用的网络处理器（任意引擎），router用于识别操作名和只读操作，
+    push_hub为接管WebSocket订阅连接的推送中心（None表示不提供推送）
+    """
+
+    def __init__(self, network_handler, router, host: str = '0.0.0.0', port: int = 8080,
+                 workers: int = DEFAULT_HTTP_WORKERS, cors_origin: Optional[str] = None,
+                 push_hub=None, push_path: str = DEFAULT_PUSH_PATH, reuse_port: bool = False):
+        self.network_handler = network_handler
+        self.router = router
+        self.host = host
+        self.port = port
+        self.workers = workers
+        # 允许跨域调用的来源（如 "https://his.example.com" 或 "*"），None表示不发送CORS响应头
+        self.cors_origin = cors_origin
+        self.push_hub = push_hub
+        self.push_path = push_path
+        # 多进程模式的各工作进程用SO_REUSEPORT各自绑定该端口；单进程模式不开启，避免与无关进程分摊端口
+        self.reuse_port = reuse_port
+        # 已交给推送中心的套接字（处理线程结束时不关闭）
+        self.detached = set()
+        self.server = None
+        self.executor = None
+        self.serve_thread = None
+        self.running = False
+        self.drain_deadline = None
+        self.stats_lock = threading.Lock()
+        # 正在处理或排队的连接数，以及等待下一个请求的持久连接（停止时直接关闭）
+        self.pending_connections = 0
+        self.idle_connections = set()
+        self.counters = {'requests': 0, 'not_modified': 0, 'gzip': 0, 'streams': 0, 'websocket_upgrades': 0,
+                         'rejected': 0, 'errors': 0}
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """开始监听；平滑重启时接管上一代进程传下来的监听套接字"""
+        listen_socket = inherited_listen_socket(port=self.port)
+        if listen_socket is not None:
+            self.logger.info(f"已接管上一代进程的HTTP监听套接字 (fd: {listen_socket.fileno()})")
+        else:
+            listen_socket = create_listen_socket(self.host, self.port, self.network_handler.backlog,
+                                                 reuse_port=self.reuse_port)
+        self.server = GatewayHTTPServer(self, listen_socket)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='http-worker')
+        self.running = True
+        self.serve_thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.5},
+                                             name='http-gateway', daemon=True)
+        self.serve_thread.start()
+        self.logger.info(f"HTTP网关已启动（工作线程 {self.workers}），监听地址: http://{self.host}:{self.port}{API_PREFIX}")
+
+    def stop(self, drain_timeout: Optional[float] = None):
+        """停止接受新连接（可在信号处理器中调用，不阻塞），空闲的持久连接直接关闭；
+        正在处理的请求由wait_stopped等待，drain_timeout的含义与网络处理器相同"""
+        if self.server is None or not self.running:
+            return
+        if drain_timeout is not None:
+            self.drain_deadline = time.monotonic() + drain_timeout
+        self.running = False
+        # shutdown会等待serve_forever退出，放到单独的线程中执行
+        threading.Thread(target=self.server.shutdown, name='http-gateway-stop', daemon=True).start()
+        self.close_idle_connections()
+        self.logger.info("HTTP网关已停止接受新连接")
+
+    def listen_sockets(self) -> List[socket.socket]:
+        """正在使用的监听套接字（平滑重启时交给新进程）"""
+        return [self.server.socket] if self.server is not None and self.running else []
+
+    def wait_stopped(self):
+        """等待正在处理的HTTP请求完成（最多到平滑退出的截止时间），然后关闭监听套接字和线程池"""
+        if self.server is None:
+            return
+        self.stop()
+        if self.serve_thread is not None:
+            self.serve_thread.join()
+        while self.pending_connections and self.drain_deadline is not None and time.monotonic() < self.drain_deadline:
+            self.close_idle_connections()
+            time.sleep(0.05)
+        if self.pending_connections:
+            self.logger.warning(f"HTTP网关停止时仍有 {self.pending_connections} 个连接未处理完")
+        self.server.server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.server = None
+
+    def close_idle_connections(self):
+        """关闭等待下一个请求的持久连接"""
+        with self.stats_lock:
+            for connection in self.idle_connections:
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+
+    def dispatch_connection(self, server: GatewayHTTPServer, request: socket.socket, client_address: Any):
+        """把新连接交给线程池；正在处理和排队的连接超过上限时回复503"""
+        handler = self.network_handler
+        with self.stats_lock:
+            overloaded = self.pending_connections >= self.workers + handler.queue_size
+            if not overloaded:
+                self.pending_connections += 1
+        if overloaded:
+            with self.stats_lock:
+                self.counters['rejected'] += 1
+            body = handler.encode_error_response("服务器繁忙，请稍后重试", JSON_CODEC,
+                                                 {"error_code": "server_busy", "retry_after": handler.retry_after})
+            head = (f"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\nRetry-After: {max(1, round(handler.retry_after))}\r\n"
+                    f"Connection: close\r\n\r\n").encode('ascii')
+            try:
+                request.settimeout(handler.retry_after)
+                request.sendall(head + body)
+            except OSError:
+                pass
+            server.shutdown_request(request)
+            self.logger.warning(f"HTTP网关繁忙，拒绝客户端 {client_address}")
+            return
+        try:
+            self.executor.submit(server.process_request_thread, request, client_address)
+        except RuntimeError:
+            # 网关正在停止，线程池已关闭
+            server.shutdown_request(request)
+            self.connection_finished()
+
+    def connection_finished(self):
+        with self.stats_lock:
+            self.pending_connections -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """HTTP网关统计"""
+        with self.stats_lock:
+            return dict(self.counters, port=self.port, workers=self.workers,
+                        active_connections=self.pending_connections)
+
+    def count(self, name: str):
+        with self.stats_lock:
+            self.counters[name] += 1
+
+    def handle_preflight(self, request: GatewayRequestHandler):
+        """CORS预检请求"""
+        if not self.cors_origin:
+            self.send_error(request, 405, "不支持的请求方法", allow='GET, POST')
+            return
+        request.send_response(204)
+        self.send_cors_headers(request)
+        request.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        request.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        request.send_header('Access-Control-Max-Age', '600')
+        request.send_header('Content-Length', '0')
+        request.end_headers()
+
+    def handle_request(self, request: GatewayRequestHandler, method: str):
+        """解析 /api/<op> 请求，执行请求处理器并写回响应"""
+        self.count('requests')
+        # 先读完请求体，出错回复后持久连接上的下一个请求才能正确解析
+        if method == 'POST':
+            data = self.read_json_body(request)
+            if data is None:
+                return
+        elif request.headers.get('Content-Length', '0') != '0' or request.headers.get('Transfer-Encoding'):
+            # GET请求不读取请求体，回复后关闭连接
+            request.close_connection = True
+
+        path, _, query = request.path.partition('?')
+        if method == 'GET' and self.push_hub is not None and path == self.push_path:
+            self.handle_websocket(request, query)
+            return
+        if not path.startswith(API_PREFIX):
+            self.send_error(request, 404, f"未知的路径: {path}，接口地址为 {API_PREFIX}<操作名>")
+            return
+        op = unquote(path[len(API_PREFIX):]).strip('/')
+        if not self.router.has_operation(op):
+            self.send_error(request, 404, f"未知的操作 {op}，可用操作: {', '.join(self.router.operations())}")
+            return
+        if method == 'GET':
+            if not self.router.is_readonly(op):
+                self.send_error(request, 405, f"操作 {op} 会修改数据，只能用POST调用", allow='POST')
+                return
+            data = dict(parse_qsl(query, keep_blank_values=True))
+        data['op'] = op
+
+        handler = self.network_handler
+        client_addr = request.client_address
+        logged_op = handler.log_request(client_addr, data)
+        with handler.stats_lock:
+            handler.inflight += 1
+        try:
+            if handler.request_handler:
+                result = handler.request_handler(data)
+            else:
+                result = "错误: 未设置请求处理器"
+        except Exception as e:
+            self.count('errors')
+            self.logger.error(f"处理HTTP客户端 {client_addr} 时出错: {e}")
+            self.send_error(request, 500, f"服务器内部错误: {str(e)}")
+            return
+        finally:
+            with handler.stats_lock:
+                handler.inflight -= 1
+
+        if isinstance(result, StreamingResult):
+            self.send_stream(request, result)
+        else:
+            self.send_result(request, result, cacheable=(method == 'GET'))
+        handler.log_response(logged_op, result)
+
+    def handle_websocket(self, request: GatewayRequestHandler, query: str):
+        """WebSocket握手，成功后把连接交给推送中心；查询参数中的主题（可重复）立即订阅"""
+        headers = request.headers
+        if not is_upgrade_request(headers):
+            self.send_error(request, 426, "该地址只接受WebSocket连接", close=True)
+            return
+        if headers.get('Sec-WebSocket-Version') != WEBSOCKET_VERSION:
+            self.send_error(request, 426, f"只支持WebSocket协议版本 {WEBSOCKET_VERSION}", close=True)
+            return
+        key = headers.get('Sec-WebSocket-Key')
+        if not valid_client_key(key):
+            self.send_error(request, 400, "无效的Sec-WebSocket-Key", close=True)
+            return
+        origin = headers.get('Origin')
+        if origin and self.cors_origin not in (None, '*') and origin != self.cors_origin:
+            self.send_error(request, 403, f"不允许来自 {origin} 的WebSocket连接", close=True)
+            return
+        if not self.push_hub.has_capacity():
+            self.count('rejected')
+            retry_after = self.network_handler.retry_after
+            self.send_error(request, 503, "推送连接数已达上限，请稍后重试", close=True, error_code='server_busy',
+                            retry_after=retry_after)
+            return
+
+        request.send_response(101)
+        request.send_header('Upgrade', 'websocket')
+        request.send_header('Connection', 'Upgrade')
+        request.send_header('Sec-WebSocket-Accept', accept_key(key))
+        request.end_headers()
+        request.close_connection = True
+        self.count('websocket_upgrades')
+
+        # 握手请求之后客户端可能已经发来了帧，取出读缓冲区中的数据（不阻塞）一并交给推送中心
+        connection = request.connection
+        connection.setblocking(False)
+        try:
+            initial_data = request.rfile.peek() or b''
+        except OSError:
+            initial_data = b''
+        topics = [value for name, value in parse_qsl(query) if name == self.push_hub.topic_key]
+        with self.stats_lock:
+            self.detached.add(connection)
+        self.push_hub.adopt(connection, request.client_address, topics, initial_data)
+
+    def release_detached(self, connection: socket.socket) -> bool:
+        """连接是否已交给推送中心"""
+        with self.stats_lock:
+            if connection in self.detached:
+                self.detached.discard(connection)
+                return True
+        return False
+
+    def read_json_body(self, request: GatewayRequestHandler) -> Optional[Dict[str, Any]]:
+        """读取并解析POST请求体（必须是JSON对象），失败时回复错误并返回None"""
+        length = request.headers.get('Content-Length')
+        if length is None:
+            if request.headers.get('Transfer-Encoding'):
+                self.send_error(request, 411, "请求体需要Content-Length", close=True)
+                return None
+            return {}
+        try:
+            length = int(length)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self.send_error(request, 400, f"无效的Content-Length: {length}", close=True)
+            return None
+        limit = self.network_handler.max_body_size
+        if limit is not None and length > limit:
+            # 不读取超长的请求体，回复后关闭连接
+            self.send_error(request, 413, f"请求体长度 {length} 字节超过上限 {limit} 字节",
+                            close=True, error_code='body_too_large', limit=limit)
+            return None
+
+        try:
+            body = request.rfile.read(length) if length else b''
+        except (socket.timeout, OSError):
+            request.close_connection = True
+            return None
+        if len(body) < length:
+            request.close_connection = True
+            return None
+        if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+            try:
+                # 解压后的长度同样受max_body_size限制，最多解压出limit + 1字节
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body = decompressor.decompress(body, 0 if limit is None else limit + 1)
+                if limit is not None and len(body) > limit:
+                    self.send_error(request, 413, f"请求体解压后超过上限 {limit} 字节",
+                                    error_code='body_too_large', limit=limit)
+                    return None
+                if not decompressor.eof:
+                    raise zlib.error("压缩数据不完整")
+            except zlib.error as e:
+                self.send_error(request, 400, f"gzip请求体解压失败: {e}")
+                return None
+
+        if not body.strip():
+            return {}
+        try:
+            data = JSON_CODEC.decode(body)
+        except CodecError as e:
+            self.send_error(request, 400, str(e))
+            return None
+        if not isinstance(data, dict):
+            self.send_error(request, 400, "请求体必须是JSON对象")
+            return None
+        return data
+
+    def encode_success(self, result: Any) -> Tuple[bytes, bytes]:
+        """编码成功响应，返回(完整响应体, 结果部分)；结果只编码一次，ETag按结果部分计算（不受timestamp影响）"""
+        result_bytes = JSON_CODEC.encode(result)
+        body = b''.join((b'{"status":"success","timestamp":"', datetime.now().isoformat().encode('ascii'),
+                         b'","result":', result_bytes, b'}'))
+        return body, result_bytes
+
+    def send_result(self, request: GatewayRequestHandler, result: Any, cacheable: bool = False):
+        """发送处理结果；GET请求带ETag，If-None-Match匹配时回复304"""
+        body, result_bytes = self.encode_success(result)
+        headers = {}
+        if cacheable:
+            etag = etag_for(result_bytes)
+            headers['ETag'] = etag
+            # 浏览器每次使用缓存之前都要用If-None-Match重新验证
+            headers['Cache-Control'] = 'no-cache'
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                self.count('not_modified')
+                request.send_response(304)
+                self.send_cors_headers(request)
+                for name, value in headers.items():
+                    request.send_header(name, value)
+                request.end_headers()
+                return
+        self.send_body(request, 200, body, headers)
+
+    def send_body(self, request: GatewayRequestHandler, status: int, body: bytes,
+                  headers: Optional[Dict[str, str]] = None, close: bool = False):
+        """发送JSON响应体，客户端接受gzip且响应体不小于压缩阈值时压缩"""
+        threshold = self.network_handler.compress_threshold
+        headers = dict(headers or {})
+        if threshold > 0:
+            headers['Vary'] = 'Accept-Encoding'
+            if len(body) >= threshold and self.accepts_gzip(request):
+                body = gzip.compress(body, GZIP_LEVEL)
+                headers['Content-Encoding'] = 'gzip'
+                self.count('gzip')
+
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json; charset=utf-8')
+        request.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers(request)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        if close:
+            request.send_header('Connection', 'close')
+            request.close_connection = True
+        request.end_headers()
+        request.wfile.write(body)
+
+    def send_stream(self, request: GatewayRequestHandler, stream: StreamingResult):
+        """用分块传输编码逐帧发送流式响应（每帧一行JSON），结束或连接中断时释放流的资源"""
+        self.count('streams')
+        chunked = request.request_version != 'HTTP/1.0'
+        try:
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+            self.send_cors_headers(request)
+            if chunked:
+                request.send_header('Transfer-Encoding', 'chunked')
+            else:
+                # HTTP/1.0不支持分块传输，以关闭连接表示响应结束
+                request.send_header('Connection', 'close')
+                request.close_connection = True
+            request.end_headers()
+            for body in self.network_handler.stream_bodies(stream, JSON_CODEC):
+                line = body + b'\n'
+                if chunked:
+                    request.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+                else:
+                    request.wfile.write(line)
+            if chunked:
+                request.wfile.write(b'0\r\n\r\n')
+        except OSError as e:
+            self.logger.error(f"发送HTTP流式响应时出错: {e}")
+            request.close_connection = True
+        finally:
+            stream.close()
+
+    def send_error(self, request: GatewayRequestHandler, status: int, message: str, allow: Optional[str] = None,
+                   close: bool = False, **extra: Any):
+        """发送JSON错误响应（格式与TCP协议的错误响应相同）"""
+        body = self.network_handler.encode_error_response(message, JSON_CODEC, extra or None)
+        self.send_body(request, status, body, {'Allow': allow} if allow else None, close=close)
+
+    def send_cors_headers(self, request: GatewayRequestHandler):
+        if self.cors_origin:
+            request.send_header('Access-Control-Allow-Origin', self.cors_origin)
+            request.send_header('Access-Control-Expose-Headers', 'ETag')
+
+    @staticmethod
+    def accepts_gzip(request: GatewayRequestHandler) -> bool:
+        """Accept-Encoding中是否包含gzip（q=0表示不接受）"""
+        for item in request.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = item.strip().partition(';')
+            if name.strip().lower() in ('gzip', '*'):
+                return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+        return False
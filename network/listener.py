@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监听套接字
+各网络引擎共用的监听套接字创建：
+- 单进程：绑定host:port
+- 多进程（--workers）：工作进程直接使用主进程创建并继承下来的监听套接字，
+  或者各自开启SO_REUSEPORT绑定同一端口，由内核在各进程间分配新连接
+- Unix域套接字（--unix-socket）：同机的报表任务、维护脚本不经过TCP协议栈，
+  可以与TCP同时监听，也可以只监听Unix域套接字（--no-tcp）；客户端使用 "unix:///路径" 作为目标
+- 平滑重启：上一代进程通过环境变量把监听套接字的文件描述符传给新进程，新进程直接接管，
+  端口始终处于监听状态
+"""
+
+import os
+import stat
+import errno
+import socket
+from typing import List, Optional
+
+
+REUSE_PORT_SUPPORTED = hasattr(socket, 'SO_REUSEPORT')
+
+# 平滑重启时上一代进程传下来的监听套接字文件描述符（逗号分隔）
+LISTEN_FD_ENV = 'MEDICAL_SERVER_LISTEN_FD'
+
+UNIX_SCHEME = 'unix://'
+# Unix域套接字文件的权限：属主和同组用户可以连接
+UNIX_SOCKET_MODE = 0o660
+
+# 从环境变量中取出、尚未被接管的监听套接字
+_inherited_sockets: Optional[List[socket.socket]] = None
+
+
+def create_listen_socket(host: str, port: int, backlog: int = 128, reuse_port: bool = False) -> socket.socket:
+    """创建并开始监听TCP套接字，失败时抛出OSError"""
+    if reuse_port and not REUSE_PORT_SUPPORTED:
+        raise OSError("当前平台不支持SO_REUSEPORT")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def parse_unix_target(target: str) -> Optional[str]:
+    """'unix:///run/medical.sock' -> '/run/medical.sock'，不是unix://目标时返回None"""
+    if target.startswith(UNIX_SCHEME):
+        return target[len(UNIX_SCHEME):]
+    return None
+
+
+def create_unix_listen_socket(path: str, backlog: int = 128) -> socket.socket:
+    """创建并开始监听Unix域套接字，失败时抛出OSError
+
+    路径上残留的套接字文件（上次异常退出留下、没有进程在监听）先删除；
+    已有进程在监听该路径时抛出EADDRINUSE
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError("当前平台不支持Unix域套接字")
+
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise OSError(errno.EEXIST, f"{path} 已存在且不是套接字文件")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        else:
+            raise OSError(errno.EADDRINUSE, f"已有进程在监听 {path}")
+        finally:
+            probe.close()
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        os.chmod(path, UNIX_SOCKET_MODE)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def inherited_listen_socket(family: int = socket.AF_INET, port: Optional[int] = None) -> Optional[socket.socket]:
+    """接管上一代进程传下来的family类型的监听套接字，没有时返回None（每个套接字只能接管一次）
+
+    port不为None时只接管绑定在该端口上的TCP套接字（同时传下了TCP协议端口和HTTP网关端口）
+    """
+    global _inherited_sockets
+    if _inherited_sockets is None:
+        _inherited_sockets = []
+        for fd in filter(None, os.environ.pop(LISTEN_FD_ENV, '').split(',')):
+            sock = socket.socket(fileno=int(fd))
+            # 以后启动的子进程不应继承该描述符（再次平滑重启时会显式传递）
+            sock.set_inheritable(False)
+            _inherited_sockets.append(sock)
+    for sock in _inherited_sockets:
+        if sock.family == family and (port is None or sock.getsockname()[1] == port):
+            _inherited_sockets.remove(sock)
+            return sock
+    return None
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推送中心
+HTTP网关完成WebSocket握手后把连接交给推送中心，由一个事件循环线程（selectors，Linux上为epoll）
+管理所有订阅连接，不占用HTTP工作线程：
+- 订阅以主题（如医生姓名）为单位；新订阅先发送快照（由snapshot_provider在线程池中查询），
+  快照发出之前到达的变更暂存，快照之后按顺序补发
+- publish(topic, message)可以在任意线程中调用（不阻塞）：消息在事件循环中编码成一个WebSocket帧，
+  同一份字节发给该主题的所有订阅者
+- 发送缓冲区超过上限的慢速订阅者被断开（客户端重连后重新获取快照），不会拖慢其他订阅者
+- 空闲连接定期发送ping，长时间没有任何数据（包括pong）的连接被断开
+- 多进程模式下各工作进程通过数据报套接字互相转发本进程发布的消息，订阅者连到哪个工作进程都能收到所有变更
+
+客户端消息（JSON文本帧）: {"op": "subscribe" | "unsubscribe", "<topic_key>": "主题"}，{"op": "ping"}
+"""
+
+import time
+import socket
+import logging
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, List, Optional, Callable, Iterable, Tuple
+
+from network.codec import JSON_CODEC, CodecError
+from network.websocket import (FrameDecoder, WebSocketError, encode_frame, close_frame,
+                               OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG,
+                               CLOSE_GOING_AWAY)
+
+
+# 推送连接数上限（超出时HTTP网关回复503）
+DEFAULT_MAX_CONNECTIONS = 4096
+# 单个连接最多订阅的主题数
+MAX_TOPICS_PER_CONNECTION = 16
+# 单个连接未发出的数据上限，超出时视为慢速订阅者断开
+MAX_PENDING_BYTES = 1024 * 1024
+# 空闲多少秒后发送ping；超过PING_INTERVAL * IDLE_PINGS秒没有收到任何数据时断开
+PING_INTERVAL = 30.0
+IDLE_PINGS = 3
+READ_CHUNK_SIZE = 16 * 1024
+MAX_SEND_BUFFERS = 64
+# 查询快照的线程数
+SNAPSHOT_WORKERS = 2
+# 工作进程之间转发的数据报上限
+MAX_PEER_MESSAGE = 60 * 1024
+
+WAKEUP = 'wakeup'
+PEER = 'peer'
+
+
+class PushConnection:
+    """一个WebSocket订阅连接的状态（只在事件循环线程中访问）"""
+
+    def __init__(self, sock: socket.socket, addr: Any):
+        self.sock = sock
+        self.addr = addr
+        self.decoder = FrameDecoder()
+        self.out = deque()
+        self.out_bytes = 0
+        self.topics = set()
+        # 正在查询快照的主题 -> 暂存的变更帧
+        self.pending = {}
+        self.events = 0
+        self.last_seen = time.monotonic()
+        self.ping_sent = False
+        # 已发出关闭帧，发完后关闭
+        self.closing = False
+        self.closed = False
+
+    def queue(self, frame: bytes):
+        self.out.append(memoryview(frame))
+        self.out_bytes += len(frame)
+
+
+class PushHub:
+    """WebSocket订阅连接的事件循环和按主题扇出
+
+    snapshot_provider(topic)返回新订阅者的初始消息（在线程池中调用，可以查询数据库）；
+    peer_channels为多进程模式下各工作进程的 [(发送端, 接收端)]，worker_index为本进程的编号（从1开始）
+    """
+
+    def __init__(self, snapshot_provider: Callable[[str], Any], topic_key: str = 'topic',
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 peer_channels: Optional[List[Tuple[socket.socket, socket.socket]]] = None,
+                 worker_index: Optional[int] = None):
+        self.snapshot_provider = snapshot_provider
+        self.topic_key = topic_key
+        self.max_connections = max_connections
+        self.peer_send = []
+        self.peer_receive = None
+        if peer_channels and worker_index:
+            self.peer_receive = peer_channels[worker_index - 1][1]
+            self.peer_send = [send for index, (send, _) in enumerate(peer_channels, 1) if index != worker_index]
+
+        self.selector = None
+        self.executor = None
+        self.thread = None
+        self.running = False
+        self.wakeup_reader = None
+        self.wakeup_writer = None
+        self.wakeup_pending = False
+        self.calls = deque()
+        self.connections = set()
+        self.subscribers = {}  # 主题 -> set(PushConnection)
+        self.next_ping_check = 0.0
+
+        # 连接数在HTTP工作线程中检查、在事件循环中修改
+        self.stats_lock = threading.Lock()
+        self.connection_count = 0
+        self.counters = {'accepted': 0, 'published': 0, 'deliveries': 0, 'slow_disconnects': 0,
+                         'peer_received': 0, 'peer_dropped': 0}
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """启动事件循环线程"""
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, WAKEUP)
+        if self.peer_receive is not None:
+            self.discard_stale_peer_messages()
+            self.selector.register(self.peer_receive, selectors.EVENT_READ, PEER)
+        self.executor = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix='push-snapshot')
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='push-hub', daemon=True)
+        self.thread.start()
+        mode = f"，与 {len(self.peer_send)} 个工作进程互相转发" if self.peer_send else ''
+        self.logger.info(f"推送中心已启动（连接上限 {self.max_connections}{mode}）")
+
+    def stop(self):
+        """停止事件循环（可在信号处理器中调用，不阻塞）：向所有订阅者发送关闭帧（1001），
+        客户端随后重连到新进程或其他工作进程"""
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup()
+
+    def wait_stopped(self, timeout: float = 5.0):
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def has_capacity(self) -> bool:
+        with self.stats_lock:
+            return self.running and self.connection_count < self.max_connections
+
+    def adopt(self, sock: socket.socket, addr: Any, topics: Iterable[str], initial_data: bytes = b''):
+        """接管已完成握手的WebSocket连接（在HTTP工作线程中调用）；initial_data为握手时已读入缓冲区的数据"""
+        with self.stats_lock:
+            self.connection_count += 1
+            self.counters['accepted'] += 1
+        self.call_soon(self.register_connection, sock, addr, list(topics), initial_data)
+
+    def publish(self, topic: str, message: Dict[str, Any]):
+        """发布消息（任意线程调用，不阻塞）：发给本进程中该主题的订阅者，并转发给其他工作进程"""
+        if self.running:
+            self.call_soon(self.fan_out, topic, message)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.stats_lock:
+            return dict(self.counters, connections=self.connection_count, topics=len(self.subscribers))
+
+    # ---- 以下方法在事件循环线程中执行 ----
+
+    def run(self):
+        try:
+            while self.running:
+                self.poll(1.0)
+        except Exception as e:
+            self.logger.error(f"推送中心事件循环出错: {e}")
+        finally:
+            self.shutdown()
+
+    def poll(self, timeout: float):
+        for key, mask in self.selector.select(timeout):
+            if key.data is WAKEUP:
+                self.clear_wakeup()
+            elif key.data is PEER:
+                self.receive_peer_messages()
+            else:
+                conn = key.data
+                if mask & selectors.EVENT_WRITE:
+                    self.flush(conn)
+                if mask & selectors.EVENT_READ and not conn.closed:
+                    self.on_readable(conn)
+        self.run_calls()
+        now = time.monotonic()
+        if now >= self.next_ping_check:
+            self.next_ping_check = now + 1.0
+            self.check_idle(now)
+
+    def shutdown(self):
+        """发出关闭帧并关闭所有连接"""
+        self.run_calls()
+        for conn in list(self.connections):
+            conn.out.clear()
+            conn.queue(close_frame(CLOSE_GOING_AWAY, "server shutting down"))
+            self.flush(conn)
+            self.close_connection(conn)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.selector.close()
+        for sock in (self.wakeup_reader, self.wakeup_writer):
+            sock.close()
+        self.logger.info("推送中心已停止")
+
+    def wakeup(self):
+        if self.wakeup_writer is None:
+            return
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+
+    def clear_wakeup(self):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def call_soon(self, callback, *args):
+        """从其他线程把调用交给事件循环执行（每批调用只写一次唤醒套接字）"""
+        self.calls.append((callback, args))
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.wakeup()
+
+    def run_calls(self):
+        self.wakeup_pending = False
+        while self.calls:
+            callback, args = self.calls.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error(f"推送中心执行回调时出错: {e}")
+
+    def register_connection(self, sock: socket.socket, addr: Any, topics: List[str], initial_data: bytes):
+        if not self.running:
+            sock.close()
+            self.connection_finished()
+            return
+        sock.setblocking(False)
+        conn = PushConnection(sock, addr)
+        self.connections.add(conn)
+        conn.events = selectors.EVENT_READ
+        self.selector.register(sock, conn.events, conn)
+        for topic in topics:
+            self.subscribe(conn, topic)
+        if initial_data:
+            self.handle_data(conn, initial_data)
+
+    def connection_finished(self):
+        with self.stats_lock:
+            self.connection_count -= 1
+
+    def fan_out(self, topic: str, message: Dict[str, Any], forward: bool = True):
+        """编码一次，发给该主题的所有订阅者"""
+        frame = encode_frame(OP_TEXT, JSON_CODEC.encode(message))
+        with self.stats_lock:
+            self.counters['published'] += 1
+        if forward and self.peer_send:
+            self.forward_to_peers(topic, frame)
+        self.deliver(topic, frame)
+
+    def deliver(self, topic: str, frame: bytes):
+        subscribers = list(self.subscribers.get(topic, ()))
+        for conn in subscribers:
+            if topic in conn.pending:
+                conn.pending[topic].append(frame)
+            else:
+                self.send_frame(conn, frame)
+        if subscribers:
+            with self.stats_lock:
+                self.counters['deliveries'] += len(subscribers)
+
+    def send_frame(self, conn: PushConnection, frame: bytes):
+        if conn.closed or conn.closing:
+            return
+        conn.queue(frame)
+        if conn.out_bytes > MAX_PENDING_BYTES:
+            with self.stats_lock:
+                self.counters['slow_disconnects'] += 1
+            self.logger.warning(f"推送客户端 {conn.addr} 接收过慢（未发送 {conn.out_bytes} 字节），断开连接")
+            self.close_connection(conn)
+            return
+        self.flush(conn)
+
+    def send_message(self, conn: PushConnection, message: Dict[str, Any]):
+        self.send_frame(conn, encode_frame(OP_TEXT, JSON_CODEC.encode(message)))
+
+    def subscribe(self, conn: PushConnection, topic: Any):
+        if not isinstance(topic, str) or not topic:
+            self.send_error(conn, f"订阅需要 {self.topic_key} 字段")
+            return
+        if topic in conn.topics:
+            return
+        if len(conn.topics) >= MAX_TOPICS_PER_CONNECTION:
+            self.send_error(conn, f"单个连接最多订阅 {MAX_TOPICS_PER_CONNECTION} 个主题")
+            return
+        conn.topics.add(topic)
+        conn.pending[topic] = []
+        self.subscribers.setdefault(topic, set()).add(conn)
+        self.executor.submit(self.load_snapshot, conn, topic)
+
+    def unsubscribe(self, conn: PushConnection, topic: Any):
+        if topic not in conn.topics:
+            return
+        conn.topics.discard(topic)
+        conn.pending.pop(topic, None)
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(conn)
+            if not subscribers:
+                del self.subscribers[topic]
+        self.send_message(conn, {"event": "unsubscribed", self.topic_key: topic})
+
+    def load_snapshot(self, conn: PushConnection, topic: str):
+        """线程池：查询快照并编码，交回事件循环发送"""
+        try:
+            message = self.snapshot_provider(topic)
+        except Exception as e:
+            self.logger.error(f"查询推送快照时出错: {e}")
+            message = {"event": "error", self.topic_key: topic, "message": f"查询快照时出错: {str(e)}"}
+        self.call_soon(self.snapshot_ready, conn, topic, encode_frame(OP_TEXT, JSON_CODEC.encode(message)))
+
+    def snapshot_ready(self, conn: PushConnection, topic: str, frame: bytes):
+        """先发快照，再补发查询期间到达的变更（客户端按appointment_id等主键合并，重复的变更不影响结果）"""
+        if conn.closed or topic not in conn.pending:
+            return
+        buffered = conn.pending.pop(topic)
+        self.send_frame(conn, frame)
+        for pending_frame in buffered:
+            self.send_frame(conn, pending_frame)
+
+    def send_error(self, conn: PushConnection, message: str):
+        self.send_message(conn, {"event": "error", "timestamp": datetime.now().isoformat(), "message": message})
+
+    def on_readable(self, conn: PushConnection):
+        try:
+            data = conn.sock.recv(READ_CHUNK_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.logger.info(f"推送客户端 {conn.addr} 连接中断: {e}")
+            self.close_connection(conn)
+            return
+        if not data:
+            self.close_connection(conn)
+            return
+        self.handle_data(conn, data)
+
+    def handle_data(self, conn: PushConnection, data: bytes):
+        conn.last_seen = time.monotonic()
+        conn.ping_sent = False
+        try:
+            messages = conn.decoder.feed(data)
+        except WebSocketError as e:
+            self.logger.warning(f"推送客户端 {conn.addr} 协议错误: {e}")
+            self.start_close(conn, e.close_code, str(e))
+            return
+        for opcode, payload in messages:
+            if conn.closed or conn.closing:
+                return
+            if opcode == OP_PING:
+                self.send_frame(conn, encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                # 回复关闭帧（回显关闭码）后关闭
+                conn.queue(encode_frame(OP_CLOSE, payload[:2]))
+                conn.closing = True
+                self.flush(conn)
+            elif opcode in (OP_TEXT, OP_BINARY):
+                self.handle_message(conn, payload)
+
+    def handle_message(self, conn: PushConnection, payload: bytes):
+        try:
+            request = JSON_CODEC.decode(payload)
+        except CodecError as e:
+            self.send_error(conn, str(e))
+            return
+        if not isinstance(request, dict):
+            self.send_error(conn, "消息必须是JSON对象")
+            return
+        op = request.get('op')
+        if op == 'subscribe':
+            self.subscribe(conn, request.get(self.topic_key))
+        elif op == 'unsubscribe':
+            self.unsubscribe(conn, request.get(self.topic_key))
+        elif op == 'ping':
+            self.send_message(conn, {"event": "pong", "timestamp": datetime.now().isoformat()})
+        else:
+            self.send_error(conn, f"未知的操作 {op}，可用操作: subscribe, unsubscribe, ping")
+
+    def start_close(self, conn: PushConnection, code: int, reason: str = ''):
+        """发送关闭帧，发完后关闭连接"""
+        if conn.closed or conn.closing:
+            return
+        conn.queue(close_frame(code, reason))
+        conn.closing = True
+        self.flush(conn)
+
+    def check_idle(self, now: float):
+        """空闲连接发送ping，长时间没有数据的连接断开"""
+        for conn in list(self.connections):
+            idle = now - conn.last_seen
+            if idle > PING_INTERVAL * IDLE_PINGS:
+                self.logger.info(f"推送客户端 {conn.addr} 超过 {idle:.0f} 秒没有响应，断开连接")
+                self.close_connection(conn)
+            elif idle > PING_INTERVAL and not conn.ping_sent:
+                conn.ping_sent = True
+                self.send_frame(conn, encode_frame(OP_PING))
+
+    def flush(self, conn: PushConnection):
+        """发送缓冲区中的数据，发不完时等待可写事件"""
+        try:
+            while conn.out:
+                sent = conn.sock.sendmsg(list(islice(conn.out, MAX_SEND_BUFFERS)))
+                conn.out_bytes -= sent
+                while conn.out and sent >= len(conn.out[0]):
+                    sent -= len(conn.out[0])
+                    conn.out.popleft()
+                if sent:
+                    conn.out[0] = conn.out[0][sent:]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self.logger.info(f"推送客户端 {conn.addr} 连接中断: {e}")
+            self.close_connection(conn)
+            return
+
+        if not conn.out and conn.closing:
+            self.close_connection(conn)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.out else 0)
+        if events != conn.events:
+            conn.events = events
+            self.selector.modify(conn.sock, events, conn)
+
+    def close_connection(self, conn: PushConnection):
+        if conn.closed:
+            return
+        conn.closed = True
+        for topic in conn.topics:
+            subscribers = self.subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.subscribers[topic]
+        conn.topics.clear()
+        conn.pending.clear()
+        conn.out.clear()
+        self.connections.discard(conn)
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+        self.connection_finished()
+
+    def forward_to_peers(self, topic: str, frame: bytes):
+        """把已编码的帧转发给其他工作进程（数据报，不阻塞；对方缓冲区满时丢弃并计数）"""
+        datagram = topic.encode('utf-8') + b'\0' + frame
+        if len(datagram) > MAX_PEER_MESSAGE:
+            self.logger.warning(f"推送消息 {len(datagram)} 字节超过转发上限，只发给本进程的订阅者")
+            return
+        for peer in self.peer_send:
+            try:
+                peer.send(datagram, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                with self.stats_lock:
+                    self.counters['peer_dropped'] += 1
+            except OSError as e:
+                self.logger.error(f"转发推送消息时出错: {e}")
+
+    def receive_peer_messages(self):
+        """接收其他工作进程转发的帧，发给本进程的订阅者"""
+        while True:
+            try:
+                datagram = self.peer_receive.recv(MAX_PEER_MESSAGE, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.logger.error(f"接收转发的推送消息时出错: {e}")
+                return
+            topic, _, frame = datagram.partition(b'\0')
+            with self.stats_lock:
+                self.counters['peer_received'] += 1
+            self.deliver(topic.decode('utf-8', 'replace'), frame)
+
+    def discard_stale_peer_messages(self):
+        """丢弃本编号的上一个工作进程退出后积压的转发消息（已过时，新订阅者会先收到快照）"""
+        try:
+            while self.peer_receive.recv(MAX_PEER_MESSAGE, socket.MSG_DONTWAIT):
+                pass
+        except OSError:
+            pass
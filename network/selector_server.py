@@ -0,0 +1,651 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+selectors网络引擎
+一个事件循环线程用selectors（Linux上为epoll）非阻塞地读写所有连接，读完整的请求帧交给有界线程池执行，
+连接数不再受工作线程数限制；帧格式、准入限制、编码协商、流水线规则、流式响应和响应编码
+与线程模式的NetworkHandler共用同一套代码：
+- 请求帧先读入连接的读缓冲区，小帧一次recv即可读完；长度字段在分配缓冲区之前检查上限，
+  较大的请求体按长度预分配缓冲区后直接recv_into
+- 响应由工作线程编码后交回事件循环，长度字段和内容用sendmsg一次发出，发不完时等待可写事件
+- 不带请求ID的请求处理完之前不读取该连接上的下一个请求；持久连接上带请求ID的请求并发处理，
+  每个连接最多同时处理max_pipeline_depth个，超出时停止读取（背压）
+"""
+
+import time
+import socket
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Any, Optional
+
+from network.codec import JSON_CODEC, parse_frame_name
+from network.framing import HEADER, FrameRejected, FrameTimeoutError, check_frame_size, set_nodelay
+from network.streaming import StreamingResult
+from network.communication import CLOSE_DELAY, DRAIN_REPORT_INTERVAL, NetworkHandler, request_extra
+
+
+# 每次从连接读取的最大字节数
+READ_CHUNK_SIZE = 64 * 1024
+
+# 连接每次可读时最多读取的次数（避免一个快速发送的连接占满事件循环）
+MAX_READS_PER_EVENT = 16
+
+# 监听套接字每次就绪时最多接受的连接数（避免新连接占满事件循环）
+ACCEPT_BATCH = 64
+
+# sendmsg一次最多发送的缓冲区个数
+MAX_SEND_BUFFERS = 64
+
+# 流式响应尚未发出的字节数超过该值时，读取下一块的工作线程等待发送缓冲区排空（背压）
+STREAM_HIGH_WATER = 1024 * 1024
+
+# 事件循环检查请求帧读取超时、空闲超时和延迟关闭的间隔秒数
+TIMER_INTERVAL = 0.1
+
+# 监听套接字和唤醒套接字在选择器中的标记（连接的标记为SelectorConnection）
+LISTENER = 'listener'
+WAKEUP = 'wakeup'
+
+
+class SelectorConnection:
+    """selectors引擎中单个连接的状态
+
+    除cond保护的closed/unsent外，只在事件循环线程中访问
+    """
+
+    def __init__(self, sock: socket.socket, addr: Any):
+        self.sock = sock
+        self.addr = addr
+        # 读缓冲区：尚未组成完整请求帧的数据
+        self.rbuf = bytearray()
+        # 正在直接读入预分配缓冲区的请求体
+        self.filename = None
+        self.body = None
+        self.body_view = None
+        self.body_pos = 0
+        # 待发送的缓冲区（memoryview）
+        self.out = deque()
+        self.events = 0
+        self.served = 0
+        # 已交给线程池、尚未处理完的请求数
+        self.inflight = 0
+        # 正在处理不带请求ID的请求（处理完之前不读取新请求）
+        self.sequential = False
+        # 是否继续接收新请求；为False时处理完已接收的请求、发完响应后关闭连接
+        self.accepting = True
+        self.frame_deadline = None
+        self.idle_deadline = None
+        self.close_at = None
+        # 工作线程排入、尚未发出的字节数（流式响应背压）
+        self.cond = threading.Condition()
+        self.unsent = 0
+        self.closed = False
+
+    def reading_frame(self) -> bool:
+        """是否已经读到了下一个请求帧的一部分"""
+        return self.body is not None or bool(self.rbuf)
+
+
+class SelectorNetworkHandler(NetworkHandler):
+    """基于selectors的网络处理器：单个事件循环线程处理所有连接的读写，请求在worker_threads个线程中执行
+
+    正在执行和排队的请求超过worker_threads + queue_size时回复服务器繁忙（按请求计数，与asyncio引擎相同）；
+    构造参数与NetworkHandler相同
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selector = None
+        self.executor = None
+        self.connections = set()
+        # 工作线程交给事件循环执行的调用，通过唤醒套接字通知事件循环
+        self.calls = deque()
+        self.wakeup_reader = None
+        self.wakeup_writer = None
+        self.wakeup_pending = False
+        # 已交给线程池、尚未处理完的请求数（只在事件循环线程中修改）
+        self.pending_requests = 0
+        self.next_timer_check = 0.0
+
+    def start_server(self) -> bool:
+        """启动服务器（在调用线程中运行事件循环，阻塞直到stop_server被调用）"""
+        try:
+            listeners = self.open_listen_sockets()
+            self.selector = selectors.DefaultSelector()
+            self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+            self.wakeup_reader.setblocking(False)
+            self.wakeup_writer.setblocking(False)
+            self.selector.register(self.wakeup_reader, selectors.EVENT_READ, WAKEUP)
+            for listener in listeners:
+                listener.setblocking(False)
+                self.selector.register(listener, selectors.EVENT_READ, LISTENER)
+            self.executor = ThreadPoolExecutor(max_workers=self.worker_threads, thread_name_prefix='request-worker')
+
+            self.running = True
+            self.logger.info(f"网络服务器已启动（selectors引擎 {type(self.selector).__name__}，"
+                             f"工作线程 {self.worker_threads}），监听地址: {self.listen_address()}")
+            if self.ready_callback:
+                self.ready_callback()
+
+            while self.running:
+                self.poll(TIMER_INTERVAL)
+
+            self.stop_accepting()
+            if self.drain_deadline is not None:
+                self.drain_connections()
+            self.logger.info("网络服务器主循环已退出")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"启动网络服务器失败: {e}")
+            return False
+        finally:
+            self.shutdown_loop()
+
+    def stop_server(self, drain_timeout: Optional[float] = None):
+        """停止服务器（可从其他线程或信号处理器中调用）：只设置标志并唤醒事件循环，
+        监听套接字由事件循环关闭；drain_timeout的含义与线程模式相同"""
+        if drain_timeout is not None:
+            self.drain_deadline = time.monotonic() + drain_timeout
+        self.running = False
+        self.wakeup()
+        self.logger.info("网络服务器已停止")
+
+    def stop_accepting(self):
+        """停止接受新连接（只关闭本进程的描述符，平滑重启时新进程继续监听）"""
+        for listener in self.listen_sockets():
+            try:
+                self.selector.unregister(listener)
+            except (KeyError, ValueError):
+                pass
+        self.close_listen_sockets()
+
+    def drain_connections(self):
+        """不再读取新请求：空闲连接直接关闭，正在读取或处理请求的连接处理完后关闭；超时的处理方式与线程模式相同"""
+        self.logger.info(f"停止接受新连接，等待已接受的连接处理完毕"
+                         f"（最多 {max(0.0, self.drain_deadline - time.monotonic()):.0f} 秒）")
+        for conn in list(self.connections):
+            if not conn.reading_frame():
+                conn.accepting = False
+                self.finish_if_done(conn)
+                self.update_connection(conn)
+        next_report = time.monotonic() + DRAIN_REPORT_INTERVAL
+        while True:
+            # 已发完响应、等待延迟关闭的一次性连接不再等待（与线程模式的延迟关闭线程相同）
+            busy = [conn for conn in self.connections if conn.close_at is None]
+            if not busy:
+                break
+            now = time.monotonic()
+            if now >= self.drain_deadline:
+                with self.stats_lock:
+                    self.cut_off_requests = self.pending_requests
+                self.logger.warning(f"等待请求处理完毕超时，中断 {self.cut_off_requests} 个请求"
+                                    f"（仍有 {len(busy)} 个连接未处理完）")
+                return
+            if now >= next_report:
+                self.logger.info(f"正在等待 {len(busy)} 个连接处理完毕"
+                                 f"（处理中的请求 {self.pending_requests} 个，剩余 {self.drain_deadline - now:.0f} 秒）")
+                next_report = now + DRAIN_REPORT_INTERVAL
+            self.poll(min(self.drain_deadline - now, TIMER_INTERVAL))
+        self.logger.info("已接受的连接全部处理完毕")
+
+    def shutdown_loop(self):
+        """关闭所有连接、监听套接字、线程池和选择器"""
+        for conn in list(self.connections):
+            self.close_connection(conn)
+        self.close_listen_sockets()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.selector is not None:
+            self.selector.close()
+        for sock in (self.wakeup_reader, self.wakeup_writer):
+            if sock is not None:
+                sock.close()
+
+    def poll(self, timeout: float):
+        """等待一次就绪事件并处理，然后执行工作线程交回的调用、检查超时"""
+        for key, mask in self.selector.select(max(timeout, 0.0)):
+            if key.data is WAKEUP:
+                self.clear_wakeup()
+            elif key.data is LISTENER:
+                self.accept_connections(key.fileobj)
+            else:
+                conn = key.data
+                if mask & selectors.EVENT_WRITE:
+                    self.flush(conn)
+                if mask & selectors.EVENT_READ and not conn.closed:
+                    self.on_readable(conn)
+        self.run_calls()
+        self.check_timers()
+
+    def wakeup(self):
+        """唤醒阻塞在select中的事件循环"""
+        if self.wakeup_writer is None:
+            return
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            # 缓冲区已满（事件循环必然会被唤醒）或已经关闭
+            pass
+
+    def clear_wakeup(self):
+        """读空唤醒套接字"""
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def call_soon(self, callback, *args):
+        """从工作线程把调用交给事件循环执行（按提交顺序执行）"""
+        self.calls.append((callback, args))
+        # 事件循环在执行调用之前清除wakeup_pending，之后提交的调用会重新唤醒，每批调用只写一次唤醒套接字
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.wakeup()
+
+    def run_calls(self):
+        """执行工作线程交回的调用"""
+        self.wakeup_pending = False
+        while self.calls:
+            callback, args = self.calls.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                self.logger.error(f"事件循环执行回调时出错: {e}")
+
+    def accept_connections(self, listener: socket.socket):
+        """接受监听套接字上的新连接"""
+        for _ in range(ACCEPT_BATCH):
+            try:
+                client_socket, client_addr = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                # 多进程模式下其他工作进程可能先accept了同一个连接
+                return
+            except OSError as e:
+                if self.running:
+                    self.logger.error(f"接受连接时出错: {e}")
+                return
+
+            client_socket.setblocking(False)
+            # Unix域套接字的客户端没有地址，日志中显示套接字路径
+            client_addr = client_addr or f"unix:{self.unix_socket}"
+            self.logger.info(f"客户端连接: {client_addr}")
+            set_nodelay(client_socket)
+
+            conn = SelectorConnection(client_socket, client_addr)
+            self.connections.add(conn)
+            self.update_connection(conn)
+
+    def on_readable(self, conn: SelectorConnection):
+        """读取连接上的数据，组成完整的请求帧后交给线程池"""
+        try:
+            for _ in range(MAX_READS_PER_EVENT):
+                if not self.can_read(conn):
+                    break
+                if conn.body is not None:
+                    count = conn.sock.recv_into(conn.body_view[conn.body_pos:])
+                    if count == 0:
+                        self.on_eof(conn)
+                        return
+                    conn.body_pos += count
+                    if conn.body_pos < len(conn.body):
+                        continue
+                    filename, body = conn.filename, conn.body
+                    conn.filename = conn.body = conn.body_view = None
+                    self.dispatch_frame(conn, filename, body)
+                else:
+                    data = conn.sock.recv(READ_CHUNK_SIZE)
+                    if not data:
+                        self.on_eof(conn)
+                        return
+                    conn.rbuf += data
+                self.parse_frames(conn)
+                if conn.closed:
+                    return
+        except (BlockingIOError, InterruptedError):
+            pass
+        except FrameRejected as e:
+            self.reject_frame(conn, e)
+            return
+        except OSError as e:
+            self.logger.info(f"客户端 {conn.addr} 连接中断: {e}")
+            self.close_connection(conn)
+            return
+        self.update_connection(conn)
+
+    def parse_frames(self, conn: SelectorConnection):
+        """从读缓冲区中取出完整的请求帧；长度字段超过上限时在分配缓冲区之前抛出FrameTooLargeError"""
+        rbuf = conn.rbuf
+        while self.can_read(conn) and conn.body is None and len(rbuf) >= HEADER.size:
+            name_len = HEADER.unpack_from(rbuf)[0]
+            check_frame_size('filename', name_len, self.max_filename_size)
+            body_start = 2 * HEADER.size + name_len
+            if len(rbuf) < body_start:
+                break
+            body_len = HEADER.unpack_from(rbuf, HEADER.size + name_len)[0]
+            check_frame_size('body', body_len, self.max_body_size)
+            filename = bytes(rbuf[HEADER.size:HEADER.size + name_len])
+            body_end = body_start + body_len
+
+            if len(rbuf) < body_end:
+                # 请求体还没有收全：按长度预分配缓冲区，剩余部分直接读入
+                conn.filename = filename
+                conn.body = bytearray(body_len)
+                conn.body_view = memoryview(conn.body)
+                conn.body_pos = len(rbuf) - body_start
+                conn.body_view[:conn.body_pos] = memoryview(rbuf)[body_start:]
+                rbuf.clear()
+                break
+
+            body = rbuf[body_start:body_end]
+            del rbuf[:body_end]
+            self.dispatch_frame(conn, filename, body)
+
+    def can_read(self, conn: SelectorConnection) -> bool:
+        """连接是否可以继续读取：正在读的请求体总要读完，否则要求连接仍接收新请求且没有被流水线名额或顺序请求阻塞"""
+        if conn.closed:
+            return False
+        if conn.body is not None:
+            return True
+        return conn.accepting and not conn.sequential and conn.inflight < self.max_pipeline_depth
+
+    def dispatch_frame(self, conn: SelectorConnection, filename: bytes, body: bytearray):
+        """把一个完整的请求帧交给线程池（解码在线程池中进行）；线程池和等待队列已满时回复服务器繁忙"""
+        conn.frame_deadline = None
+        conn.idle_deadline = None
+        codec = JSON_CODEC
+        params = {}
+        try:
+            # 文件名不用于保存文件，只用于协商消息编码和携带请求ID等参数
+            name = filename.decode('utf-8')
+            params = parse_frame_name(name)[1]
+            codec = self.negotiate_codec(name, params)
+        except Exception as e:
+            self.logger.error(f"接收JSON数据时出错: {e}")
+            body = None
+        extra = request_extra(params)
+
+        if body is None:
+            self.write_raw(conn, self.build_error_response("接收JSON数据失败", codec, extra))
+            conn.accepting = False
+            self.finish_if_done(conn)
+            return
+
+        if self.pending_requests >= self.worker_threads + self.queue_size:
+            # 线程池和等待队列都已满，立即回复服务器繁忙，不再接收该连接上的新请求
+            with self.stats_lock:
+                self.rejected_connections += 1
+            self.write_raw(conn, self.build_busy_response(codec, extra))
+            self.logger.warning(f"服务器繁忙，拒绝客户端 {conn.addr} 的请求")
+            conn.accepting = False
+            self.finish_if_done(conn)
+            return
+
+        pipelined = extra is not None and self.keep_alive
+        try:
+            self.executor.submit(self.run_request, conn, body, codec, extra, pipelined)
+        except RuntimeError:
+            # 服务器正在停止，线程池已关闭
+            conn.accepting = False
+            self.finish_if_done(conn)
+            return
+        self.pending_requests += 1
+        conn.inflight += 1
+        conn.served += 1
+        if not pipelined:
+            conn.sequential = True
+        with self.stats_lock:
+            self.accepted_connections += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth())
+
+        if not self.keep_alive or not self.running:
+            conn.accepting = False
+        elif conn.served >= self.max_requests_per_connection:
+            self.logger.info(f"客户端 {conn.addr} 已达到单连接请求上限 {self.max_requests_per_connection}")
+            conn.accepting = False
+
+    def run_request(self, conn: SelectorConnection, body: bytearray, codec, extra: Optional[Dict[str, Any]],
+                    pipelined: bool):
+        """工作线程：解码请求、执行请求处理器并把响应交给事件循环发送"""
+        keep = True
+        try:
+            try:
+                json_data = self.parse_json(body, codec)
+            except FrameRejected as e:
+                # 压缩的请求体解压后超过长度上限
+                self.queue_frame(conn, self.encode_frame_rejection(conn.addr, e))
+                keep = False
+                return
+            if json_data is None:
+                self.queue_frame(conn, self.encode_error_response("接收JSON数据失败", codec, extra))
+                keep = False
+                return
+
+            logged_op = self.log_request(conn.addr, json_data)
+            result = None
+            with self.stats_lock:
+                self.inflight += 1
+            try:
+                if self.request_handler:
+                    result = self.request_handler(json_data)
+                else:
+                    result = "错误: 未设置请求处理器"
+
+                # 流式结果逐块编码、逐帧发送
+                if isinstance(result, StreamingResult):
+                    self.queue_stream(conn, result, codec, extra)
+                else:
+                    self.queue_frame(conn, self.encode_response(result, codec, extra))
+            except Exception as e:
+                self.logger.error(f"处理客户端 {conn.addr} 时出错: {e}")
+                self.queue_frame(conn, self.encode_error_response(f"服务器内部错误: {str(e)}", codec, extra))
+                keep = False
+                return
+            finally:
+                with self.stats_lock:
+                    self.inflight -= 1
+            self.log_response(logged_op, result)
+        finally:
+            self.call_soon(self.request_done, conn, pipelined, keep)
+
+    def queue_frame(self, conn: SelectorConnection, body: bytes) -> bool:
+        """从工作线程把一个响应帧交给事件循环发送，连接已关闭时返回False"""
+        with conn.cond:
+            if conn.closed:
+                return False
+            conn.unsent += HEADER.size + len(body)
+        self.call_soon(self.write_frame, conn, body)
+        return True
+
+    def queue_stream(self, conn: SelectorConnection, stream: StreamingResult, codec=JSON_CODEC,
+                     extra: Optional[Dict[str, Any]] = None):
+        """逐帧排入流式响应：尚未发出的数据超过STREAM_HIGH_WATER时等待，连接关闭时停止读取，结束后释放流的资源"""
+        try:
+            for body in self.stream_bodies(stream, codec, extra):
+                with conn.cond:
+                    while conn.unsent > STREAM_HIGH_WATER and not conn.closed:
+                        conn.cond.wait()
+                if not self.queue_frame(conn, body):
+                    break
+        finally:
+            stream.close()
+
+    def request_done(self, conn: SelectorConnection, pipelined: bool, keep: bool):
+        """事件循环：一个请求处理完毕（响应已排入发送缓冲区），继续读取或关闭连接"""
+        self.pending_requests -= 1
+        conn.inflight -= 1
+        if not pipelined:
+            conn.sequential = False
+        if conn.closed:
+            return
+        if not keep:
+            conn.accepting = False
+        # 顺序请求处理期间缓冲的请求帧现在可以处理了
+        try:
+            self.parse_frames(conn)
+        except FrameRejected as e:
+            self.reject_frame(conn, e)
+            return
+        self.finish_if_done(conn)
+        self.update_connection(conn)
+
+    def write_frame(self, conn: SelectorConnection, body: bytes):
+        """事件循环：把queue_frame排入的响应帧（4字节长度 + 内容）加入发送缓冲区并尽量立即发出"""
+        if conn.closed:
+            return
+        conn.out.append(memoryview(HEADER.pack(len(body))))
+        conn.out.append(memoryview(body))
+        self.flush(conn)
+
+    def write_raw(self, conn: SelectorConnection, frame: bytes):
+        """事件循环：发送在事件循环中构造好的完整响应帧（错误帧、服务器繁忙）"""
+        if conn.closed:
+            return
+        with conn.cond:
+            conn.unsent += len(frame)
+        conn.out.append(memoryview(frame))
+        self.flush(conn)
+
+    def flush(self, conn: SelectorConnection):
+        """事件循环：用sendmsg发送缓冲区中的数据，发不完时等待可写事件"""
+        sent_total = 0
+        try:
+            while conn.out:
+                if hasattr(conn.sock, 'sendmsg'):
+                    sent = conn.sock.sendmsg(list(islice(conn.out, MAX_SEND_BUFFERS)))
+                else:
+                    sent = conn.sock.send(conn.out[0])
+                sent_total += sent
+                while conn.out and sent >= len(conn.out[0]):
+                    sent -= len(conn.out[0])
+                    conn.out.popleft()
+                if sent:
+                    conn.out[0] = conn.out[0][sent:]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self.logger.info(f"客户端 {conn.addr} 连接中断: {e}")
+            self.close_connection(conn)
+            return
+        finally:
+            if sent_total:
+                with conn.cond:
+                    conn.unsent -= sent_total
+                    conn.cond.notify_all()
+
+        if not conn.out:
+            self.finish_if_done(conn)
+        self.update_connection(conn)
+
+    def on_eof(self, conn: SelectorConnection):
+        """客户端关闭了连接（或半关闭）：发完已接收请求的响应后关闭"""
+        if conn.reading_frame():
+            self.logger.error(f"接收JSON数据时出错: 客户端 {conn.addr} 在请求帧中途关闭连接")
+        conn.rbuf.clear()
+        conn.filename = conn.body = conn.body_view = None
+        conn.accepting = False
+        self.finish_if_done(conn)
+        self.update_connection(conn)
+
+    def reject_frame(self, conn: SelectorConnection, error: FrameRejected):
+        """请求帧超过准入限制：回复结构化错误帧后关闭连接（之后字节流已无法对齐）"""
+        conn.rbuf.clear()
+        conn.filename = conn.body = conn.body_view = None
+        conn.accepting = False
+        self.write_raw(conn, self.frame_rejection_response(conn.addr, error))
+        self.finish_if_done(conn)
+        self.update_connection(conn)
+
+    def finish_if_done(self, conn: SelectorConnection):
+        """不再接收新请求的连接在请求处理完、响应发完后关闭；一次性连接与线程模式一样延迟CLOSE_DELAY秒关闭"""
+        if conn.closed or conn.accepting or conn.inflight or conn.out or conn.close_at is not None:
+            return
+        if self.keep_alive:
+            self.close_connection(conn)
+        else:
+            conn.close_at = time.monotonic() + CLOSE_DELAY
+
+    def update_connection(self, conn: SelectorConnection):
+        """按连接状态更新关注的事件（读/写）和超时时间"""
+        if conn.closed:
+            return
+        events = 0
+        reading = self.can_read(conn)
+        if reading:
+            events |= selectors.EVENT_READ
+        if conn.out:
+            events |= selectors.EVENT_WRITE
+        if events != conn.events:
+            if not conn.events:
+                self.selector.register(conn.sock, events, conn)
+            elif not events:
+                self.selector.unregister(conn.sock)
+            else:
+                self.selector.modify(conn.sock, events, conn)
+            conn.events = events
+
+        now = time.monotonic()
+        if not reading:
+            conn.frame_deadline = conn.idle_deadline = None
+        elif conn.reading_frame() or conn.served == 0:
+            # 每个请求帧（第一个请求从连接建立开始）必须在request_timeout秒内读完
+            conn.idle_deadline = None
+            if conn.frame_deadline is None:
+                conn.frame_deadline = now + self.request_timeout
+        else:
+            # 持久连接上等待下一个请求（流水线请求处理期间不计空闲）
+            conn.frame_deadline = None
+            if conn.inflight:
+                conn.idle_deadline = None
+            elif conn.idle_deadline is None:
+                conn.idle_deadline = now + self.idle_timeout
+
+    def check_timers(self):
+        """检查请求帧读取超时、持久连接空闲超时和一次性连接的延迟关闭"""
+        now = time.monotonic()
+        if now < self.next_timer_check:
+            return
+        self.next_timer_check = now + TIMER_INTERVAL
+        for conn in list(self.connections):
+            if conn.close_at is not None:
+                if now >= conn.close_at:
+                    self.close_connection(conn)
+            elif conn.frame_deadline is not None and now >= conn.frame_deadline:
+                self.reject_frame(conn, FrameTimeoutError(self.request_timeout))
+            elif conn.idle_deadline is not None and now >= conn.idle_deadline:
+                self.logger.info(f"持久连接空闲超过 {self.idle_timeout} 秒，关闭连接")
+                conn.accepting = False
+                self.finish_if_done(conn)
+                self.update_connection(conn)
+
+    def close_connection(self, conn: SelectorConnection):
+        """关闭连接；仍在处理的请求完成后其响应被丢弃，等待背压的流式响应停止读取"""
+        if conn.closed:
+            return
+        with conn.cond:
+            conn.closed = True
+            conn.cond.notify_all()
+        if conn.events:
+            try:
+                self.selector.unregister(conn.sock)
+            except (KeyError, ValueError):
+                pass
+            conn.events = 0
+        conn.sock.close()
+        conn.out.clear()
+        self.connections.discard(conn)
+        self.logger.info(f"客户端 {conn.addr} 连接已关闭，共处理 {conn.served} 个请求")
+
+    def queue_depth(self) -> int:
+        """等待线程池执行的请求数"""
+        return max(0, self.pending_requests - self.worker_threads)
+
+    def network_stats(self) -> Dict[str, Any]:
+        """线程池和过载保护统计（accepted/rejected按请求计数）"""
+        with self.stats_lock:
+            self.active_workers = min(self.inflight, self.worker_threads)
+        return super().network_stats()
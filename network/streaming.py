@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式响应
+处理函数返回StreamingResult时，网络层不再把整个结果编码成一帧，而是逐块编码、逐帧发送：
+- 续帧: {"status": "partial", "timestamp", "seq": n, "result": 块}
+- 终帧: {"status": "success", "timestamp", "seq": n, "result": 汇总, "stream_end": true}
+- 中途出错: {"status": "error", "timestamp", "seq": n, "error": 错误信息, "stream_end": true}
+流水线请求的每一帧都带request_id；服务器同一时刻只在内存中保留一块数据
+"""
+
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+
+class StreamingResult:
+    """流式结果：chunks逐块产生结果（每块单独编码成一帧），读完后summary()给出终帧的结果
+
+    close在响应发送完毕、出错或连接中断时调用，用于释放数据库连接等资源；
+    迭代和close由同一把锁保护，可以在不同线程中调用（asyncio引擎在线程池中逐块读取）
+    """
+
+    def __init__(self, chunks: Iterable[Any], summary: Callable[[], Any],
+                 close: Optional[Callable[[], None]] = None):
+        self._chunks = iter(chunks)
+        self._summary = summary
+        self._close = close
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        with self._lock:
+            if self.closed:
+                raise StopIteration
+            return next(self._chunks)
+
+    def summary(self) -> Any:
+        """终帧的结果（所有块读完之后调用）"""
+        return self._summary()
+
+    def close(self):
+        """释放资源，可以重复调用"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._close:
+                self._close()
+
+    def __repr__(self) -> str:
+        return '<流式响应>'
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket协议（RFC 6455）
+HTTP网关升级连接用的握手校验、服务器帧编码和客户端帧解析：
+- 服务器发出的帧不加掩码，同一条推送消息编码一次后可以原样发给所有订阅者
+- 客户端帧必须带掩码；分片消息在解析器中拼接，控制帧（ping/pong/close）可以插在分片之间
+"""
+
+import base64
+import hashlib
+import struct
+from typing import List, Optional, Tuple
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_VERSION = '13'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# 关闭码
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TOO_BIG = 1009
+
+# 客户端消息（订阅/退订请求）的长度上限
+DEFAULT_MAX_MESSAGE_SIZE = 64 * 1024
+
+
+class WebSocketError(Exception):
+    """客户端违反协议，close_code为回复的关闭码"""
+
+    def __init__(self, message: str, close_code: int = CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.close_code = close_code
+
+
+def is_upgrade_request(headers) -> bool:
+    """请求头是否要求升级为WebSocket"""
+    upgrade = headers.get('Upgrade', '').lower()
+    connection = [item.strip().lower() for item in headers.get('Connection', '').split(',')]
+    return upgrade == 'websocket' and 'upgrade' in connection
+
+
+def accept_key(key: str) -> str:
+    """由Sec-WebSocket-Key计算Sec-WebSocket-Accept"""
+    digest = hashlib.sha1((key.strip() + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def valid_client_key(key: Optional[str]) -> bool:
+    """Sec-WebSocket-Key必须是16字节随机数的base64编码"""
+    if not key:
+        return False
+    try:
+        return len(base64.b64decode(key.strip(), validate=True)) == 16
+    except ValueError:
+        return False
+
+
+def encode_frame(opcode: int, payload: bytes = b'') -> bytes:
+    """编码一个完整的服务器帧（FIN，不加掩码）"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def close_frame(code: int = CLOSE_NORMAL, reason: str = '') -> bytes:
+    """编码关闭帧（关闭码 + UTF-8原因，原因最长123字节）"""
+    return encode_frame(OP_CLOSE, struct.pack('!H', code) + reason.encode('utf-8')[:123])
+
+
+class FrameDecoder:
+    """增量解析客户端帧：feed(data)返回已完整收到的消息 [(opcode, payload)]"""
+
+    def __init__(self, max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE):
+        self.max_message_size = max_message_size
+        self.buffer = bytearray()
+        # 正在拼接的分片消息
+        self.fragment_opcode = None
+        self.fragments = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        self.buffer += data
+        messages = []
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return messages
+            fin, opcode, payload = frame
+            if opcode >= OP_CLOSE:
+                # 控制帧不分片，可以插在分片消息中间
+                if not fin or len(payload) > 125:
+                    raise WebSocketError("控制帧不能分片且不超过125字节")
+                messages.append((opcode, payload))
+            elif opcode == OP_CONTINUATION:
+                if self.fragment_opcode is None:
+                    raise WebSocketError("没有需要继续的分片消息")
+                self.append_fragment(payload)
+                if fin:
+                    messages.append((self.fragment_opcode, bytes(self.fragments)))
+                    self.fragment_opcode = None
+                    self.fragments = bytearray()
+            elif opcode in (OP_TEXT, OP_BINARY):
+                if self.fragment_opcode is not None:
+                    raise WebSocketError("上一条分片消息尚未结束")
+                if fin:
+                    messages.append((opcode, payload))
+                else:
+                    self.fragment_opcode = opcode
+                    self.append_fragment(payload)
+            else:
+                raise WebSocketError(f"未知的操作码: {opcode}")
+
+    def append_fragment(self, payload: bytes):
+        if len(self.fragments) + len(payload) > self.max_message_size:
+            raise WebSocketError(f"消息长度超过上限 {self.max_message_size} 字节", CLOSE_TOO_BIG)
+        self.fragments += payload
+
+    def next_frame(self) -> Optional[Tuple[bool, int, bytes]]:
+        """从缓冲区取出一个完整的帧（已去掩码），数据不足时返回None"""
+        buffer = self.buffer
+        if len(buffer) < 2:
+            return None
+        first, second = buffer[0], buffer[1]
+        if first & 0x70:
+            raise WebSocketError("未协商扩展，RSV位必须为0")
+        if not second & 0x80:
+            raise WebSocketError("客户端帧必须带掩码")
+        length = second & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return None
+            length = struct.unpack_from('!H', buffer, 2)[0]
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return None
+            length = struct.unpack_from('!Q', buffer, 2)[0]
+            offset = 10
+        # 在等待帧内容之前检查长度，不为超长的帧缓冲数据
+        if length > self.max_message_size:
+            raise WebSocketError(f"消息长度超过上限 {self.max_message_size} 字节", CLOSE_TOO_BIG)
+        end = offset + 4 + length
+        if len(buffer) < end:
+            return None
+        mask = buffer[offset:offset + 4]
+        payload = bytes(buffer[offset + 4:end])
+        del buffer[:end]
+        if payload:
+            # 按4字节掩码循环异或：把掩码扩展到内容长度后整体按整数异或
+            repeated = (mask * (length // 4 + 1))[:length]
+            payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+        return bool(first & 0x80), first & 0x0F, payload
@@ -15,14 +15,15 @@ from datetime import datetime
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from network.communication import JSONProtocolClient
+from network.async_client import PooledJSONClient
 
 
 class RemoteMedicalServerTester:
     def __init__(self, host='8.140.225.6', port=55000):
         self.host = host
         self.port = port
-        self.client = JSONProtocolClient(host, port)
+        # 连接池客户端：各项测试和并发线程复用持久连接
+        self.client = PooledJSONClient(host, port)
         self.test_results = []
         
     def log_test(self, test_name, success, response=None, error=None):
@@ -219,11 +220,10 @@ class RemoteMedicalServerTester:
         
         def concurrent_test(thread_id):
             try:
-                client = JSONProtocolClient(self.host, self.port)
                 test_data = {
                     "sql_query": f"SELECT 'Thread-{thread_id}' as thread_id, datetime('now') as timestamp"
                 }
-                response = client.send_json_data(test_data)
+                response = self.client.send_json_data(test_data)
                 results.append({
                     'thread_id': thread_id,
                     'success': response is not None,
@@ -409,6 +409,8 @@ def main():
         print("\n测试被用户中断")
     except Exception as e:
         print(f"\n测试过程中发生错误: {e}")
+    finally:
+        tester.client.close()
     
     print("\n测试完成！")
 
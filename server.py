@@ -14,7 +14,11 @@ import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from core.medical_server import MedicalServer
-from utils.server_manager import ServerManager
+from utils.server_manager import ServerManager, STOP_GRACE, is_handover
+from network.engines import available_engines
+from utils.cli_options import (add_network_arguments, network_options_from_args,
+                               add_database_arguments, database_options_from_args,
+                               add_plugin_arguments, add_logging_arguments, logging_options_from_args)
 
 
 def start_server(args):
@@ -22,8 +26,8 @@ def start_server(args):
     # 创建服务器管理器来检查状态
     server_manager = ServerManager(args.pid_file, args.log_file)
     
-    # 检查服务器是否已经在运行
-    if server_manager.is_server_running():
+    # 检查服务器是否已经在运行（平滑重启时正在运行的是即将退出的上一代进程）
+    if server_manager.is_server_running() and not is_handover():
         existing_pid = server_manager.get_server_pid()
         print(f"服务器已在运行 (PID: {existing_pid})")
         return False
@@ -33,13 +37,20 @@ def start_server(args):
     if args.daemon:
         print("以守护进程模式启动...")
     
+    if args.workers > 1:
+        return start_prefork(args)
+    
     # 创建服务器实例
     server = MedicalServer(
         host=args.host, 
         port=args.port, 
         db_path=args.db_path,
         log_file=args.log_file,
-        pid_file=args.pid_file
+        pid_file=args.pid_file,
+        network_options=network_options_from_args(args),
+        db_options=database_options_from_args(args),
+        plugins=args.plugin,
+        log_options=logging_options_from_args(args)
     )
     
     try:
@@ -61,17 +72,47 @@ def start_server(args):
     return True
 
 
+def start_prefork(args):
+    """多进程模式启动服务器（--workers大于1）"""
+    print(f"以多进程模式启动，工作进程数: {args.workers}")
+    return MedicalServer.serve_prefork(
+        args.workers,
+        daemon=args.daemon,
+        host=args.host,
+        port=args.port,
+        db_path=args.db_path,
+        log_file=args.log_file,
+        pid_file=args.pid_file,
+        network_options=network_options_from_args(args),
+        db_options=database_options_from_args(args),
+        plugins=args.plugin,
+        log_options=logging_options_from_args(args)
+    )
+
+
 def stop_server(args):
     """停止服务器"""
     server_manager = ServerManager(args.pid_file, args.log_file)
-    return server_manager.stop_server()
+    return server_manager.stop_server(args.drain_timeout + STOP_GRACE)
 
 
 def restart_server(args):
-    """重启服务器"""
-    print("重启服务器...")
+    """重启服务器
+
+    服务器正在运行时平滑重启：新进程接管监听套接字，旧进程处理完已接受的请求后退出，
+    期间客户端不会连接失败；平滑重启失败时改为停止后重新启动
+    """
     server_manager = ServerManager(args.pid_file, args.log_file)
-    server_manager.stop_server()
+    if server_manager.is_server_running():
+        print("平滑重启服务器...")
+        new_pid = server_manager.reload_server()
+        if new_pid:
+            print(f"新服务器进程已接管 (PID: {new_pid})")
+            return True
+        print("平滑重启失败，停止后重新启动...")
+    else:
+        print("重启服务器...")
+    server_manager.stop_server(args.drain_timeout + STOP_GRACE)
     time.sleep(2)  # 等待2秒确保完全停止
     return start_server(args)
 
@@ -106,8 +147,16 @@ def main():
     parser.add_argument('--pid-file', default='/medical/server.pid', help='PID文件路径')
     parser.add_argument('--daemon', action='store_true', help='以守护进程模式运行')
     parser.add_argument('--foreground', action='store_true', help='前台运行（覆盖--daemon）')
+    add_network_arguments(parser)
+    add_database_arguments(parser)
+    add_plugin_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
+    if args.no_tcp and not args.unix_socket:
+        parser.error("--no-tcp 需要同时指定 --unix-socket")
+    if args.engine not in available_engines():
+        parser.error(f"网络引擎 {args.engine} 在当前环境中不可用（需要安装{args.engine}）")
     
     # 如果指定了--foreground，覆盖--daemon设置
     if args.foreground:
@@ -2,19 +2,67 @@
 # -*- coding: utf-8 -*-
 """
 预约管理服务
-处理预约创建、查询、取消、状态更新等功能
+处理预约创建、查询、取消、状态更新等功能；
+预约变更（挂号、取消、状态更新）在写事务提交后通知已登记的监听函数（如推送中心）
 """
 
-import sqlite3
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable
+
+from models.connection_pool import ConnectionPool, get_pool
+from models.write_queue import WriteQueue, get_write_queue
+
+
+# 按ID查询预约的当前状态，以及变更通知需要的排队号、预约时间和医生姓名
+APPOINTMENT_STATE_SQL = """
+    SELECT a.status, a.appointment_id, a.queue_number, a.appointment_time, d.name
+    FROM appointments a
+    LEFT JOIN doctors d ON a.doctor_id = d.doctor_id
+    WHERE a.appointment_id = ?
+"""
 
 
 class AppointmentService:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool: Optional[ConnectionPool] = None,
+                 writer: Optional[WriteQueue] = None):
         self.db_path = db_path
+        self.pool = pool or get_pool(db_path)
+        # 写操作统一交给单写线程串行执行（排队号的计数和插入在同一个写事务中完成）
+        self.writer = writer or get_write_queue(db_path, pool=self.pool)
+        self.listeners = []
         self.logger = logging.getLogger(__name__)
     
+    def add_listener(self, callback: Callable[[str, str, Dict[str, Any]], Any]):
+        """登记预约变更的监听函数 callback(change, doctor_name, appointment)
+
+        change为 created / cancelled / status_changed；在写线程中、写事务提交之后调用，
+        不能阻塞（原子批量操作回滚时不调用）
+        """
+        self.listeners.append(callback)
+    
+    def notify_change(self, change: str, doctor_name: str, appointment: Dict[str, Any]):
+        """通知所有监听函数，单个监听函数出错不影响其他监听函数"""
+        for callback in self.listeners:
+            try:
+                callback(change, doctor_name, appointment)
+            except Exception as e:
+                self.logger.error(f"预约变更通知出错: {e}")
+    
+    def queue_snapshot(self, doctor_name: str) -> List[Dict[str, Any]]:
+        """医生当前的排队情况：今天及以后的待就诊预约（不含患者信息），按预约时间和排队号排序"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT a.appointment_id, a.queue_number, a.appointment_time, a.status
+                FROM appointments a
+                JOIN doctors d ON a.doctor_id = d.doctor_id
+                WHERE d.name = ? AND a.status = 'pending'
+                  AND DATE(a.appointment_time) >= DATE('now', 'localtime')
+                ORDER BY a.appointment_time ASC, a.queue_number ASC
+            """, (doctor_name,))
+            return [{"appointment_id": row[0], "queue_number": row[1], "appointment_time": row[2], "status": row[3]}
+                    for row in cursor.fetchall()]
+    
     def create_appointment(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """创建预约/挂号"""
         try:
@@ -32,76 +80,78 @@ class AppointmentService:
             appointment_time = data['appointment_time']
             fee_paid = data.get('fee_paid', 0)
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 查找患者
-            cursor.execute("SELECT patient_id FROM patients WHERE phone = ?", (patient_phone,))
-            patient_result = cursor.fetchone()
-            if not patient_result:
-                conn.close()
-                return {
-                    "status": "error",
-                    "message": f"未找到手机号为 {patient_phone} 的患者"
-                }
-            patient_id = patient_result[0]
-            
-            # 查找医生
-            cursor.execute("SELECT doctor_id FROM doctors WHERE name = ?", (doctor_name,))
-            doctor_result = cursor.fetchone()
-            if not doctor_result:
-                conn.close()
-                return {
-                    "status": "error",
-                    "message": f"未找到姓名为 {doctor_name} 的医生"
-                }
-            doctor_id = doctor_result[0]
-            
-            # 检查医生是否可用
-            cursor.execute("SELECT is_available FROM doctors WHERE doctor_id = ?", (doctor_id,))
-            doctor_available = cursor.fetchone()[0]
-            if not doctor_available:
-                conn.close()
+            def create(conn):
+                cursor = conn.cursor()
+                
+                # 查找患者
+                cursor.execute("SELECT patient_id FROM patients WHERE phone = ?", (patient_phone,))
+                patient_result = cursor.fetchone()
+                if not patient_result:
+                    return {
+                        "status": "error",
+                        "message": f"未找到手机号为 {patient_phone} 的患者"
+                    }
+                patient_id = patient_result[0]
+                
+                # 查找医生
+                cursor.execute("SELECT doctor_id FROM doctors WHERE name = ?", (doctor_name,))
+                doctor_result = cursor.fetchone()
+                if not doctor_result:
+                    return {
+                        "status": "error",
+                        "message": f"未找到姓名为 {doctor_name} 的医生"
+                    }
+                doctor_id = doctor_result[0]
+                
+                # 检查医生是否可用
+                cursor.execute("SELECT is_available FROM doctors WHERE doctor_id = ?", (doctor_id,))
+                doctor_available = cursor.fetchone()[0]
+                if not doctor_available:
+                    return {
+                        "status": "error",
+                        "message": f"医生 {doctor_name} 当前不可预约"
+                    }
+                
+                # 生成排队号码（当天该医生的预约数+1）
+                cursor.execute("""
+                    SELECT COUNT(*) FROM appointments 
+                    WHERE doctor_id = ? AND DATE(appointment_time) = DATE(?)
+                """, (doctor_id, appointment_time))
+                queue_number = cursor.fetchone()[0] + 1
+                
+                # 创建预约
+                cursor.execute("""
+                    INSERT INTO appointments (patient_id, doctor_id, appointment_time, status, fee_paid, queue_number)
+                    VALUES (?, ?, ?, 'pending', ?, ?)
+                """, (patient_id, doctor_id, appointment_time, fee_paid, queue_number))
+                
+                appointment_id = cursor.lastrowid
+                if self.listeners:
+                    self.writer.after_commit(self.notify_change, 'created', doctor_name, {
+                        "appointment_id": appointment_id,
+                        "queue_number": queue_number,
+                        "appointment_time": appointment_time,
+                        "status": "pending",
+                    })
+                
                 return {
-                    "status": "error",
-                    "message": f"医生 {doctor_name} 当前不可预约"
+                    "status": "success",
+                    "message": "预约创建成功",
+                    "appointment_info": {
+                        "appointment_id": appointment_id,
+                        "patient_phone": patient_phone,
+                        "doctor_name": doctor_name,
+                        "appointment_time": appointment_time,
+                        "queue_number": queue_number,
+                        "status": "pending",
+                        "fee_paid": bool(fee_paid)
+                    }
                 }
             
-            # 生成排队号码（当天该医生的预约数+1）
-            cursor.execute("""
-                SELECT COUNT(*) FROM appointments 
-                WHERE doctor_id = ? AND DATE(appointment_time) = DATE(?)
-            """, (doctor_id, appointment_time))
-            queue_number = cursor.fetchone()[0] + 1
-            
-            # 创建预约
-            cursor.execute("""
-                INSERT INTO appointments (patient_id, doctor_id, appointment_time, status, fee_paid, queue_number)
-                VALUES (?, ?, ?, 'pending', ?, ?)
-            """, (patient_id, doctor_id, appointment_time, fee_paid, queue_number))
-            
-            appointment_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            
-            return {
-                "status": "success",
-                "message": "预约创建成功",
-                "appointment_info": {
-                    "appointment_id": appointment_id,
-                    "patient_phone": patient_phone,
-                    "doctor_name": doctor_name,
-                    "appointment_time": appointment_time,
-                    "queue_number": queue_number,
-                    "status": "pending",
-                    "fee_paid": bool(fee_paid)
-                }
-            }
+            return self.writer.execute(create)
             
         except Exception as e:
             self.logger.error(f"创建预约异常: {e}")
-            if 'conn' in locals():
-                conn.close()
             return {
                 "status": "error",
                 "message": f"创建预约时出错: {str(e)}"
@@ -110,71 +160,70 @@ class AppointmentService:
     def query_appointments(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """查询预约信息"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 根据不同条件查询
-            if 'patient_phone' in data:
-                # 按患者手机号查询
-                patient_phone = data['patient_phone']
-                cursor.execute("""
-                    SELECT a.appointment_id, p.name as patient_name, p.phone,
-                           d.name as doctor_name, d.department,
-                           a.appointment_time, a.status, a.fee_paid, a.queue_number,
-                           a.created_at
-                    FROM appointments a
-                    JOIN patients p ON a.patient_id = p.patient_id
-                    JOIN doctors d ON a.doctor_id = d.doctor_id
-                    WHERE p.phone = ?
-                    ORDER BY a.appointment_time DESC
-                """, (patient_phone,))
-                
-            elif 'doctor_name' in data:
-                # 按医生姓名查询
-                doctor_name = data['doctor_name']
-                cursor.execute("""
-                    SELECT a.appointment_id, p.name as patient_name, p.phone,
-                           d.name as doctor_name, d.department,
-                           a.appointment_time, a.status, a.fee_paid, a.queue_number,
-                           a.created_at
-                    FROM appointments a
-                    JOIN patients p ON a.patient_id = p.patient_id
-                    JOIN doctors d ON a.doctor_id = d.doctor_id
-                    WHERE d.name = ?
-                    ORDER BY a.appointment_time ASC
-                """, (doctor_name,))
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
                 
-            elif 'appointment_date' in data:
-                # 按预约日期查询
-                appointment_date = data['appointment_date']
-                cursor.execute("""
-                    SELECT a.appointment_id, p.name as patient_name, p.phone,
-                           d.name as doctor_name, d.department,
-                           a.appointment_time, a.status, a.fee_paid, a.queue_number,
-                           a.created_at
-                    FROM appointments a
-                    JOIN patients p ON a.patient_id = p.patient_id
-                    JOIN doctors d ON a.doctor_id = d.doctor_id
-                    WHERE DATE(a.appointment_time) = ?
-                    ORDER BY a.appointment_time ASC
-                """, (appointment_date,))
+                # 根据不同条件查询
+                if 'patient_phone' in data:
+                    # 按患者手机号查询
+                    patient_phone = data['patient_phone']
+                    cursor.execute("""
+                        SELECT a.appointment_id, p.name as patient_name, p.phone,
+                               d.name as doctor_name, d.department,
+                               a.appointment_time, a.status, a.fee_paid, a.queue_number,
+                               a.created_at
+                        FROM appointments a
+                        JOIN patients p ON a.patient_id = p.patient_id
+                        JOIN doctors d ON a.doctor_id = d.doctor_id
+                        WHERE p.phone = ?
+                        ORDER BY a.appointment_time DESC
+                    """, (patient_phone,))
+                    
+                elif 'doctor_name' in data:
+                    # 按医生姓名查询
+                    doctor_name = data['doctor_name']
+                    cursor.execute("""
+                        SELECT a.appointment_id, p.name as patient_name, p.phone,
+                               d.name as doctor_name, d.department,
+                               a.appointment_time, a.status, a.fee_paid, a.queue_number,
+                               a.created_at
+                        FROM appointments a
+                        JOIN patients p ON a.patient_id = p.patient_id
+                        JOIN doctors d ON a.doctor_id = d.doctor_id
+                        WHERE d.name = ?
+                        ORDER BY a.appointment_time ASC
+                    """, (doctor_name,))
+                    
+                elif 'appointment_date' in data:
+                    # 按预约日期查询
+                    appointment_date = data['appointment_date']
+                    cursor.execute("""
+                        SELECT a.appointment_id, p.name as patient_name, p.phone,
+                               d.name as doctor_name, d.department,
+                               a.appointment_time, a.status, a.fee_paid, a.queue_number,
+                               a.created_at
+                        FROM appointments a
+                        JOIN patients p ON a.patient_id = p.patient_id
+                        JOIN doctors d ON a.doctor_id = d.doctor_id
+                        WHERE DATE(a.appointment_time) = ?
+                        ORDER BY a.appointment_time ASC
+                    """, (appointment_date,))
+                    
+                else:
+                    # 查询所有预约
+                    cursor.execute("""
+                        SELECT a.appointment_id, p.name as patient_name, p.phone,
+                               d.name as doctor_name, d.department,
+                               a.appointment_time, a.status, a.fee_paid, a.queue_number,
+                               a.created_at
+                        FROM appointments a
+                        JOIN patients p ON a.patient_id = p.patient_id
+                        JOIN doctors d ON a.doctor_id = d.doctor_id
+                        ORDER BY a.appointment_time DESC
+                        LIMIT 20
+                    """)
                 
-            else:
-                # 查询所有预约
-                cursor.execute("""
-                    SELECT a.appointment_id, p.name as patient_name, p.phone,
-                           d.name as doctor_name, d.department,
-                           a.appointment_time, a.status, a.fee_paid, a.queue_number,
-                           a.created_at
-                    FROM appointments a
-                    JOIN patients p ON a.patient_id = p.patient_id
-                    JOIN doctors d ON a.doctor_id = d.doctor_id
-                    ORDER BY a.appointment_time DESC
-                    LIMIT 20
-                """)
-            
-            appointments = cursor.fetchall()
-            conn.close()
+                appointments = cursor.fetchall()
             
             # 格式化结果
             appointment_list = []
@@ -200,8 +249,6 @@ class AppointmentService:
             
         except Exception as e:
             self.logger.error(f"查询预约异常: {e}")
-            if 'conn' in locals():
-                conn.close()
             return {
                 "status": "error",
                 "message": f"查询预约信息时出错: {str(e)}"
@@ -218,58 +265,66 @@ class AppointmentService:
             
             appointment_id = data['appointment_id']
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 检查预约是否存在
-            cursor.execute("SELECT status FROM appointments WHERE appointment_id = ?", (appointment_id,))
-            result = cursor.fetchone()
-            if not result:
-                conn.close()
-                return {
-                    "status": "error",
-                    "message": f"未找到ID为 {appointment_id} 的预约"
-                }
-            
-            current_status = result[0]
-            if current_status == 'cancelled':
-                conn.close()
-                return {
-                    "status": "error",
-                    "message": "该预约已经被取消"
-                }
-            
-            if current_status == 'completed':
-                conn.close()
+            def cancel(conn):
+                cursor = conn.cursor()
+                
+                # 检查预约是否存在（同时取出变更通知需要的医生和排队信息）
+                cursor.execute(APPOINTMENT_STATE_SQL, (appointment_id,))
+                result = cursor.fetchone()
+                if not result:
+                    return {
+                        "status": "error",
+                        "message": f"未找到ID为 {appointment_id} 的预约"
+                    }
+                
+                current_status = result[0]
+                if current_status == 'cancelled':
+                    return {
+                        "status": "error",
+                        "message": "该预约已经被取消"
+                    }
+                
+                if current_status == 'completed':
+                    return {
+                        "status": "error",
+                        "message": "已完成的预约无法取消"
+                    }
+                
+                # 更新预约状态为取消
+                cursor.execute("""
+                    UPDATE appointments 
+                    SET status = 'cancelled' 
+                    WHERE appointment_id = ?
+                """, (appointment_id,))
+                self.after_status_change('cancelled', result, 'cancelled')
+                
                 return {
-                    "status": "error",
-                    "message": "已完成的预约无法取消"
+                    "status": "success",
+                    "message": f"预约ID {appointment_id} 已成功取消"
                 }
             
-            # 更新预约状态为取消
-            cursor.execute("""
-                UPDATE appointments 
-                SET status = 'cancelled' 
-                WHERE appointment_id = ?
-            """, (appointment_id,))
-            
-            conn.commit()
-            conn.close()
-            
-            return {
-                "status": "success",
-                "message": f"预约ID {appointment_id} 已成功取消"
-            }
+            return self.writer.execute(cancel)
             
         except Exception as e:
             self.logger.error(f"取消预约异常: {e}")
-            if 'conn' in locals():
-                conn.close()
             return {
                 "status": "error",
                 "message": f"取消预约时出错: {str(e)}"
             }
     
+    def after_status_change(self, change: str, row: tuple, new_status: str):
+        """写任务中登记状态变更通知，row为APPOINTMENT_STATE_SQL查询到的变更前状态"""
+        old_status, appointment_id, queue_number, appointment_time, doctor_name = row
+        if not self.listeners or doctor_name is None:
+            return
+        self.writer.after_commit(self.notify_change, change, doctor_name, {
+            "appointment_id": appointment_id,
+            "queue_number": queue_number,
+            "appointment_time": appointment_time,
+            "status": new_status,
+            "previous_status": old_status,
+        })
+    
     def update_appointment_status(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """更新预约状态"""
         try:
@@ -292,40 +347,38 @@ class AppointmentService:
                     "message": f"无效的状态值: {new_status}，有效值: {valid_statuses}"
                 }
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 检查预约是否存在
-            cursor.execute("SELECT status FROM appointments WHERE appointment_id = ?", (appointment_id,))
-            result = cursor.fetchone()
-            if not result:
-                conn.close()
+            def update(conn):
+                cursor = conn.cursor()
+                
+                # 检查预约是否存在（同时取出变更通知需要的医生和排队信息）
+                cursor.execute(APPOINTMENT_STATE_SQL, (appointment_id,))
+                result = cursor.fetchone()
+                if not result:
+                    return {
+                        "status": "error",
+                        "message": f"未找到ID为 {appointment_id} 的预约"
+                    }
+                
+                old_status = result[0]
+                
+                # 更新预约状态
+                cursor.execute("""
+                    UPDATE appointments 
+                    SET status = ? 
+                    WHERE appointment_id = ?
+                """, (new_status, appointment_id))
+                if new_status != old_status:
+                    self.after_status_change('status_changed', result, new_status)
+                
                 return {
-                    "status": "error",
-                    "message": f"未找到ID为 {appointment_id} 的预约"
+                    "status": "success",
+                    "message": f"预约ID {appointment_id} 状态已从 '{old_status}' 更新为 '{new_status}'"
                 }
             
-            old_status = result[0]
-            
-            # 更新预约状态
-            cursor.execute("""
-                UPDATE appointments 
-                SET status = ? 
-                WHERE appointment_id = ?
-            """, (new_status, appointment_id))
-            
-            conn.commit()
-            conn.close()
-            
-            return {
-                "status": "success",
-                "message": f"预约ID {appointment_id} 状态已从 '{old_status}' 更新为 '{new_status}'"
-            }
+            return self.writer.execute(update)
             
         except Exception as e:
             self.logger.error(f"更新预约状态异常: {e}")
-            if 'conn' in locals():
-                conn.close()
             return {
                 "status": "error",
                 "message": f"更新预约状态时出错: {str(e)}"
@@ -5,15 +5,24 @@
 处理用户登录、注册、密码重置、信息更新等功能
 """
 
-import sqlite3
 import hashlib
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from models.connection_pool import ConnectionPool, get_pool
+from models.write_queue import WriteQueue, get_write_queue
+from services.profile_cache import ProfileCache
 
 
 class AuthService:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool: Optional[ConnectionPool] = None,
+                 writer: Optional[WriteQueue] = None, profile_cache: Optional[ProfileCache] = None):
         self.db_path = db_path
+        self.pool = pool or get_pool(db_path)
+        # 写操作统一交给单写线程串行执行
+        self.writer = writer or get_write_queue(db_path, pool=self.pool)
+        # 医生/患者资料查询缓存，键为('doctor', 姓名)或('patient', 姓名)
+        self.profile_cache = profile_cache or ProfileCache()
         self.logger = logging.getLogger(__name__)
     
     def hash_password(self, password: str) -> str:
@@ -31,17 +40,12 @@ class AuthService:
             user_name = data['user_name']
             password = data['password']
             
-            # 连接到数据库
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 查询用户记录
-            sql_select = "SELECT password_hash FROM users WHERE username = ?"
-            cursor.execute(sql_select, (user_name,))
-            result = cursor.fetchone()
-            
-            # 关闭连接
-            conn.close()
+            # 从连接池获取连接并查询用户记录
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                sql_select = "SELECT password_hash FROM users WHERE username = ?"
+                cursor.execute(sql_select, (user_name,))
+                result = cursor.fetchone()
 
             # 检查是否找到用户记录
             if result is None:
@@ -64,9 +68,6 @@ class AuthService:
             if 'name' not in data or 'password_hash' not in data or 'phone' not in data:
                 return "charuyichang"
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             name = data['name']
             password_hash = data['password_hash']
             birth_date = data.get('birth_date')
@@ -74,30 +75,31 @@ class AuthService:
             phone = data['phone']
             email = data.get('email')
             
-            # 检查手机号是否已存在
-            cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", (phone,))
-            if cursor.fetchone()[0] > 0:
-                conn.close()
-                return "shoujihaoyicunzai"
-            
-            # 先插入用户表，获取自动生成的user_id
-            cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)", 
-                          (phone, password_hash, 'patient'))
-            user_id = cursor.lastrowid  # 获取刚插入的user_id
-            
-            # 再插入患者详细信息表
-            cursor.execute("INSERT INTO patients (patient_id, name, birth_date, id_card, phone, email) VALUES (?, ?, ?, ?, ?, ?)",
-                          (user_id, name, birth_date, id_card, phone, email))
+            def register(conn):
+                cursor = conn.cursor()
+                
+                # 检查手机号是否已存在
+                cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", (phone,))
+                if cursor.fetchone()[0] > 0:
+                    return "shoujihaoyicunzai"
+                
+                # 先插入用户表，获取自动生成的user_id
+                cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)", 
+                              (phone, password_hash, 'patient'))
+                user_id = cursor.lastrowid  # 获取刚插入的user_id
+                
+                # 再插入患者详细信息表
+                cursor.execute("INSERT INTO patients (patient_id, name, birth_date, id_card, phone, email) VALUES (?, ?, ?, ?, ?, ?)",
+                              (user_id, name, birth_date, id_card, phone, email))
+                return "chenggongcharu"
             
-            conn.commit()
-            conn.close()
-            return "chenggongcharu"
+            result = self.writer.execute(register)
+            # 事务已提交，同名患者的缓存结果可能已变化
+            self.writer.after_commit(self.profile_cache.invalidate, ('patient', name))
+            return result
             
         except Exception as e:
             self.logger.error(f"患者注册异常: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return "charuyichang"
     
     def register_doctor(self, data: Dict[str, Any]) -> str:
@@ -115,39 +117,37 @@ class AuthService:
             if not name or not password_hash or not employee_id:
                 return "charuyichang"
                 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # 获取可选字段，确保数据类型正确
             department = str(data.get('department', '')).strip() if data.get('department') else None
             photo_path = str(data.get('photo_path', '')).strip() if data.get('photo_path') else None
             
-            # 检查工号是否已存在
-            cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", (employee_id,))
-            if cursor.fetchone()[0] > 0:
-                conn.close()
-                return "gonghaoyicunzai"
-            
-            # 先插入用户表，获取自动生成的user_id
-            cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-                          (employee_id, password_hash, 'doctor'))
-            user_id = cursor.lastrowid  # 获取刚插入的user_id
-            
-            # 再插入医生详细信息表，确保数据类型匹配
-            cursor.execute("""
-                INSERT INTO doctors (doctor_id, name, employee_id, department, photo_path, max_patients) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (int(user_id), name, employee_id, department, photo_path, 30))
-            
-            conn.commit()
-            conn.close()
-            return "chenggongcharu"
+            def register(conn):
+                cursor = conn.cursor()
+                
+                # 检查工号是否已存在
+                cursor.execute("SELECT COUNT(*) FROM users WHERE username = ?", (employee_id,))
+                if cursor.fetchone()[0] > 0:
+                    return "gonghaoyicunzai"
+                
+                # 先插入用户表，获取自动生成的user_id
+                cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              (employee_id, password_hash, 'doctor'))
+                user_id = cursor.lastrowid  # 获取刚插入的user_id
+                
+                # 再插入医生详细信息表，确保数据类型匹配
+                cursor.execute("""
+                    INSERT INTO doctors (doctor_id, name, employee_id, department, photo_path, max_patients) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (int(user_id), name, employee_id, department, photo_path, 30))
+                return "chenggongcharu"
+            
+            result = self.writer.execute(register)
+            # 事务已提交，同名医生的缓存结果可能已变化
+            self.writer.after_commit(self.profile_cache.invalidate, ('doctor', name))
+            return result
             
         except Exception as e:
             self.logger.error(f"医生注册异常: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return "charuyichang"
     
     def update_user_password(self, data: Dict[str, Any]) -> str:
@@ -159,29 +159,24 @@ class AuthService:
             username = data['username']
             new_password = data['new_password']
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            def update(conn):
+                cursor = conn.cursor()
 
-            # 在新表结构中查找用户
-            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-            user = cursor.fetchone()
+                # 在新表结构中查找用户
+                cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
+                user = cursor.fetchone()
 
-            if not user:
-                conn.close()
-                return f"错误: 未找到用户名为 {username} 的用户"
+                if not user:
+                    return f"错误: 未找到用户名为 {username} 的用户"
 
-            # 更新密码哈希
-            cursor.execute("UPDATE users SET password_hash = ? WHERE username = ?", (new_password, username))
-            conn.commit()
-            conn.close()
+                # 更新密码哈希
+                cursor.execute("UPDATE users SET password_hash = ? WHERE username = ?", (new_password, username))
+                return f"用户 {username} 的密码更新成功"
 
-            return f"用户 {username} 的密码更新成功"
+            return self.writer.execute(update)
 
         except Exception as e:
             self.logger.error(f"更新密码异常: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return f"错误: {str(e)}"
     
     def update_patient_info(self, data: Dict[str, Any]) -> str:
@@ -191,57 +186,59 @@ class AuthService:
                 return "错误: 需要提供old_phone字段"
 
             old_phone = data['old_phone']
+            # 受影响的缓存键（修改前后的姓名）
+            affected_keys = []
+
+            def update(conn):
+                cursor = conn.cursor()
+
+                # 通过手机号在患者表中查找患者
+                cursor.execute("SELECT patient_id, name FROM patients WHERE phone = ?", (old_phone,))
+                patient = cursor.fetchone()
+
+                if not patient:
+                    return f"错误: 未找到手机号为 {old_phone} 的患者"
+
+                patient_id = patient[0]
+                affected_keys.append(('patient', patient[1]))
+                if 'new_name' in data:
+                    affected_keys.append(('patient', data['new_name']))
+                update_fields = []
+                update_values = []
+
+                field_mapping = {
+                    'new_name': 'name',
+                    'new_birth_date': 'birth_date',
+                    'new_id_card': 'id_card',
+                    'new_phone': 'phone',
+                    'new_email': 'email'
+                }
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # 通过手机号在患者表中查找患者
-            cursor.execute("SELECT patient_id FROM patients WHERE phone = ?", (old_phone,))
-            patient = cursor.fetchone()
-
-            if not patient:
-                conn.close()
-                return f"错误: 未找到手机号为 {old_phone} 的患者"
-
-            patient_id = patient[0]
-            update_fields = []
-            update_values = []
-
-            field_mapping = {
-                'new_name': 'name',
-                'new_birth_date': 'birth_date',
-                'new_id_card': 'id_card',
-                'new_phone': 'phone',
-                'new_email': 'email'
-            }
-
-            for json_key, db_field in field_mapping.items():
-                if json_key in data:
-                    update_fields.append(f"{db_field} = ?")
-                    update_values.append(data[json_key])
+                for json_key, db_field in field_mapping.items():
+                    if json_key in data:
+                        update_fields.append(f"{db_field} = ?")
+                        update_values.append(data[json_key])
 
-            if not update_fields:
-                conn.close()
-                return "错误: 未提供任何需要更新的字段"
+                if not update_fields:
+                    return "错误: 未提供任何需要更新的字段"
 
-            # 如果更新手机号，也需要更新users表中的username
-            if 'new_phone' in data:
-                cursor.execute("UPDATE users SET username = ? WHERE user_id = ?", (data['new_phone'], patient_id))
+                # 如果更新手机号，也需要更新users表中的username
+                if 'new_phone' in data:
+                    cursor.execute("UPDATE users SET username = ? WHERE user_id = ?", (data['new_phone'], patient_id))
 
-            update_values.append(patient_id)
-            sql_update = f"UPDATE patients SET {', '.join(update_fields)} WHERE patient_id = ?"
+                update_values.append(patient_id)
+                sql_update = f"UPDATE patients SET {', '.join(update_fields)} WHERE patient_id = ?"
 
-            cursor.execute(sql_update, update_values)
-            conn.commit()
-            conn.close()
+                cursor.execute(sql_update, update_values)
+                return f"患者ID为 {patient_id} 的患者信息更新成功"
 
-            return f"患者ID为 {patient_id} 的患者信息更新成功"
+            result = self.writer.execute(update)
+            if affected_keys:
+                self.writer.after_commit(self.profile_cache.invalidate, *affected_keys)
+            return result
 
         except Exception as e:
             self.logger.error(f"更新患者信息异常: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return f"错误: {str(e)}"
     
     def update_doctor_info(self, data: Dict[str, Any]) -> str:
@@ -251,60 +248,62 @@ class AuthService:
                 return "错误: 需要提供old_employee_id字段"
 
             old_employee_id = data['old_employee_id']
+            # 受影响的缓存键（修改前后的姓名）
+            affected_keys = []
+
+            def update(conn):
+                cursor = conn.cursor()
+
+                # 通过工号查找医生
+                cursor.execute("SELECT doctor_id, name FROM doctors WHERE employee_id = ?", (old_employee_id,))
+                doctor = cursor.fetchone()
+
+                if not doctor:
+                    return f"错误: 未找到工号为 {old_employee_id} 的医生"
+
+                doctor_id = doctor[0]
+                affected_keys.append(('doctor', doctor[1]))
+                if 'new_name' in data:
+                    affected_keys.append(('doctor', data['new_name']))
+                update_fields = []
+                update_values = []
+
+                field_mapping = {
+                    'new_name': 'name',
+                    'new_employee_id': 'employee_id',
+                    'new_department': 'department',
+                    'new_max_patients': 'max_patients',
+                    'new_fee': 'fee',
+                    'new_work_schedule': 'work_schedule',
+                    'new_is_available': 'is_available',
+                    'new_photo_path': 'photo_path'
+                }
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # 通过工号查找医生
-            cursor.execute("SELECT doctor_id FROM doctors WHERE employee_id = ?", (old_employee_id,))
-            doctor = cursor.fetchone()
-
-            if not doctor:
-                conn.close()
-                return f"错误: 未找到工号为 {old_employee_id} 的医生"
-
-            doctor_id = doctor[0]
-            update_fields = []
-            update_values = []
-
-            field_mapping = {
-                'new_name': 'name',
-                'new_employee_id': 'employee_id',
-                'new_department': 'department',
-                'new_max_patients': 'max_patients',
-                'new_fee': 'fee',
-                'new_work_schedule': 'work_schedule',
-                'new_is_available': 'is_available',
-                'new_photo_path': 'photo_path'
-            }
-
-            for json_key, db_field in field_mapping.items():
-                if json_key in data:
-                    update_fields.append(f"{db_field} = ?")
-                    update_values.append(data[json_key])
+                for json_key, db_field in field_mapping.items():
+                    if json_key in data:
+                        update_fields.append(f"{db_field} = ?")
+                        update_values.append(data[json_key])
 
-            if not update_fields:
-                conn.close()
-                return "错误: 未提供任何需要更新的字段"
+                if not update_fields:
+                    return "错误: 未提供任何需要更新的字段"
 
-            # 如果更新工号，也需要更新users表中的username
-            if 'new_employee_id' in data:
-                cursor.execute("UPDATE users SET username = ? WHERE user_id = ?", (data['new_employee_id'], doctor_id))
+                # 如果更新工号，也需要更新users表中的username
+                if 'new_employee_id' in data:
+                    cursor.execute("UPDATE users SET username = ? WHERE user_id = ?", (data['new_employee_id'], doctor_id))
 
-            update_values.append(doctor_id)
-            sql_update = f"UPDATE doctors SET {', '.join(update_fields)} WHERE doctor_id = ?"
+                update_values.append(doctor_id)
+                sql_update = f"UPDATE doctors SET {', '.join(update_fields)} WHERE doctor_id = ?"
 
-            cursor.execute(sql_update, update_values)
-            conn.commit()
-            conn.close()
+                cursor.execute(sql_update, update_values)
+                return f"医生ID为 {doctor_id} 的医生信息更新成功"
 
-            return f"医生ID为 {doctor_id} 的医生信息更新成功"
+            result = self.writer.execute(update)
+            if affected_keys:
+                self.writer.after_commit(self.profile_cache.invalidate, *affected_keys)
+            return result
 
         except Exception as e:
             self.logger.error(f"更新医生信息异常: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-                conn.close()
             return f"错误: {str(e)}"
     
     def query_doctor_info(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -318,32 +317,40 @@ class AuthService:
             
             doctor_name = data['doctor_name']
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 联合查询医生信息和用户信息
-            sql_query = """
-                SELECT 
-                    d.doctor_id,
-                    d.name,
-                    d.employee_id,
-                    d.department,
-                    d.photo_path,
-                    d.max_patients,
-                    d.fee,
-                    d.work_schedule,
-                    d.is_available,
-                    u.username,
-                    u.role,
-                    u.created_at
-                FROM doctors d
-                INNER JOIN users u ON d.doctor_id = u.user_id
-                WHERE d.name = ?
-            """
-            
-            cursor.execute(sql_query, (doctor_name,))
-            result = cursor.fetchone()
-            conn.close()
+            # 先查缓存；未命中时记下失效代数，查询期间若有写操作提交则不写入缓存
+            cache_key = ('doctor', doctor_name)
+            # 原子批量操作在写事务中执行，可能读到未提交的修改，既不读也不写缓存
+            use_cache = not self.writer.in_writer_thread()
+            hit, cached = self.profile_cache.get(cache_key) if use_cache else (False, None)
+            if hit:
+                return cached
+            generation = self.profile_cache.generation()
+            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # 联合查询医生信息和用户信息
+                sql_query = """
+                    SELECT 
+                        d.doctor_id,
+                        d.name,
+                        d.employee_id,
+                        d.department,
+                        d.photo_path,
+                        d.max_patients,
+                        d.fee,
+                        d.work_schedule,
+                        d.is_available,
+                        u.username,
+                        u.role,
+                        u.created_at
+                    FROM doctors d
+                    INNER JOIN users u ON d.doctor_id = u.user_id
+                    WHERE d.name = ?
+                """
+                
+                cursor.execute(sql_query, (doctor_name,))
+                result = cursor.fetchone()
             
             if not result:
                 return {
@@ -367,16 +374,17 @@ class AuthService:
                 "created_at": result[11]
             }
             
-            return {
+            response = {
                 "status": "success",
                 "message": "查询成功",
                 "doctor_info": doctor_info
             }
+            if use_cache:
+                self.profile_cache.put(cache_key, response, generation)
+            return response
             
         except Exception as e:
             self.logger.error(f"查询医生信息异常: {e}")
-            if 'conn' in locals():
-                conn.close()
             return {
                 "status": "error",
                 "message": f"查询医生信息时出错: {str(e)}"
@@ -393,30 +401,38 @@ class AuthService:
             
             patient_name = data['patient_name']
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 联合查询患者信息和用户信息
-            sql_query = """
-                SELECT 
-                    p.patient_id,
-                    p.name,
-                    p.birth_date,
-                    p.id_card,
-                    p.phone,
-                    p.email,
-                    p.created_at as patient_created_at,
-                    u.username,
-                    u.role,
-                    u.created_at as user_created_at
-                FROM patients p
-                INNER JOIN users u ON p.patient_id = u.user_id
-                WHERE p.name = ?
-            """
-            
-            cursor.execute(sql_query, (patient_name,))
-            result = cursor.fetchone()
-            conn.close()
+            # 先查缓存；未命中时记下失效代数，查询期间若有写操作提交则不写入缓存
+            cache_key = ('patient', patient_name)
+            # 原子批量操作在写事务中执行，可能读到未提交的修改，既不读也不写缓存
+            use_cache = not self.writer.in_writer_thread()
+            hit, cached = self.profile_cache.get(cache_key) if use_cache else (False, None)
+            if hit:
+                return cached
+            generation = self.profile_cache.generation()
+            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # 联合查询患者信息和用户信息
+                sql_query = """
+                    SELECT 
+                        p.patient_id,
+                        p.name,
+                        p.birth_date,
+                        p.id_card,
+                        p.phone,
+                        p.email,
+                        p.created_at as patient_created_at,
+                        u.username,
+                        u.role,
+                        u.created_at as user_created_at
+                    FROM patients p
+                    INNER JOIN users u ON p.patient_id = u.user_id
+                    WHERE p.name = ?
+                """
+                
+                cursor.execute(sql_query, (patient_name,))
+                result = cursor.fetchone()
             
             if not result:
                 return {
@@ -438,16 +454,17 @@ class AuthService:
                 "user_created_at": result[9]
             }
             
-            return {
+            response = {
                 "status": "success",
                 "message": "查询成功",
                 "patient_info": patient_info
             }
+            if use_cache:
+                self.profile_cache.put(cache_key, response, generation)
+            return response
             
         except Exception as e:
             self.logger.error(f"查询患者信息异常: {e}")
-            if 'conn' in locals():
-                conn.close()
             return {
                 "status": "error",
                 "message": f"查询患者信息时出错: {str(e)}"
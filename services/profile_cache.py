@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+医生/患者资料缓存
+query_doctor_info、query_patient_info的查询结果按姓名缓存在进程内（LRU + TTL），
+经由服务器的写操作在事务提交后精确失效；
+多进程模式下各工作进程共享一个失效计数器，任一进程的写操作会清空所有进程的缓存
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class ProfileCache:
+    """线程安全的LRU/TTL缓存
+
+    防止并发读写时缓存旧数据：读取方在查询数据库之前调用generation()记下代数，
+    查询完成后用put(key, value, generation)写入；期间若有失效操作（代数已变化），
+    这次写入会被丢弃
+
+    shared_generation为多进程共享的计数器（multiprocessing.Value），本进程失效时加一；
+    每次访问缓存时发现计数器变化（其他进程有写操作）就清空本进程的缓存
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0, shared_generation: Optional[Any] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, value)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._shared = shared_generation
+        self._shared_seen = shared_generation.value if shared_generation is not None else 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def generation(self) -> int:
+        """当前失效代数"""
+        with self._lock:
+            self._sync_shared()
+            return self._generation
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """返回(是否命中, 缓存值)"""
+        if not self.enabled:
+            return False, None
+        now = time.monotonic()
+        with self._lock:
+            self._sync_shared()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        """写入缓存；generation与当前代数不一致时说明查询期间数据已被修改，放弃写入"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._sync_shared()
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: Hashable):
+        """删除指定的缓存项（写操作提交之后调用）"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in keys:
+                self._entries.pop(key, None)
+            self._bump_shared()
+
+    def clear(self):
+        """清空缓存（无法确定影响范围的写操作，如sql_query中的UPDATE）"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self._bump_shared()
+
+    def _sync_shared(self):
+        """其他进程有写操作时清空本进程的缓存（调用方持有_lock）"""
+        if self._shared is None:
+            return
+        current = self._shared.value
+        if current != self._shared_seen:
+            self._shared_seen = current
+            self._generation += 1
+            self._entries.clear()
+
+    def _bump_shared(self):
+        """通知其他进程清空缓存（调用方持有_lock）"""
+        if self._shared is None:
+            return
+        with self._shared.get_lock():
+            if self._shared.value != self._shared_seen:
+                # 其他进程在此之前也有写操作，本进程的缓存需要全部清空
+                self._entries.clear()
+            self._shared.value += 1
+            self._shared_seen = self._shared.value
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
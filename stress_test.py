@@ -17,22 +17,27 @@ from datetime import datetime
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from network.communication import JSONProtocolClient
+from network.async_client import PooledJSONClient
 
 
 class StressTester:
-    def __init__(self, host='8.140.225.6', port=55000):
+    def __init__(self, host='8.140.225.6', port=55000, pool_size=50):
         self.host = host
         self.port = port
+        # 所有线程共用一个连接池客户端，不再每个请求新建连接
+        self.client = PooledJSONClient(host, port, pool_size=pool_size)
         self.results = []
         self.lock = threading.Lock()
+
+    def close(self):
+        """关闭连接池"""
+        self.client.close()
     
     def single_request_test(self, request_id, test_data):
         """单个请求测试"""
         start_time = time.time()
         try:
-            client = JSONProtocolClient(self.host, self.port)
-            response = client.send_json_data(test_data)
+            response = self.client.send_json_data(test_data)
             end_time = time.time()
             
             result = {
@@ -244,7 +249,14 @@ def main():
     print("=" * 60)
     
     tester = StressTester()
-    
+    try:
+        run_tests(tester)
+    finally:
+        tester.close()
+
+
+def run_tests(tester):
+    """连接测试后按选择执行压力测试"""
     # 连接测试
     if not tester.connection_test():
         print("无法连接到服务器，测试终止")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量操作（batch）
+验证原子批次中任一子请求失败时整个批次回滚，非原子批次中子请求互不影响
+（直接调用请求处理器，使用临时数据库文件，不需要启动服务器）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.medical_server import MedicalServer
+
+
+def make_server(directory):
+    """使用临时目录中的数据库和日志文件创建服务器（不启动网络监听）"""
+    return MedicalServer('127.0.0.1', 0, os.path.join(directory, 'medical.db'),
+                         os.path.join(directory, 'server.log'), os.path.join(directory, 'server.pid'))
+
+
+def insert_note(body):
+    return {"op": "insert_data", "table_name": "notes", "body": body}
+
+
+def count_notes(server):
+    return server.process_json_data({"op": "sql_query", "sql_query": "SELECT COUNT(*) FROM notes"})["data"][0][0]
+
+
+def run_tests(server):
+    """依次执行各项检查，返回失败的项数"""
+    failed = 0
+    server.process_json_data({"op": "sql_query", "sql_query": "CREATE TABLE notes (body TEXT NOT NULL)"})
+
+    def check(description, condition):
+        nonlocal failed
+        print(f"{'✅' if condition else '❌'} {description}")
+        if not condition:
+            failed += 1
+
+    response = server.process_json_data({"op": "batch", "atomic": True, "requests": [
+        insert_note("a"), insert_note("b"), insert_note(None), insert_note("c")]})
+    statuses = [outcome["status"] for outcome in response["results"]]
+    check("原子批次中第3个子请求失败时整个批次回滚",
+          response["committed"] is False and count_notes(server) == 0)
+    check("失败之前的子请求标记为rolled_back，之后的子请求标记为skipped",
+          statuses == ["rolled_back", "rolled_back", "error", "skipped"])
+
+    response = server.process_json_data({"op": "batch", "atomic": True, "requests": [
+        insert_note("a"), insert_note("b")]})
+    check("全部成功的原子批次一起提交",
+          response["committed"] is True and response["succeeded"] == 2 and count_notes(server) == 2)
+
+    response = server.process_json_data({"op": "batch", "requests": [
+        insert_note("c"), insert_note(None), insert_note("d")]})
+    check("非原子批次中失败的子请求不影响其他子请求",
+          response["succeeded"] == 2 and response["failed"] == 1 and count_notes(server) == 4)
+
+    response = server.process_json_data({"op": "batch", "atomic": True, "requests": [
+        {"op": "batch", "requests": [insert_note("e")]}]})
+    check("batch不能嵌套", response["results"][0]["status"] == "error" and count_notes(server) == 4)
+    return failed
+
+
+def test_batch_atomicity():
+    """原子批次回滚、非原子批次互不影响"""
+    with tempfile.TemporaryDirectory() as directory:
+        server = make_server(directory)
+        try:
+            assert run_tests(server) == 0
+        finally:
+            server.close_database()
+
+
+def main():
+    """主测试函数"""
+    print("🧪 批量操作测试")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as directory:
+        server = make_server(directory)
+        try:
+            failed = run_tests(server)
+        finally:
+            server.close_database()
+    print("=" * 50)
+    print("测试完成！" if not failed else f"{failed} 项测试失败")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
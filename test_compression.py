@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试压缩消息体的长度限制
+验证压缩过的请求体解压后超过上限时被拒绝（不会先解压出完整内容），正常的压缩消息体照常解码，
+以及HTTP网关对gzip请求体的同样限制
+（不需要启动服务器）
+"""
+
+import sys
+import os
+import gzip
+import json
+import zlib
+import http.client
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.router import OperationRouter
+from network.codec import CodecError, get_codec
+from network.compression import CompressedCodec, compress_body, decompress_body, get_compressor
+from network.communication import NetworkHandler
+from network.framing import FrameRejected
+from network.http_gateway import HTTPGateway
+
+
+def zlib_body(data):
+    """按协议格式压缩的消息体（0x00 + 算法名 + 0x00 + 压缩数据）"""
+    return b'\x00zlib\x00' + zlib.compress(data, 9)
+
+
+def test_roundtrip():
+    """不小于阈值的消息体被压缩，解码后与原内容相同"""
+    codec = CompressedCodec(get_codec('json'), get_compressor('zlib'), threshold=100)
+    payload = {"rows": [[i, "患者" * 10] for i in range(200)]}
+    encoded = codec.encode(payload)
+    assert encoded.startswith(b'\x00zlib\x00')
+    assert CompressedCodec(get_codec('json'), max_decompressed_size=1024 * 1024).decode(encoded) == payload
+    assert codec.encode({"a": 1}) == get_codec('json').encode({"a": 1})
+
+
+def test_decompression_bomb_rejected():
+    """解压后超过上限的请求体以body_too_large拒绝"""
+    bomb = zlib_body(b'{"a": "' + b'0' * (16 * 1024 * 1024) + b'"}')
+    assert len(bomb) < 64 * 1024
+    codec = CompressedCodec(get_codec('json'), max_decompressed_size=1024 * 1024)
+    try:
+        codec.decode(bomb)
+    except FrameRejected as e:
+        assert e.code == 'body_too_large' and e.details['limit'] == 1024 * 1024, e.details
+    else:
+        raise AssertionError("应该拒绝解压后超过上限的消息体")
+
+    # 刚好等于上限的消息体可以解码
+    exact = b'0' * 1024
+    assert bytes(decompress_body(zlib_body(exact), 1024)) == exact
+
+
+def test_truncated_body_rejected():
+    """压缩数据不完整或算法未知时抛出CodecError"""
+    body = compress_body(b'x' * 10000, get_compressor('zlib'), 100)
+    for data in (body[:-10], b'\x00unknown\x00abc'):
+        try:
+            decompress_body(data, 1024 * 1024)
+        except CodecError:
+            continue
+        raise AssertionError(f"应该抛出CodecError: {data[:20]!r}")
+
+
+def test_gateway_gzip_bomb_rejected():
+    """HTTP网关的gzip请求体解压后超过max_body_size时回复413"""
+    handler = NetworkHandler('127.0.0.1', 0, max_body_size=1024 * 1024)
+    router = OperationRouter()
+    router.register('echo', lambda data: {"keys": sorted(data)})
+    handler.set_request_handler(router.dispatch)
+    gateway = HTTPGateway(handler, router, '127.0.0.1', 0, workers=2)
+    gateway.start()
+    try:
+        port = gateway.server.socket.getsockname()[1]
+
+        def post(body):
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            try:
+                conn.request('POST', '/api/echo', body,
+                             {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+                response = conn.getresponse()
+                return response.status, json.loads(response.read())
+            finally:
+                conn.close()
+
+        bomb = gzip.compress(b'{"a": "' + b'0' * (16 * 1024 * 1024) + b'"}', 9)
+        status, reply = post(bomb)
+        assert status == 413 and reply.get('error_code') == 'body_too_large', (status, reply)
+
+        status, reply = post(gzip.compress(json.dumps({"b": 1, "a": 2}).encode('utf-8')))
+        assert status == 200 and reply['result'] == {"keys": ["a", "b"]}, (status, reply)
+
+        status, _ = post(gzip.compress(b'{"a": 1}')[:-8])
+        assert status == 400, status
+    finally:
+        gateway.stop()
+        gateway.wait_stopped()
+
+
+def main():
+    """主测试函数"""
+    print("🧪 压缩消息体测试")
+    print("=" * 50)
+    failed = 0
+    for test in (test_roundtrip, test_decompression_bomb_rejected, test_truncated_body_rejected,
+                 test_gateway_gzip_bomb_rejected):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e!r}")
+    print("=" * 50)
+    print("测试完成！" if not failed else f"{failed} 项测试失败")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
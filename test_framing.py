@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试帧读取层（network/framing.py）
+验证按长度精确读取（分段到达、连续多帧、帧边界关闭、帧中途关闭），
+以及超长帧在读取内容之前被拒绝、读取停滞的帧在截止时间后被拒绝
+（使用socketpair，不需要启动服务器）
+"""
+
+import sys
+import os
+import socket
+import struct
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from network.framing import (IncompleteFrameError, FrameTooLargeError, FrameTimeoutError,
+                             read_request_frame, read_response_frame)
+
+
+def request_frame(filename, body):
+    name = filename.encode('utf-8')
+    return struct.pack('!I', len(name)) + name + struct.pack('!I', len(body)) + body
+
+
+def send_in_pieces(sock, data, piece_size=3, delay=0.002):
+    """把数据拆成很小的片段分别发送，模拟分段到达"""
+    for start in range(0, len(data), piece_size):
+        sock.sendall(data[start:start + piece_size])
+        time.sleep(delay)
+
+
+def test_exact_read_in_pieces():
+    """分段到达的连续多个请求帧被逐个完整读出，帧边界处关闭返回None"""
+    server, client = socket.socketpair()
+    with server, client:
+        frames = [("data.json", b'{"a": 1}'), ("x;id=7", b'{"b": "' + b'z' * 5000 + b'"}'), ("empty", b'')]
+        data = b''.join(request_frame(name, body) for name, body in frames)
+        sender = threading.Thread(target=lambda: (send_in_pieces(client, data, 7), client.shutdown(socket.SHUT_WR)))
+        sender.start()
+        received = []
+        while True:
+            frame = read_request_frame(server)
+            if frame is None:
+                break
+            received.append((frame[0], bytes(frame[1])))
+        sender.join()
+        assert received == frames, received
+
+
+def test_close_inside_frame():
+    """帧中途关闭连接抛出IncompleteFrameError"""
+    server, client = socket.socketpair()
+    with server, client:
+        client.sendall(request_frame("data.json", b'{"a": 1}')[:-3])
+        client.shutdown(socket.SHUT_WR)
+        try:
+            read_request_frame(server)
+        except IncompleteFrameError:
+            pass
+        else:
+            raise AssertionError("应该抛出IncompleteFrameError")
+
+
+def test_response_frames():
+    """响应帧按长度前缀读取"""
+    server, client = socket.socketpair()
+    with server, client:
+        server.sendall(struct.pack('!I', 5) + b'hello' + struct.pack('!I', 2) + b'ok')
+        server.shutdown(socket.SHUT_WR)
+        assert read_response_frame(client) == b'hello'
+        assert read_response_frame(client) == b'ok'
+        assert read_response_frame(client) is None
+
+
+def test_oversize_frame_rejected():
+    """长度前缀超过上限时直接拒绝，不读取也不分配内容缓冲区"""
+    server, client = socket.socketpair()
+    with server, client:
+        client.sendall(struct.pack('!I', 9) + b'data.json' + struct.pack('!I', 1 << 30))
+        try:
+            read_request_frame(server, max_name_size=1024, max_body_size=1024 * 1024, timeout=1.0)
+        except FrameTooLargeError as e:
+            assert e.code == 'body_too_large' and e.details['limit'] == 1024 * 1024, e.details
+        else:
+            raise AssertionError("应该抛出FrameTooLargeError")
+
+        client.sendall(struct.pack('!I', 1 << 20))
+        try:
+            read_request_frame(server, max_name_size=1024)
+        except FrameTooLargeError as e:
+            assert e.code == 'filename_too_large', e.code
+        else:
+            raise AssertionError("应该抛出FrameTooLargeError")
+
+
+def test_stalled_frame_times_out():
+    """只发送了一部分的帧在截止时间后被拒绝，并恢复套接字原来的超时设置"""
+    server, client = socket.socketpair()
+    with server, client:
+        frame = request_frame("data.json", b'{"a": 1}')
+        client.sendall(frame[:6])
+        started = time.monotonic()
+        try:
+            read_request_frame(server, timeout=0.2)
+        except FrameTimeoutError:
+            pass
+        else:
+            raise AssertionError("应该抛出FrameTimeoutError")
+        assert time.monotonic() - started < 1.0
+        assert server.gettimeout() is None
+
+        # 截止时间覆盖整个帧：不断发送少量数据也不能无限延长
+        other_server, other_client = socket.socketpair()
+        with other_server, other_client:
+            sender = threading.Thread(target=send_in_pieces, args=(other_client, frame, 1, 0.05))
+            sender.start()
+            try:
+                read_request_frame(other_server, timeout=0.3)
+            except FrameTimeoutError:
+                pass
+            else:
+                raise AssertionError("应该抛出FrameTimeoutError")
+            sender.join()
+
+
+def main():
+    """主测试函数"""
+    print("🧪 帧读取层测试")
+    print("=" * 50)
+    failed = 0
+    for test in (test_exact_read_in_pieces, test_close_inside_frame, test_response_frames,
+                 test_oversize_frame_rejected, test_stalled_frame_times_out):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e!r}")
+    print("=" * 50)
+    print("测试完成！" if not failed else f"{failed} 项测试失败")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
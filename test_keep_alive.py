@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试持久连接客户端的重发规则
+请求没有发出时（复用的连接已被服务器关闭）换新连接重发；请求发出之后连接中断时不重发，
+避免服务器已经执行过的写操作被执行两次
+（使用一个按协议收发帧的测试服务器，记录收到的每个请求，不需要启动医疗服务器）
+"""
+
+import sys
+import os
+import json
+import socket
+import struct
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from network.async_client import ConnectionLost, PooledJSONClient
+from network.communication import JSONProtocolClient
+
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class FrameServer:
+    """测试服务器：记录收到的请求，按请求中的action字段决定如何响应
+
+    - 默认：返回响应（回显文件名中的 ;id= 参数）
+    - close_after为true：返回响应后关闭连接（模拟空闲超时）
+    - drop：读完请求后不响应，直接关闭连接
+    - drop_once：同一个token第一次收到时按drop处理，之后正常响应
+    """
+
+    def __init__(self):
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_socket.bind(('127.0.0.1', 0))
+        self.listen_socket.listen(16)
+        self.port = self.listen_socket.getsockname()[1]
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.dropped_tokens = set()
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.listen_socket.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections += 1
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn):
+        with conn:
+            while True:
+                header = recv_exactly(conn, 4)
+                if header is None:
+                    return
+                name = recv_exactly(conn, struct.unpack('!I', header)[0]).decode('utf-8')
+                body = recv_exactly(conn, struct.unpack('!I', recv_exactly(conn, 4))[0])
+                data = json.loads(body)
+                with self.lock:
+                    self.requests.append(data)
+                    action = data.get('action')
+                    if action == 'drop_once':
+                        action = 'ok' if data['token'] in self.dropped_tokens else 'drop'
+                        self.dropped_tokens.add(data['token'])
+                if action == 'drop':
+                    return
+
+                response = {"status": "success", "result": data.get('n')}
+                for param in name.split(';')[1:]:
+                    key, _, value = param.partition('=')
+                    if key == 'id':
+                        response['request_id'] = value
+                payload = json.dumps(response).encode('utf-8')
+                conn.sendall(struct.pack('!I', len(payload)) + payload)
+                if data.get('close_after'):
+                    return
+
+    def count(self, **match):
+        with self.lock:
+            return sum(1 for data in self.requests if all(data.get(k) == v for k, v in match.items()))
+
+    def close(self):
+        self.listen_socket.close()
+
+
+def test_reconnect_after_idle_close():
+    """服务器关闭空闲的持久连接后，下一个请求在新连接上发送，请求只发送一次"""
+    server = FrameServer()
+    try:
+        with JSONProtocolClient('127.0.0.1', server.port, keep_alive=True) as client:
+            assert client.send_json_data_keep_alive({"n": 1, "close_after": True})["result"] == 1
+            time.sleep(0.2)
+            assert client.send_json_data_keep_alive({"n": 2})["result"] == 2
+            assert client.send_json_data_keep_alive({"n": 3})["result"] == 3
+        assert server.count(n=2) == 1
+        assert server.connections == 2, server.connections
+    finally:
+        server.close()
+
+
+def test_no_resend_after_request_sent():
+    """请求发出之后连接中断时不重发（服务器可能已经执行），返回None"""
+    server = FrameServer()
+    try:
+        with JSONProtocolClient('127.0.0.1', server.port, keep_alive=True) as client:
+            assert client.send_json_data_keep_alive({"n": 1})["result"] == 1
+            assert client.send_json_data_keep_alive({"n": 2, "action": "drop"}) is None
+            time.sleep(0.2)
+            assert server.count(n=2) == 1, server.requests
+            # 之后的请求使用新连接
+            assert client.send_json_data_keep_alive({"n": 3})["result"] == 3
+        assert server.connections == 2, server.connections
+    finally:
+        server.close()
+
+
+def test_max_requests_per_connection():
+    """每个持久连接最多发送max_requests_per_connection个请求，之后换新连接"""
+    server = FrameServer()
+    try:
+        with JSONProtocolClient('127.0.0.1', server.port, keep_alive=True, max_requests_per_connection=2) as client:
+            for n in range(5):
+                assert client.send_json_data_keep_alive({"n": n})["result"] == n
+        assert server.connections == 3, server.connections
+        assert len(server.requests) == 5
+    finally:
+        server.close()
+
+
+def test_pooled_client_resend_rules():
+    """连接池客户端：发出后连接中断的写操作不重发，只读操作重试"""
+    server = FrameServer()
+    try:
+        with PooledJSONClient('127.0.0.1', server.port, pool_size=2, request_timeout=5, retries=2) as client:
+            assert client.request({"op": "server_stats", "n": 1})["result"] == 1
+            try:
+                client.request({"op": "insert_data", "n": 2, "action": "drop"})
+            except ConnectionLost:
+                pass
+            else:
+                raise AssertionError("写操作的连接中断后应该抛出ConnectionLost")
+            assert server.count(n=2) == 1, server.requests
+
+            response = client.request({"op": "query_doctor_info", "n": 3, "action": "drop_once", "token": "a"})
+            assert response["result"] == 3
+            assert server.count(n=3) == 2, server.requests
+    finally:
+        server.close()
+
+
+def main():
+    """主测试函数"""
+    print("🧪 持久连接重发规则测试")
+    print("=" * 50)
+    failed = 0
+    for test in (test_reconnect_after_idle_close, test_no_resend_after_request_sent,
+                 test_max_requests_per_connection, test_pooled_client_resend_rules):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e!r}")
+    print("=" * 50)
+    print("测试完成！" if not failed else f"{failed} 项测试失败")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试SQLite单写线程队列
+验证失败的写任务只回滚自己、停止后不再接受写任务、sql_query不能结束写线程的事务
+（使用临时数据库文件，不需要启动服务器）
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from models.write_queue import WriteQueue, WriteQueueStopped
+from models.database import DatabaseManager
+
+
+def make_queue(directory):
+    db_path = os.path.join(directory, 'queue.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE items (name TEXT UNIQUE)")
+    conn.commit()
+    conn.close()
+    return db_path, WriteQueue(db_path)
+
+
+def count_rows(db_path, table='items'):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_failing_job_is_isolated():
+    """同一批次中失败的写任务只回滚自己的修改，其他任务正常提交"""
+    with tempfile.TemporaryDirectory() as directory:
+        db_path, writer = make_queue(directory)
+        started = threading.Event()
+        release = threading.Event()
+        results = {}
+
+        def block(conn):
+            started.set()
+            release.wait(5)
+            return 'first'
+
+        def insert(name):
+            def job(conn):
+                conn.execute("INSERT INTO items VALUES (?)", (name,))
+                if name == 'bad':
+                    raise ValueError("写任务失败")
+                return name
+            return job
+
+        def submit(name, job):
+            try:
+                results[name] = writer.execute(job)
+            except Exception as e:
+                results[name] = e
+
+        # 第一个任务占住写线程，让后面的任务排队进入同一个组提交批次
+        threads = [threading.Thread(target=submit, args=('first', block))]
+        threads[0].start()
+        started.wait(5)
+        for name in ('a', 'bad', 'b'):
+            thread = threading.Thread(target=submit, args=(name, insert(name)))
+            thread.start()
+            threads.append(thread)
+        while writer.pending() < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        writer.stop()
+
+        assert results['a'] == 'a' and results['b'] == 'b' and results['first'] == 'first', results
+        assert isinstance(results['bad'], ValueError), results
+        assert count_rows(db_path) == 2
+        stats = writer.stats()
+        assert stats['failed_jobs'] == 1 and stats['committed_batches'] == 2, stats
+
+
+def test_execute_after_stop():
+    """stop之后提交的写任务直接抛出WriteQueueStopped，不会启动新的写线程"""
+    with tempfile.TemporaryDirectory() as directory:
+        db_path, writer = make_queue(directory)
+        assert writer.execute(lambda conn: conn.execute("INSERT INTO items VALUES ('x')").rowcount) == 1
+        writer.stop()
+        thread = writer._thread
+        try:
+            writer.execute(lambda conn: conn.execute("INSERT INTO items VALUES ('y')"), timeout=5)
+        except WriteQueueStopped:
+            pass
+        else:
+            raise AssertionError("stop之后的写任务应该失败")
+        assert writer._thread is thread and not thread.is_alive()
+        assert count_rows(db_path) == 1
+
+
+def test_pending_jobs_fail_when_writer_exits():
+    """写线程退出时仍在排队的任务以WriteQueueStopped结束，调用方不会无限等待"""
+    with tempfile.TemporaryDirectory() as directory:
+        _, writer = make_queue(directory)
+        writer.execute(lambda conn: None)
+        # 模拟写线程退出时队列中还有任务（停止标记之后的任务）
+        writer._queue.put(None)
+        future = Future()
+        writer._queue.put((lambda conn: None, future))
+        writer._thread.join(5)
+        try:
+            future.result(5)
+        except WriteQueueStopped:
+            pass
+        else:
+            raise AssertionError("排队中的任务应该失败")
+        writer.stop()
+
+
+def test_sql_query_cannot_end_transaction():
+    """sql_query中的事务控制语句（包括前面带注释的写法）被拒绝，不会提前提交写线程的事务"""
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'medical.db')
+        db = DatabaseManager(db_path, writer=WriteQueue(db_path))
+        try:
+            for sql in ("COMMIT", "/*x*/ COMMIT", "  -- c\nROLLBACK", "SAVEPOINT s", "RELEASE write_job_1", "BEGIN"):
+                try:
+                    db.execute_sql(sql)
+                except ValueError:
+                    continue
+                raise AssertionError(f"应该拒绝: {sql!r}")
+            assert db.execute_sql("CREATE TABLE notes (body TEXT)") == "执行成功"
+            assert db.execute_sql("INSERT INTO notes VALUES ('x')") == "执行成功"
+            assert db.execute_sql("SELECT COUNT(*) FROM notes")["data"][0][0] == 1
+        finally:
+            db.writer.stop()
+            db.pool.close()
+
+
+def main():
+    """主测试函数"""
+    print("🧪 SQLite单写线程队列测试")
+    print("=" * 50)
+    failed = 0
+    for test in (test_failing_job_is_isolated, test_execute_after_stop,
+                 test_pending_jobs_fail_when_writer_exits, test_sql_query_cannot_end_transaction):
+        try:
+            test()
+            print(f"✅ {test.__doc__}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {test.__doc__}: {e!r}")
+    print("=" * 50)
+    print("测试完成！" if not failed else f"{failed} 项测试失败")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
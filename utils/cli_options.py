@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行参数
+server.py 与 integrated_server.py 共用的网络层、数据库、插件和日志参数定义
+"""
+
+import os
+import argparse
+from typing import Dict, Any
+
+from models.connection_pool import DURABILITY_PROFILES, DEFAULT_PROFILE
+from network.communication import DEFAULT_MAX_BODY_SIZE, DEFAULT_MAX_FILENAME_SIZE, DEFAULT_REQUEST_TIMEOUT
+from network.compression import DEFAULT_COMPRESS_THRESHOLD
+from network.engines import DEFAULT_ENGINE, ENGINES, EXECUTOR_ENGINES
+from network.http_gateway import DEFAULT_HTTP_WORKERS
+from network.push_hub import DEFAULT_MAX_CONNECTIONS
+from utils.logging_config import DEFAULT_MAX_BYTES, DEFAULT_BACKUP_COUNT
+
+
+def add_network_arguments(parser: argparse.ArgumentParser):
+    """添加网络层相关的命令行参数"""
+    parser.add_argument('--engine', choices=list(ENGINES), default=DEFAULT_ENGINE,
+                        help=f'网络引擎: threaded(每连接一个线程), selectors(epoll事件循环 + 工作线程池), '
+                             f'asyncio(事件循环), uvloop(asyncio + uvloop事件循环，需要安装uvloop) '
+                             f'(默认: {DEFAULT_ENGINE})')
+    parser.add_argument('--executor-workers', type=int, default=16,
+                        help='asyncio/uvloop引擎中执行数据库操作的线程数 (默认: 16)')
+    parser.add_argument('--keep-alive', action='store_true',
+                        help='开启持久连接，一个连接可发送多个请求 (默认: 关闭)')
+    parser.add_argument('--idle-timeout', type=float, default=30.0,
+                        help='持久连接空闲超时秒数 (默认: 30)')
+    parser.add_argument('--max-requests-per-conn', type=int, default=100,
+                        help='持久连接上允许的最大请求数 (默认: 100)')
+    parser.add_argument('--worker-threads', type=int, default=64,
+                        help='threaded引擎处理连接、selectors引擎执行请求的工作线程数 (默认: 64)')
+    parser.add_argument('--request-queue-size', type=int, default=256,
+                        help='等待工作线程处理的最大连接/请求数，超出时回复服务器繁忙 (默认: 256)')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help='服务器繁忙时建议客户端等待的重试秒数 (默认: 1.0)')
+    parser.add_argument('--max-pipeline-depth', type=int, default=32,
+                        help='持久连接上同时处理的流水线请求（带请求ID）数上限 (默认: 32)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='工作进程数，大于1时启用多进程模式，由主进程监控工作进程 (默认: 1)')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='各工作进程用SO_REUSEPORT各自绑定端口，而不是共用主进程的监听套接字 (默认: 关闭)')
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help='停止或平滑重启时等待已接受的请求处理完毕的秒数，超时的请求被中断 (默认: 30)')
+    parser.add_argument('--unix-socket', metavar='PATH',
+                        help='同时监听Unix域套接字，供同机客户端使用 "unix://PATH" 连接 (默认: 不监听)')
+    parser.add_argument('--no-tcp', action='store_true',
+                        help='不监听TCP端口，只监听--unix-socket指定的Unix域套接字')
+    parser.add_argument('--compress-threshold', type=int, default=DEFAULT_COMPRESS_THRESHOLD, metavar='BYTES',
+                        help=f'客户端声明支持压缩时，不小于该字节数的响应用zlib/zstd压缩，0表示不压缩 '
+                             f'(默认: {DEFAULT_COMPRESS_THRESHOLD})')
+    parser.add_argument('--max-filename-size', type=int, default=DEFAULT_MAX_FILENAME_SIZE, metavar='BYTES',
+                        help=f'请求帧文件名字段的长度上限，超出时拒绝该请求并关闭连接 (默认: {DEFAULT_MAX_FILENAME_SIZE})')
+    parser.add_argument('--max-body-size', type=int, default=DEFAULT_MAX_BODY_SIZE, metavar='BYTES',
+                        help=f'请求帧内容的长度上限，超出时拒绝该请求并关闭连接 (默认: {DEFAULT_MAX_BODY_SIZE})')
+    parser.add_argument('--request-timeout', type=float, default=DEFAULT_REQUEST_TIMEOUT, metavar='SECONDS',
+                        help=f'读完一个请求帧的时间上限，防止慢速客户端长期占用工作线程 (默认: {DEFAULT_REQUEST_TIMEOUT:g})')
+    parser.add_argument('--http-port', type=int, metavar='PORT',
+                        help='在该端口上开启HTTP/JSON网关（POST /api/<操作名>，只读操作也可以GET） (默认: 不开启)')
+    parser.add_argument('--http-workers', type=int, default=DEFAULT_HTTP_WORKERS,
+                        help=f'HTTP网关处理连接的线程数 (默认: {DEFAULT_HTTP_WORKERS})')
+    parser.add_argument('--http-cors-origin', metavar='ORIGIN',
+                        help='HTTP网关允许跨域调用的来源，如 https://his.example.com 或 * (默认: 不允许跨域)')
+    parser.add_argument('--push-max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help=f'HTTP网关 /ws/queue 排队推送的WebSocket连接数上限 (默认: {DEFAULT_MAX_CONNECTIONS})')
+
+
+def network_options_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """把命令行参数转换为网络处理器的构造参数（engine、drain_timeout、http_*和push_*由MedicalServer取出）"""
+    options = {
+        'engine': args.engine,
+        'keep_alive': args.keep_alive,
+        'idle_timeout': args.idle_timeout,
+        'max_requests_per_connection': args.max_requests_per_conn,
+        'queue_size': args.request_queue_size,
+        'retry_after': args.retry_after,
+        'max_pipeline_depth': args.max_pipeline_depth,
+        'reuse_port': args.reuse_port,
+        'drain_timeout': args.drain_timeout,
+        # 守护进程会切换工作目录，相对路径先转换为绝对路径
+        'unix_socket': os.path.abspath(args.unix_socket) if args.unix_socket else None,
+        'listen_tcp': not args.no_tcp,
+        'compress_threshold': args.compress_threshold,
+        'max_filename_size': args.max_filename_size,
+        'max_body_size': args.max_body_size,
+        'request_timeout': args.request_timeout,
+        'http_port': args.http_port,
+        'http_workers': args.http_workers,
+        'http_cors_origin': args.http_cors_origin,
+        'push_max_connections': args.push_max_connections,
+    }
+    if args.engine in EXECUTOR_ENGINES:
+        options['executor_workers'] = args.executor_workers
+    else:
+        options['worker_threads'] = args.worker_threads
+    return options
+
+
+def add_database_arguments(parser: argparse.ArgumentParser):
+    """添加数据库相关的命令行参数"""
+    parser.add_argument('--db-pool-size', type=int, default=8,
+                        help='数据库连接池最大连接数 (默认: 8)')
+    parser.add_argument('--db-profile', choices=list(DURABILITY_PROFILES), default=DEFAULT_PROFILE,
+                        help=f'数据库持久性配置档 (默认: {DEFAULT_PROFILE})')
+    parser.add_argument('--db-pragma', action='append', default=[], metavar='NAME=VALUE',
+                        help='覆盖配置档中的PRAGMA，可重复，如 --db-pragma synchronous=FULL')
+    parser.add_argument('--db-write-batch', type=int, default=64,
+                        help='写线程单个事务最多合并的写操作数 (默认: 64)')
+    parser.add_argument('--profile-cache-size', type=int, default=1024,
+                        help='医生/患者资料查询缓存的最大条目数，0表示关闭缓存 (默认: 1024)')
+    parser.add_argument('--profile-cache-ttl', type=float, default=30.0,
+                        help='医生/患者资料缓存的过期秒数 (默认: 30)')
+
+
+def database_options_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """把命令行参数转换为MedicalServer的db_options"""
+    pragmas = {}
+    for item in args.db_pragma:
+        name, sep, value = item.partition('=')
+        name, value = name.strip(), value.strip()
+        if not sep or not name.isidentifier() or not value.replace('-', '').isalnum():
+            raise argparse.ArgumentTypeError(f"无效的PRAGMA设置: {item}")
+        pragmas[name] = value
+    
+    return {
+        'pool_size': args.db_pool_size,
+        'profile': args.db_profile,
+        'pragmas': pragmas,
+        'write_batch': args.db_write_batch,
+        'profile_cache_size': args.profile_cache_size,
+        'profile_cache_ttl': args.profile_cache_ttl,
+    }
+
+
+def add_plugin_arguments(parser: argparse.ArgumentParser):
+    """添加插件相关的命令行参数"""
+    parser.add_argument('--plugin', action='append', default=[], metavar='MODULE',
+                        help='加载插件模块（模块需提供register_operations(router, server)），可重复')
+
+
+def add_logging_arguments(parser: argparse.ArgumentParser):
+    """添加日志相关的命令行参数"""
+    parser.add_argument('--log-max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help=f'单个日志文件的最大字节数，超过后轮转 (默认: {DEFAULT_MAX_BYTES})')
+    parser.add_argument('--log-backups', type=int, default=DEFAULT_BACKUP_COUNT,
+                        help=f'保留的轮转日志文件数 (默认: {DEFAULT_BACKUP_COUNT})')
+    parser.add_argument('--log-payload-chars', type=int, default=200,
+                        help='日志中请求/响应内容最多保留的字符数，0表示不记录内容 (默认: 200)')
+    parser.add_argument('--log-payload-sample', type=float, default=1.0,
+                        help='记录请求/响应内容的抽样比例 (默认: 1.0，即全部记录)')
+    parser.add_argument('--log-payload', action='append', default=[], metavar='OP=CHARS[:SAMPLE]',
+                        help='按操作覆盖内容日志设置，可重复，如 --log-payload query_appointments=100:0.1')
+
+
+def logging_options_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    """把命令行参数转换为MedicalServer的log_options"""
+    payload_ops = {}
+    for item in args.log_payload:
+        op, sep, setting = item.partition('=')
+        chars, _, sample = setting.partition(':')
+        try:
+            if not sep or not op.strip():
+                raise ValueError(item)
+            payload_ops[op.strip()] = (int(chars), float(sample) if sample else args.log_payload_sample)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的内容日志设置: {item}")
+    
+    return {
+        'max_bytes': args.log_max_bytes,
+        'backup_count': args.log_backups,
+        'payload_chars': args.log_payload_chars,
+        'payload_sample': args.log_payload_sample,
+        'payload_ops': payload_ops,
+    }
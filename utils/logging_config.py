@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志配置
+- 异步日志：业务线程只把日志记录放入队列（QueueHandler），由后台线程（QueueListener）写文件
+- 日志文件按大小轮转（RotatingFileHandler）
+- 多进程模式下工作进程只把日志记录发送到主进程的队列，由主进程统一写文件和轮转
+- 请求/响应内容按操作截断或抽样记录，避免大结果集的格式化和写盘拖慢请求
+"""
+
+import os
+import queue
+import atexit
+import random
+import reprlib
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# 多进程模式下标明日志来自哪个进程（MainProcess为主进程，worker-N为工作进程）
+PREFORK_LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(processName)s] %(message)s'
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def setup_async_logging(log_file: str, level: int = logging.INFO,
+                        max_bytes: int = DEFAULT_MAX_BYTES,
+                        backup_count: int = DEFAULT_BACKUP_COUNT,
+                        log_queue: Optional[Any] = None, fmt: str = LOG_FORMAT) -> QueueListener:
+    """把根日志器配置为 QueueHandler -> QueueListener -> RotatingFileHandler
+
+    重复调用会先停止之前的后台线程再重新配置；fork之后（守护进程）需要重新调用，
+    因为后台写日志线程不会被复制到子进程中。
+    log_queue为多进程队列时，工作进程（setup_worker_logging）的日志也由这里的后台线程写入
+    """
+    global _listener
+
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                       encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(fmt))
+
+    with _listener_lock:
+        _reset_root_handlers()
+
+        if log_queue is None:
+            log_queue = queue.SimpleQueue()
+        logging.root.addHandler(QueueHandler(log_queue))
+        logging.root.setLevel(level)
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def setup_worker_logging(log_queue: Any, level: int = logging.INFO):
+    """工作进程的日志配置：只把日志记录放入主进程的队列，不打开日志文件"""
+    with _listener_lock:
+        _reset_root_handlers()
+        logging.root.addHandler(QueueHandler(log_queue))
+        logging.root.setLevel(level)
+
+
+def _reset_root_handlers():
+    """停止之前的后台写日志线程并清除根日志器现有的handlers（调用方持有_listener_lock）"""
+    global _listener
+    if _listener is not None:
+        _stop_listener(_listener)
+        _listener = None
+
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+        handler.close()
+
+
+def stop_async_logging():
+    """停止后台写日志线程，写完队列中剩余的日志"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _stop_listener(_listener)
+            _listener = None
+
+
+def _stop_listener(listener: QueueListener):
+    thread = listener._thread
+    if thread is not None and thread.is_alive():
+        listener.stop()
+    # fork后的子进程中后台线程已不存在，直接关闭文件即可
+    for handler in listener.handlers:
+        handler.close()
+
+
+def _lock_listener_handlers():
+    """fork之前等待后台写日志线程写完当前这条日志
+
+    fork时只有当前线程被复制到子进程；若后台线程正在写文件，子进程中日志文件缓冲区的锁处于持有状态，
+    子进程关闭或写入该文件（守护进程化、多进程模式的工作进程重新配置日志时）会永远阻塞
+    """
+    global _fork_locked
+    listener = _listener
+    _fork_locked = list(listener.handlers) if listener is not None else []
+    for handler in _fork_locked:
+        handler.acquire()
+
+
+def _unlock_listener_handlers(release: bool = True):
+    """fork之后在父进程中释放；子进程中的handler锁已由logging模块重新初始化，不再释放"""
+    global _fork_locked
+    if release:
+        for handler in _fork_locked:
+            handler.release()
+    _fork_locked = []
+
+
+_fork_locked = []
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_lock_listener_handlers, after_in_parent=_unlock_listener_handlers,
+                        after_in_child=lambda: _unlock_listener_handlers(release=False))
+
+atexit.register(stop_async_logging)
+
+
+class PayloadLogPolicy:
+    """请求/响应内容的日志策略
+
+    - max_chars: 记录的内容最多保留的字符数，0表示只记录操作名不记录内容
+    - sample_rate: 抽样比例，1.0表示每个请求都记录，0.1表示约十分之一
+    - per_op: 按操作覆盖以上两项，{op: (max_chars, sample_rate)}
+    - op_resolver: 从请求数据中取出操作名（默认读取op字段）
+    """
+
+    def __init__(self, max_chars: int = 200, sample_rate: float = 1.0,
+                 per_op: Optional[Dict[str, Tuple[int, float]]] = None,
+                 op_resolver: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None):
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+        self.per_op = dict(per_op or {})
+        self.op_resolver = op_resolver
+
+        # reprlib只展开有限数量的元素，大结果集的格式化开销与结果大小无关
+        self._repr = reprlib.Repr()
+        self._repr.maxlevel = 4
+        self._repr.maxlist = self._repr.maxtuple = self._repr.maxdict = 10
+        longest = max([max_chars] + [chars for chars, _ in self.per_op.values()])
+        self._repr.maxstring = self._repr.maxother = max(longest, 40)
+
+    def operation(self, data: Any) -> str:
+        """请求对应的操作名"""
+        op = None
+        if isinstance(data, dict):
+            try:
+                op = self.op_resolver(data) if self.op_resolver else data.get('op')
+            except Exception:
+                op = None
+        return op if isinstance(op, str) else 'unknown'
+
+    def settings(self, op: str) -> Tuple[int, float]:
+        return self.per_op.get(op, (self.max_chars, self.sample_rate))
+
+    def should_log(self, op: str) -> bool:
+        """按抽样比例决定本次请求是否记录内容（同一请求的请求和响应使用同一次决定）"""
+        sample_rate = self.settings(op)[1]
+        return sample_rate >= 1.0 or (sample_rate > 0 and random.random() < sample_rate)
+
+    def format(self, payload: Any, op: str) -> str:
+        """截断后的内容摘要"""
+        max_chars = self.settings(op)[0]
+        if max_chars <= 0:
+            return '<省略>'
+        text = self._repr.repr(payload)
+        if len(text) > max_chars:
+            text = f"{text[:max_chars]}...(已截断)"
+        return text
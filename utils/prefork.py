@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程（prefork）主控
+受GIL限制，单个服务器进程只能用满一个CPU核心；--workers N 时由主进程启动N个工作进程，
+每个工作进程都是一个完整的服务器（网络线程、连接池、写线程），主进程只负责：
+- 创建监听套接字（TCP、Unix域），工作进程fork后继承；或者由各工作进程用SO_REUSEPORT各自绑定同一TCP端口
+- 工作进程退出时重新启动（启动后很快退出的进程按指数退避延迟重启）
+- 把SIGTERM/SIGINT转发给所有工作进程并等待其退出（工作进程处理完已接受的请求后退出）；
+  SIGHUP时逐个重启工作进程（滚动重载）：把SIGHUP转发给一个工作进程，它平滑退出后重新启动，
+  新进程正常运行后再重启下一个，其余工作进程始终在提供服务；主进程同时重新打开日志文件
+- SIGUSR2平滑重启：启动新一代主进程并把监听套接字交给它，新主进程就绪后
+  通知工作进程停止接受新连接、处理完已接受的请求后退出，本进程随后退出
+- 所有工作进程的日志经由队列发送到主进程，由主进程统一写文件和轮转
+- 为每个工作进程编号创建一对数据报套接字，工作进程之间经由它们互相转发推送消息（见network/push_hub.py）
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Optional
+
+from network.listener import create_listen_socket, create_unix_listen_socket, inherited_listen_socket
+from utils.logging_config import (setup_async_logging, stop_async_logging, PREFORK_LOG_FORMAT,
+                                  DEFAULT_MAX_BYTES, DEFAULT_BACKUP_COUNT)
+from utils.server_manager import ServerManager, daemonize, is_handover, spawn_successor
+
+
+# 工作进程存活时间短于该秒数就退出时视为启动失败，重启前等待的时间逐次翻倍
+MIN_WORKER_LIFETIME = 1.0
+INITIAL_RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+# 工作进程优雅退出（等待已接受的请求，最多drain_timeout秒）之后再等待的秒数，超时后强制结束
+SHUTDOWN_GRACE = 10.0
+
+# worker_main(listen_socket, unix_listen_socket, log_queue, shared_state) 在工作进程中运行服务器，返回是否正常结束
+WorkerMain = Callable[[Any, Any, Any, Dict[str, Any]], bool]
+
+
+class PreforkSupervisor:
+    """多进程主控：启动、监控和停止工作进程"""
+
+    def __init__(self, workers: int, worker_main: WorkerMain, host: str = '0.0.0.0', port: int = 55000,
+                 backlog: int = 128, reuse_port: bool = False, pid_file: str = '/medical/server.pid',
+                 log_file: str = '/medical/server.log', log_max_bytes: int = DEFAULT_MAX_BYTES,
+                 log_backup_count: int = DEFAULT_BACKUP_COUNT,
+                 prepare: Optional[Callable[[], None]] = None, drain_timeout: float = 30.0,
+                 unix_socket: Optional[str] = None, listen_tcp: bool = True):
+        self.workers = workers
+        self.worker_main = worker_main
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+        # Unix域套接字路径（None表示不监听），listen_tcp为False时只监听Unix域套接字
+        self.unix_socket = unix_socket
+        self.listen_tcp = listen_tcp
+        self.pid_file = pid_file
+        self.log_file = log_file
+        self.log_max_bytes = log_max_bytes
+        self.log_backup_count = log_backup_count
+        # fork之前在主进程中执行一次的准备工作（如初始化数据库）
+        self.prepare = prepare
+        # 停止时等待工作进程退出的秒数
+        self.shutdown_timeout = drain_timeout + SHUTDOWN_GRACE
+
+        self.context = multiprocessing.get_context('fork')
+        self.log_queue = None
+        self.shared_state = {}
+        self.listen_socket = None
+        self.unix_listen_socket = None
+        # Unix域套接字已交给新一代主进程，退出时不删除套接字文件
+        self.handed_over = False
+        self.server_manager = None
+        self.logger = logging.getLogger(__name__)
+
+        self.processes = {}  # 编号 -> Process
+        self.started_at = {}  # 编号 -> 启动时间
+        self.restart_delay = {}  # 编号 -> 下次快速失败时的重启延迟
+        self.restart_at = {}  # 编号 -> 计划重启的时间
+        self.restarts = 0
+        # 滚动重载：等待重启的工作进程编号，以及正在重启的(编号, 旧进程PID)
+        self.reload_queue = []
+        self.reloading = None
+
+        self.stop_requested = False
+        self.reload_requested = False
+        self.handover_requested = False
+        self.stopping = False
+        self.stop_deadline = None
+
+    def run(self, daemon: bool = False) -> bool:
+        """启动主进程循环（阻塞直到收到停止信号且所有工作进程退出）
+
+        平滑重启启动的新主进程不再守护进程化，开始监听后才把PID文件切换为自己
+        """
+        handover = is_handover()
+        if daemon and not handover:
+            daemonize()
+
+        self.log_queue = self.context.Queue()
+        self.server_manager = ServerManager(self.pid_file if daemon else None, self.log_file,
+                                            self.log_max_bytes, self.log_backup_count)
+        self.setup_logging()
+        self.setup_signal_handlers()
+
+        if daemon and not handover and not self.server_manager.create_pid_file():
+            return False
+
+        try:
+            if self.prepare:
+                self.prepare()
+            # 工作进程之间共享的状态（fork时继承）：资料缓存的失效计数器，以及按编号的推送转发通道
+            # （编号重启后的工作进程继续使用同一对套接字）
+            self.shared_state = {'profile_cache_generation': self.context.Value('Q', 0),
+                                 'push_channels': [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+                                                   for _ in range(self.workers)]}
+
+            if self.listen_tcp and not self.reuse_port:
+                self.listen_socket = inherited_listen_socket() or create_listen_socket(self.host, self.port,
+                                                                                       self.backlog)
+            if self.unix_socket:
+                self.unix_listen_socket = (inherited_listen_socket(socket.AF_UNIX) or
+                                           create_unix_listen_socket(self.unix_socket, self.backlog))
+            mode = 'SO_REUSEPORT' if self.reuse_port else '共享监听套接字'
+            addresses = [f"{self.host}:{self.port}"] if self.listen_tcp else []
+            if self.unix_socket:
+                addresses.append(f"unix://{self.unix_socket}")
+            self.logger.info(f"多进程模式启动（工作进程 {self.workers}，{mode}），主进程PID: {os.getpid()}，"
+                             f"监听地址: {', '.join(addresses)}")
+            # 在fork工作进程之前通知上一代进程，工作进程不会继承通知管道
+            self.server_manager.handover_ready()
+
+            for index in range(1, self.workers + 1):
+                self.spawn(index)
+            self.supervise()
+            return True
+
+        except Exception as e:
+            self.logger.error(f"多进程主控运行时出错: {e}")
+            self.stop_requested = True
+            self.stop_workers()
+            return False
+        finally:
+            if self.listen_socket:
+                self.listen_socket.close()
+            if self.unix_listen_socket:
+                self.unix_listen_socket.close()
+                if not self.handed_over:
+                    try:
+                        os.unlink(self.unix_socket)
+                    except OSError:
+                        pass
+            self.server_manager.remove_pid_file()
+            self.logger.info(f"多进程主控已退出（共重启工作进程 {self.restarts} 次）")
+            # 在multiprocessing的退出处理关闭日志队列之前写完剩余日志
+            stop_async_logging()
+
+    def setup_logging(self):
+        """主进程日志：本进程和所有工作进程的日志由同一个后台线程写文件"""
+        setup_async_logging(self.log_file, logging.INFO, self.log_max_bytes, self.log_backup_count,
+                            log_queue=self.log_queue, fmt=PREFORK_LOG_FORMAT)
+
+    def setup_signal_handlers(self):
+        """信号处理函数只设置标志，实际操作在主循环中完成"""
+        signal.signal(signal.SIGTERM, self._stop_signal)
+        signal.signal(signal.SIGINT, self._stop_signal)
+        if hasattr(signal, 'SIGQUIT'):
+            signal.signal(signal.SIGQUIT, self._stop_signal)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._reload_signal)
+        if hasattr(signal, 'SIGUSR2'):
+            signal.signal(signal.SIGUSR2, self._handover_signal)
+
+    def _stop_signal(self, signum, frame):
+        self.stop_requested = True
+
+    def _reload_signal(self, signum, frame):
+        self.reload_requested = True
+
+    def _handover_signal(self, signum, frame):
+        self.handover_requested = True
+
+    def spawn(self, index: int):
+        """启动编号为index的工作进程"""
+        process = self.context.Process(target=self.worker_entry, args=(index,),
+                                       name=f'worker-{index}')
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        self.restart_at.pop(index, None)
+        self.logger.info(f"工作进程 worker-{index} 已启动 (PID: {process.pid})")
+
+    def worker_entry(self, index: int):
+        """工作进程入口（fork之后在子进程中执行）"""
+        # 主进程的信号处理函数只设置主进程的标志，工作进程中改为直接退出，
+        # 服务器启动后由其自身的ServerManager重新设置SIGTERM/SIGINT
+        for name in ('SIGTERM', 'SIGINT', 'SIGQUIT', 'SIGHUP', 'SIGUSR2'):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), _worker_exit)
+        success = self.worker_main(self.listen_socket, self.unix_listen_socket, self.log_queue,
+                                   dict(self.shared_state, worker_index=index))
+        sys.exit(0 if success else 1)
+
+    def supervise(self):
+        """主循环：回收退出的工作进程、按计划重启、处理信号"""
+        while True:
+            if self.stop_requested and not self.stopping:
+                self.stop_workers()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            if self.handover_requested:
+                self.handover_requested = False
+                if not self.stopping:
+                    self.handover()
+
+            if self.stopping and not self.processes:
+                break
+
+            sentinels = [process.sentinel for process in self.processes.values()]
+            if sentinels:
+                wait(sentinels, timeout=1.0)
+            else:
+                time.sleep(0.2)
+
+            self.reap()
+            now = time.monotonic()
+            if not self.stopping:
+                for index, restart_at in list(self.restart_at.items()):
+                    if now >= restart_at:
+                        self.restarts += 1
+                        self.spawn(index)
+                self.advance_reload(now)
+            elif self.stop_deadline and now >= self.stop_deadline:
+                for index, process in self.processes.items():
+                    self.logger.warning(f"工作进程 worker-{index} (PID: {process.pid}) 未在 "
+                                        f"{self.shutdown_timeout:.0f} 秒内退出，强制结束")
+                    process.kill()
+                self.stop_deadline = None
+
+    def reap(self):
+        """回收已退出的工作进程，未在停止过程中时安排重启"""
+        now = time.monotonic()
+        for index, process in list(self.processes.items()):
+            if process.exitcode is None:
+                continue
+            process.join()
+            del self.processes[index]
+            if self.stopping:
+                self.logger.info(f"工作进程 worker-{index} (PID: {process.pid}) 已退出")
+                continue
+
+            lifetime = now - self.started_at[index]
+            if lifetime < MIN_WORKER_LIFETIME:
+                # 启动后立即退出（如端口绑定失败、插件导入失败），延迟重启避免频繁fork
+                delay = self.restart_delay.get(index, INITIAL_RESTART_DELAY)
+                self.restart_delay[index] = min(delay * 2, MAX_RESTART_DELAY)
+            else:
+                delay = 0.0
+                self.restart_delay.pop(index, None)
+
+            if process.exitcode == 0:
+                self.logger.info(f"工作进程 worker-{index} (PID: {process.pid}) 已退出，重新启动")
+            else:
+                self.logger.warning(f"工作进程 worker-{index} (PID: {process.pid}) 异常退出 "
+                                    f"(退出码: {process.exitcode})，{delay:.0f} 秒后重新启动")
+            self.restart_at[index] = now + delay
+
+    def signal_workers(self, signum: int):
+        """向所有工作进程发送信号"""
+        for process in self.processes.values():
+            try:
+                os.kill(process.pid, signum)
+            except OSError:
+                pass
+
+    def stop_workers(self):
+        """停止所有工作进程（不再重启）"""
+        self.stopping = True
+        self.restart_at.clear()
+        self.reload_queue = []
+        self.reloading = None
+        self.stop_deadline = time.monotonic() + self.shutdown_timeout
+        self.logger.info(f"收到停止信号，正在停止 {len(self.processes)} 个工作进程...")
+        self.signal_workers(signal.SIGTERM)
+
+    def reload(self):
+        """SIGHUP：重新打开日志文件，逐个重启工作进程（滚动重载）"""
+        self.setup_logging()
+        if self.stopping:
+            return
+        self.reload_queue = sorted(index for index in self.processes
+                                   if self.reloading is None or index != self.reloading[0])
+        self.logger.info(f"收到SIGHUP，逐个重启 {len(self.processes)} 个工作进程")
+        if self.reloading is None:
+            self.reload_next()
+
+    def reload_next(self):
+        """把SIGHUP转发给下一个等待重启的工作进程，它平滑退出后由reap重新启动"""
+        while self.reload_queue:
+            index = self.reload_queue.pop(0)
+            process = self.processes.get(index)
+            if process is None:
+                # 已经退出，正在等待重启
+                continue
+            try:
+                os.kill(process.pid, signal.SIGHUP)
+            except OSError:
+                continue
+            self.reloading = (index, process.pid)
+            self.logger.info(f"滚动重载：重启工作进程 worker-{index} (PID: {process.pid})")
+            return
+        self.reloading = None
+        self.logger.info("滚动重载完成")
+
+    def advance_reload(self, now: float):
+        """正在重启的工作进程的新进程运行超过MIN_WORKER_LIFETIME秒后重启下一个；
+        新进程启动即失败时停止滚动重载，其余工作进程继续运行旧版本"""
+        if self.reloading is None:
+            return
+        index, old_pid = self.reloading
+        process = self.processes.get(index)
+        if process is None and index in self.restart_delay:
+            self.logger.error(f"工作进程 worker-{index} 重启后未能正常运行，停止滚动重载"
+                              f"（剩余 {len(self.reload_queue)} 个工作进程未重启）")
+            self.reload_queue = []
+            self.reloading = None
+            return
+        if process is None or process.pid == old_pid or now - self.started_at[index] < MIN_WORKER_LIFETIME:
+            # 旧进程还在处理已接受的请求，或新进程刚启动
+            return
+        self.reload_next()
+
+    def handover(self):
+        """SIGUSR2：启动新一代主进程并把监听套接字交给它，新主进程就绪后让工作进程平滑退出
+
+        SO_REUSEPORT模式下新一代工作进程各自绑定端口，旧工作进程关闭监听套接字时
+        其中还未accept的连接会被内核重置，需要零中断重启时应使用共享监听套接字模式
+        """
+        self.logger.info("收到平滑重启信号，正在启动新主进程")
+        new_pid = spawn_successor([sock for sock in (self.listen_socket, self.unix_listen_socket) if sock])
+        if new_pid is None:
+            self.logger.error("平滑重启失败，继续运行当前的工作进程")
+            return
+        self.handed_over = True
+        self.logger.info(f"新主进程 (PID: {new_pid}) 已接管监听套接字，"
+                         f"等待 {len(self.processes)} 个工作进程处理完已接受的请求后退出")
+        self.stopping = True
+        self.restart_at.clear()
+        self.reload_queue = []
+        self.reloading = None
+        self.stop_deadline = time.monotonic() + self.shutdown_timeout
+        self.signal_workers(signal.SIGUSR2)
+
+
+def _worker_exit(signum, frame):
+    """工作进程在服务器启动前收到信号时直接退出"""
+    sys.exit(0)
@@ -3,80 +3,134 @@
 """
 服务器管理器
 处理守护进程、PID文件、信号处理、日志配置等
+
+平滑重启（SIGUSR2）：正在运行的服务器用相同的命令行启动新一代进程，把监听套接字交给它，
+新进程开始监听后通过管道通知旧进程、原子地把PID文件切换为自己的PID，
+旧进程随后停止接受新连接，处理完已接受的请求后退出
+
+优雅关闭（SIGTERM/SIGINT）：设置了关闭处理函数时不再直接退出，由服务器停止接受新连接、
+处理完已接受的请求、检查点WAL后再退出；关闭过程中再次收到信号时立即退出
 """
 
 import os
 import sys
+import time
+import select
 import signal
 import atexit
+import socket
 import logging
-from typing import Optional
+import subprocess
+import threading
+from typing import Any, Callable, List, Optional, Sequence
+
+from network.listener import LISTEN_FD_ENV
+from utils.logging_config import (setup_async_logging, setup_worker_logging,
+                                  DEFAULT_MAX_BYTES, DEFAULT_BACKUP_COUNT)
+
+
+# 新一代进程就绪时写入的管道描述符（存在该环境变量说明本进程是平滑重启启动的）
+READY_FD_ENV = 'MEDICAL_SERVER_READY_FD'
+# 等待新一代进程就绪的秒数，超时后结束新进程，旧进程继续提供服务
+HANDOVER_TIMEOUT = 30.0
+# stop命令等待服务器退出的默认秒数，超时后强制结束
+STOP_TIMEOUT = 30
+# 服务器处理完已接受的请求（--drain-timeout）之后stop命令再等待的秒数（关闭数据库、多进程模式下主进程回收工作进程）
+STOP_GRACE = 15
+# 触发关闭的信号
+SHUTDOWN_SIGNALS = ('SIGTERM', 'SIGINT', 'SIGQUIT')
+
+# 进程启动时的命令行和工作目录（守护进程化后工作目录会切换到/），平滑重启时用来启动新进程
+_LAUNCH_ARGV = [sys.executable] + sys.argv
+_LAUNCH_CWD = os.getcwd()
 
 
 class ServerManager:
-    def __init__(self, pid_file: str = '/medical/server.pid', log_file: str = '/medical/server.log'):
+    """pid_file为None时不管理PID文件（多进程模式的工作进程，PID文件由主进程管理）；
+    log_queue不为None时日志发送到主进程的队列，不直接写日志文件
+    """
+    
+    def __init__(self, pid_file: Optional[str] = '/medical/server.pid', log_file: str = '/medical/server.log',
+                 log_max_bytes: int = DEFAULT_MAX_BYTES, log_backup_count: int = DEFAULT_BACKUP_COUNT,
+                 log_queue: Optional[Any] = None):
         self.pid_file = pid_file
         self.log_file = log_file
+        self.log_max_bytes = log_max_bytes
+        self.log_backup_count = log_backup_count
+        self.log_queue = log_queue
         self.logger = None
+        self.shutdown_handler = None
+        self.shutting_down = False
         self.setup_logging()
         self.setup_signal_handlers()
     
     def setup_logging(self):
-        """设置日志记录"""
-        # 确保日志目录存在
-        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-        
-        # 清除现有的handlers
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(self.log_file, encoding='utf-8'),
-                # 守护进程模式下不使用控制台输出
-                # logging.StreamHandler()
-            ]
-        )
+        """设置日志记录（异步写入、按大小轮转）"""
+        # 守护进程模式下不使用控制台输出
+        if self.log_queue is not None:
+            setup_worker_logging(self.log_queue, logging.INFO)
+        else:
+            setup_async_logging(self.log_file, logging.INFO, self.log_max_bytes, self.log_backup_count)
         self.logger = logging.getLogger(__name__)
     
+    def restart_logging(self):
+        """fork之后重新启动后台写日志线程（守护进程化之后调用）"""
+        self.setup_logging()
+    
     def setup_signal_handlers(self):
         """设置信号处理器"""
-        signal.signal(signal.SIGTERM, self._signal_handler)
-        signal.signal(signal.SIGINT, self._signal_handler)
-        if hasattr(signal, 'SIGQUIT'):
-            signal.signal(signal.SIGQUIT, self._signal_handler)
+        for name in SHUTDOWN_SIGNALS:
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), self._signal_handler)
         atexit.register(self.cleanup)
     
+    def set_shutdown_handler(self, handler: Callable[[int], None], signals=SHUTDOWN_SIGNALS):
+        """收到signals中的信号时调用handler(signum)开始优雅关闭，而不是直接退出
+
+        handler在主线程的信号处理上下文中执行，只能做不阻塞的操作（如通知网络主循环停止）
+        """
+        self.shutdown_handler = handler
+        for name in signals:
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), self._signal_handler)
+    
+    def set_reload_handler(self, handler: Callable[[], None]):
+        """SIGUSR2触发平滑重启；handler在单独的线程中执行（需要等待新进程就绪，不能阻塞主线程）"""
+        if not hasattr(signal, 'SIGUSR2'):
+            return
+        
+        def on_signal(signum, frame):
+            threading.Thread(target=handler, name='server-handover', daemon=True).start()
+        
+        signal.signal(signal.SIGUSR2, on_signal)
+    
     def _signal_handler(self, signum, frame):
         """信号处理函数"""
+        if self.shutdown_handler is not None and not self.shutting_down:
+            self.shutting_down = True
+            self.logger.info(f"收到信号 {signum}，开始优雅关闭（再次发送信号立即退出）")
+            self.shutdown_handler(signum)
+            return
         self.logger.info(f"收到信号 {signum}，准备关闭服务器...")
-        # 这里可以添加优雅关闭的逻辑
         self.cleanup()
         sys.exit(0)
     
     def create_pid_file(self) -> bool:
         """创建PID文件"""
+        if not self.pid_file:
+            return True
         try:
             # 确保PID文件目录存在
             os.makedirs(os.path.dirname(self.pid_file), exist_ok=True)
             
-            # 检查是否已经有服务器在运行
-            if os.path.exists(self.pid_file):
-                with open(self.pid_file, 'r') as f:
-                    old_pid = f.read().strip()
-                try:
-                    os.kill(int(old_pid), 0)  # 检查进程是否存在
-                    self.logger.error(f"服务器已在运行 (PID: {old_pid})")
-                    return False
-                except (OSError, ValueError):
-                    # 进程不存在，删除旧的PID文件
-                    os.remove(self.pid_file)
+            # 检查是否已经有服务器在运行（进程不存在的旧PID文件直接覆盖）
+            old_pid = self.get_server_pid()
+            if old_pid is not None and old_pid != os.getpid():
+                self.logger.error(f"服务器已在运行 (PID: {old_pid})")
+                return False
             
             # 写入当前进程PID
-            with open(self.pid_file, 'w') as f:
-                f.write(str(os.getpid()))
+            self.write_pid_file()
             self.logger.info(f"PID文件已创建: {self.pid_file}")
             return True
             
@@ -84,15 +138,44 @@ class ServerManager:
             self.logger.error(f"创建PID文件失败: {e}")
             return False
     
+    def write_pid_file(self):
+        """原子地写入当前进程PID：先写临时文件再rename，读取方不会读到空文件或不完整的PID"""
+        temp_file = f"{self.pid_file}.{os.getpid()}.tmp"
+        with open(temp_file, 'w') as f:
+            f.write(str(os.getpid()))
+        os.replace(temp_file, self.pid_file)
+    
+    def read_pid_file(self) -> Optional[int]:
+        """读取PID文件中记录的PID（不检查进程是否存在）"""
+        try:
+            with open(self.pid_file, 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError, TypeError):
+            return None
+    
     def remove_pid_file(self):
-        """删除PID文件"""
+        """删除PID文件
+
+        只删除记录本进程PID的文件：平滑重启后PID文件已属于新进程，
+        stop/status等命令创建的ServerManager退出时也不能删除正在运行的服务器的PID文件
+        """
         try:
-            if os.path.exists(self.pid_file):
+            if self.pid_file and self.read_pid_file() == os.getpid():
                 os.remove(self.pid_file)
                 self.logger.info(f"PID文件已删除: {self.pid_file}")
         except Exception as e:
             self.logger.error(f"删除PID文件失败: {e}")
     
+    def handover_ready(self):
+        """平滑重启启动的新进程开始监听后调用：PID文件记录的是上一代进程时原子地切换为本进程，
+        然后通知上一代进程退出（不是平滑重启启动的进程什么也不做）"""
+        if not is_handover():
+            return
+        if self.pid_file and self.read_pid_file() == os.getppid():
+            self.write_pid_file()
+            self.logger.info(f"PID文件已切换为本进程: {self.pid_file} (PID: {os.getpid()})")
+        notify_ready()
+    
     def cleanup(self):
         """清理资源"""
         self.remove_pid_file()
@@ -100,7 +183,7 @@ class ServerManager:
     def get_server_pid(self) -> Optional[int]:
         """获取服务器PID"""
         try:
-            if os.path.exists(self.pid_file):
+            if self.pid_file and os.path.exists(self.pid_file):
                 with open(self.pid_file, 'r') as f:
                     pid = int(f.read().strip())
                 # 检查进程是否存在
@@ -114,8 +197,32 @@ class ServerManager:
         """检查服务器是否在运行"""
         return self.get_server_pid() is not None
     
-    def stop_server(self) -> bool:
-        """停止服务器"""
+    def reload_server(self, timeout: float = HANDOVER_TIMEOUT) -> Optional[int]:
+        """平滑重启：向服务器发送SIGUSR2，等待PID文件切换为新进程，返回新进程PID；失败返回None"""
+        pid = self.get_server_pid()
+        if not pid or not hasattr(signal, 'SIGUSR2'):
+            return None
+        
+        try:
+            self.logger.info(f"正在平滑重启服务器 (PID: {pid})...")
+            os.kill(pid, signal.SIGUSR2)
+        except OSError as e:
+            self.logger.error(f"平滑重启服务器失败: {e}")
+            return None
+        
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            new_pid = self.get_server_pid()
+            if new_pid is not None and new_pid != pid:
+                self.logger.info(f"新服务器进程已接管 (PID: {new_pid})")
+                return new_pid
+            time.sleep(0.2)
+        
+        self.logger.error("等待新服务器进程就绪超时")
+        return None
+    
+    def stop_server(self, timeout: float = STOP_TIMEOUT) -> bool:
+        """停止服务器（发送SIGTERM，等待最多timeout秒后强制结束）"""
         pid = self.get_server_pid()
         
         if not pid:
@@ -126,19 +233,20 @@ class ServerManager:
             self.logger.info(f"正在停止服务器 (PID: {pid})...")
             os.kill(pid, signal.SIGTERM)
             
-            # 等待进程结束
-            import time
-            for _ in range(30):  # 等待最多30秒
+            # 等待进程结束（服务器先处理完已接受的请求再退出）
+            deadline = time.monotonic() + timeout
+            while True:
                 try:
                     os.kill(pid, 0)
-                    time.sleep(1)
                 except OSError:
                     break
-            else:
-                # 如果30秒后仍未结束，使用SIGKILL强制终止
-                self.logger.warning("正常关闭超时，强制终止...")
-                os.kill(pid, signal.SIGKILL)
-            
+                if time.monotonic() >= deadline:
+                    # 超时后仍未结束，使用SIGKILL强制终止
+                    self.logger.warning("正常关闭超时，强制终止...")
+                    os.kill(pid, signal.SIGKILL)
+                    break
+                time.sleep(0.2)
+
             self.logger.info("服务器已停止")
             return True
             
@@ -184,3 +292,73 @@ def daemonize():
     with open(os.devnull, 'w') as null_out:
         os.dup2(null_out.fileno(), sys.stdout.fileno())
         os.dup2(null_out.fileno(), sys.stderr.fileno())
+
+
+def is_handover() -> bool:
+    """本进程是否由平滑重启启动（尚未通知上一代进程就绪）"""
+    return READY_FD_ENV in os.environ
+
+
+def notify_ready():
+    """通知上一代进程本进程已开始监听，上一代进程收到后停止接受新连接并退出"""
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is None:
+        return
+    try:
+        os.write(int(fd), b'1')
+    except OSError:
+        pass
+    finally:
+        os.close(int(fd))
+
+
+def successor_command() -> List[str]:
+    """新一代进程的命令行：与当前进程相同，restart动作替换为start"""
+    argv = list(_LAUNCH_ARGV)
+    for index, arg in enumerate(argv[2:], 2):
+        if arg == 'restart':
+            argv[index] = 'start'
+            break
+    return argv
+
+
+def spawn_successor(listen_sockets: Sequence[socket.socket] = (),
+                    timeout: float = HANDOVER_TIMEOUT) -> Optional[int]:
+    """启动新一代服务器进程并把监听套接字（TCP、Unix域）交给它，等待它开始监听
+
+    新进程不再守护进程化（已经脱离终端的旧进程启动的子进程同样没有控制终端），
+    成功时返回新进程PID；新进程启动失败、提前退出或超时返回None，当前进程继续提供服务
+    """
+    logger = logging.getLogger(__name__)
+    read_fd, write_fd = os.pipe()
+    env = dict(os.environ)
+    env[READY_FD_ENV] = str(write_fd)
+    pass_fds = [write_fd]
+    if listen_sockets:
+        env[LISTEN_FD_ENV] = ','.join(str(sock.fileno()) for sock in listen_sockets)
+        pass_fds.extend(sock.fileno() for sock in listen_sockets)
+    
+    try:
+        try:
+            process = subprocess.Popen(successor_command(), cwd=_LAUNCH_CWD, env=env, pass_fds=pass_fds)
+        except OSError as e:
+            logger.error(f"启动新服务器进程失败: {e}")
+            return None
+        finally:
+            # 只有新进程持有写端，新进程退出时读端会读到EOF
+            os.close(write_fd)
+        logger.info(f"已启动新服务器进程 (PID: {process.pid})，等待其开始监听")
+        
+        ready, _, _ = select.select([read_fd], [], [], timeout)
+        if ready and os.read(read_fd, 1):
+            return process.pid
+        
+        if ready:
+            logger.error(f"新服务器进程 (PID: {process.pid}) 启动失败，退出码: {process.wait()}")
+        else:
+            logger.error(f"新服务器进程 (PID: {process.pid}) 未在 {timeout} 秒内开始监听，强制结束")
+            process.kill()
+            process.wait()
+        return None
+    finally:
+        os.close(read_fd)
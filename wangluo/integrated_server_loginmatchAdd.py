@@ -655,54 +655,43 @@ class JSONDatabaseServer:
     
     def process_json_data(self, data):
         """处理JSON数据并执行数据库操作"""
+        # 操作表：按顺序检查JSON中的识别键，第一个匹配的操作生效
+        operations = (
+            ('reset_password', self.update_user_password),  # 重置密码
+            ('register_patient', self.register_patient),
+            ('regiter_doctor', self.register_doctor),
+            ('login', self.login_match),  # 登录检查
+            ('reset_patient_information', self.update_patient_info),  # 重置病人信息
+            ('reset_doctor_information', self.update_doctor_info),  # 重置医生信息
+            ('query_doctor_info', self.query_doctor_info),  # 查询医生信息
+            ('query_patient_info', self.query_patient_info),  # 查询患者信息
+            ('sql_query', self.execute_sql),  # 查询操作
+            ('create_appointment', self.create_appointment),  # 创建预约/挂号
+            ('query_appointments', self.query_appointments),  # 查询预约
+            ('cancel_appointment', self.cancel_appointment),  # 取消预约
+            ('update_appointment_status', self.update_appointment_status),  # 更新预约状态
+        )
         try:
-            # 检查JSON中的操作类型并执行相应操作
-            if 'reset_password' in data:
-                return self.update_user_password(data)
-            #重置密码
-            elif'register_patient' in data:
-                return self.register_patient(data)
-            elif'regiter_doctor' in data:
-                return self.register_doctor(data)
-            elif 'login' in data:
-                return self.login_match(data)
-            #登录检查
-            elif 'reset_patient_information' in data:
-                return self.update_patient_info(data)
-            #重置病人信息
-            elif 'reset_doctor_information' in data:
-                return self.update_doctor_info(data)
-            #重置医生信息
-            elif 'query_doctor_info' in data:
-                return self.query_doctor_info(data)
-            #查询医生信息
-            elif 'query_patient_info' in data:
-                return self.query_patient_info(data)
-            #查询患者信息
-            elif 'sql_query' in data:
-                return self.execute_sql(data)
-            #查询操作
-            elif 'create_appointment' in data:
-                return self.create_appointment(data)
-            #创建预约/挂号
-            elif 'query_appointments' in data:
-                return self.query_appointments(data)
-            #查询预约
-            elif 'cancel_appointment' in data:
-                return self.cancel_appointment(data)
-            #取消预约
-            elif 'update_appointment_status' in data:
-                return self.update_appointment_status(data)
-            #更新预约状态
+            # 显式op字段直接查表，否则按顺序检查识别键
+            op = data.get('op')
+            if isinstance(op, str):
+                handler = dict(operations).get(op)
+                if handler is None:
+                    return f"错误: 未知的操作 {op}"
+                return handler({key: value for key, value in data.items() if key != 'op'})
+            
+            for key, handler in operations:
+                if key in data:
+                    return handler(data)
+            
+            # 默认作为插入数据处理
+            table_name = data.get('table_name', 'default_table')
+            if 'table_name' in data:
+                data_copy = data.copy()
+                del data_copy['table_name']
             else:
-                # 默认作为插入数据处理
-                table_name = data.get('table_name', 'default_table')
-                if 'table_name' in data:
-                    data_copy = data.copy()
-                    del data_copy['table_name']
-                else:
-                    data_copy = data
-                return self.insert_data(data_copy, table_name)
+                data_copy = data
+            return self.insert_data(data_copy, table_name)
                 
         except Exception as e:
             return f"处理JSON数据时出错: {str(e)}"